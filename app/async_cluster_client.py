@@ -0,0 +1,473 @@
+import asyncio
+import functools
+import httpx
+import logging
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Optional, Tuple
+
+from app.bulk import BULK_URL, FALLBACK, UNSUPPORTED_STATUSES, AsyncBatcher, BulkItem, BulkItemResponse, BulkPolicy, \
+    read_bulk_results
+from app.cluster_client import ClusterClient
+from app.coalescing import AsyncKeyedLocks, AsyncSingleFlight
+from app.retry import Deadline
+from app.rollback_journal import PendingRollback
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncClusterClient(ClusterClient):
+    def __init__(self, hosts: List[str], max_concurrency: int = 100, bulk: Optional[BulkPolicy] = None, **kwargs):
+        super().__init__(hosts, **kwargs)
+        self.max_concurrency = max_concurrency
+        # Group requests to the same host are batched into bulk requests.
+        self.bulk = bulk
+        self._batcher = None
+        self._semaphore = None
+        self._rollback_semaphore = None
+        self._in_flight = AsyncSingleFlight()
+        self._group_locks = AsyncKeyedLocks()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._batcher is not None:
+            await self._batcher.close()
+        self.health.stop()
+        # Lets an in-progress rollback drain finish before the journal closes.
+        tasks = [task for _, task in self._rollback_tasks.values()]
+        if tasks:
+            await asyncio.wait(tasks)
+        self.journal.close()
+        if self._owns_pool:
+            await self.pool.aclose()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so the semaphore binds to the running event loop.
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_batcher(self) -> AsyncBatcher:
+        if self._batcher is None:
+            self._batcher = AsyncBatcher(self.bulk, self._send_bulk)
+        return self._batcher
+
+    def _get_rollback_semaphore(self) -> asyncio.Semaphore:
+        if self._rollback_semaphore is None:
+            self._rollback_semaphore = asyncio.Semaphore(
+                self.rollback_parallelism)
+        return self._rollback_semaphore
+
+    async def _fan_out(self, request, hosts: List[str], group_id: str, **kwargs) -> Dict[str, bool]:
+        semaphore = self._get_semaphore()
+
+        async def run(host):
+            async with semaphore:
+                return await request(host=host, group_id=group_id, **kwargs)
+
+        results = await asyncio.gather(*(run(host) for host in hosts))
+        return dict(zip(hosts, results))
+
+    async def _fan_out_staged(self, request, hosts: List[str], group_id: str) -> Dict[str, bool]:
+        # Stops before the next stage once a host has failed.
+        deadline = self._operation_deadline()
+        results = {}
+        for stage in self._host_stages(hosts):
+            results.update(await self._fan_out(request, stage, group_id, deadline=deadline))
+            if not all(results.values()):
+                break
+        return results
+
+    async def _not_ready_async(self, operation: str, group_id: str, hosts: List[str]) -> bool:
+        hosts = self._hosts_to_check(hosts)
+        ready = await asyncio.gather(*(self._check_ready_async(host) for host in hosts))
+        unready = [host for host, ok in zip(hosts, ready) if not ok]
+        return self._report_unready(unready, operation, group_id)
+
+    async def _check_ready_async(self, host: str) -> bool:
+        start = self.clock()
+        try:
+            response = await self.pool.async_client(host).get(
+                self.base_url.format(host), timeout=self.request_timeout)
+            ready = response.status_code < 500
+        except httpx.RequestError:
+            ready = False
+        self.health.observe(host, ready, self.clock() - start)
+        return ready
+
+    async def _mutate(self, operation: str, group_id: str, hosts: List[str],
+                      mutation: Callable[[str, List[str]], Awaitable[bool]]) -> bool:
+        async def serialized():
+            with self.tracer.span(operation, group=group_id, hosts=len(hosts)) as span:
+                async with self._group_locks.hold(group_id):
+                    success = await mutation(group_id, hosts)
+                span.set(success=success)
+                return success
+
+        with self._mutation_keys.key(group_id, (operation, tuple(hosts))) as key:
+            return await self._in_flight.run(key, serialized, on_join=lambda: self.metrics.coalesced.inc(operation))
+
+    async def create_group(self, group_id: str, hosts: Optional[List[str]] = None) -> bool:
+        hosts = self.hosts if hosts is None else hosts
+        return await self._mutate('create', group_id, hosts, self._create_group)
+
+    async def delete_group(self, group_id: str, hosts: Optional[List[str]] = None) -> bool:
+        hosts = self.hosts if hosts is None else hosts
+        return await self._mutate('delete', group_id, hosts, self._delete_group)
+
+    async def get_group_status(self, group_id: str) -> Dict[str, Optional[bool]]:
+        # Each caller gets its own copy of a shared result.
+        return dict(await self._in_flight.run(('status', group_id), lambda: self._get_group_status(group_id),
+                                              on_join=lambda: self.metrics.coalesced.inc('status')))
+
+    async def _create_group(self, group_id: str, hosts: List[str]) -> bool:
+        if self._fail_fast('create', group_id, hosts) or await self._not_ready_async('create', group_id, hosts):
+            return False
+        results = await self._fan_out_staged(self._make_post_request, hosts, group_id)
+        failed_hosts = [host for host, success in results.items() if not success]
+        if failed_hosts:
+            logger.info(
+                "Create group failed on hosts %s. Attempting rollback...", failed_hosts,
+                extra={'hosts': failed_hosts, 'group': group_id})
+            successful_hosts = [
+                host for host, success in results.items() if success]
+            await self._rollback(group_id, 'delete', successful_hosts)
+            return False
+        return True
+
+    async def _delete_group(self, group_id: str, hosts: List[str]) -> bool:
+        if self._fail_fast('delete', group_id, hosts) or await self._not_ready_async('delete', group_id, hosts):
+            return False
+        results = await self._fan_out_staged(self._make_delete_request, hosts, group_id)
+        failed_hosts = [host for host, success in results.items() if not success]
+        if failed_hosts:
+            logger.info(
+                "Delete group failed on hosts %s. Attempting rollback...", failed_hosts,
+                extra={'hosts': failed_hosts, 'group': group_id})
+            successful_hosts = [
+                host for host, success in results.items() if success]
+            await self._rollback(group_id, 'create', successful_hosts)
+            return False
+        return True
+
+    async def _get_group_status(self, group_id: str) -> Dict[str, Optional[bool]]:
+        with self.tracer.span('status', group=group_id, hosts=len(self.hosts)):
+            open_hosts = set(self.health.open_hosts(self.hosts))
+            results = await self._fan_out(self._make_get_request,
+                                          [host for host in self.hosts if host not in open_hosts], group_id,
+                                          deadline=self._operation_deadline())
+            return {host: results.get(host) for host in self.hosts}
+
+    async def stream_group_status(self, group_id: str) -> AsyncIterator[Tuple[str, Optional[bool]]]:
+        # Yields (host, exists) in the order hosts answer. At most
+        # max_concurrency requests are in flight, and the rest are only started
+        # as those finish, so memory does not grow with the number of hosts.
+        # Leaving the loop early cancels the outstanding requests.
+        deadline = self._operation_deadline()
+        open_hosts = set(self.health.open_hosts(self.hosts))
+        for host in self.hosts:
+            if host in open_hosts:
+                yield host, None
+        remaining = iter([host for host in self.hosts if host not in open_hosts])
+        running: Dict[asyncio.Task, str] = {}
+        semaphore = self._get_semaphore()
+
+        async def read(host):
+            async with semaphore:
+                return await self._make_get_request(host=host, group_id=group_id, deadline=deadline)
+
+        def start_next():
+            for host in remaining:
+                task = asyncio.ensure_future(read(host))
+                running[task] = host
+                return
+
+        try:
+            for _ in range(self.max_concurrency):
+                start_next()
+            while running:
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    host = running.pop(task)
+                    start_next()
+                    yield host, task.result()
+        finally:
+            for task in running:
+                task.cancel()
+
+    async def continue_rollbacks(self) -> bool:
+        results = await asyncio.gather(*(task for _, task in self.start_rollback_drain()))
+        return all(results)
+
+    def start_rollback_drain(self) -> List[Tuple[str, asyncio.Future]]:
+        # Must be called from the event loop; returns without waiting.
+        tasks = list(self._rollback_tasks.values())
+        for entry in self.journal.pending():
+            tasks.extend(self._schedule_rollback(entry))
+        return tasks
+
+    async def wait_for_rollbacks(self, group_id: str) -> bool:
+        tasks = [task for task_group, task in self._rollback_tasks.values()
+                 if task_group == group_id]
+        if tasks:
+            await asyncio.wait(tasks)
+        return not any(entry.group_id == group_id for entry in self.journal.pending())
+
+    async def _rollback(self, group_id: str, operation: str, hosts_to_rollback: List[str]) -> bool:
+        if not hosts_to_rollback:
+            return self._rollback_finished(None, True)
+        with self.tracer.span('rollback', group=group_id, operation=operation, hosts=len(hosts_to_rollback)) as span:
+            # The journal fsyncs, so keep it off the event loop.
+            with self.tracer.span('journal_add'):
+                entry_id = await asyncio.get_event_loop().run_in_executor(
+                    None, self.journal.add, group_id, operation, hosts_to_rollback)
+            entry = PendingRollback(entry_id, group_id, operation, list(hosts_to_rollback))
+            results = await asyncio.gather(*(task for _, task in self._schedule_rollback(entry)))
+            return self._rollback_finished(span, all(results))
+
+    def _schedule_rollback(self, entry: PendingRollback) -> List[Tuple[str, asyncio.Future]]:
+        scheduled = []
+        for host in entry.hosts:
+            key = (entry.entry_id, host)
+            if key in self._rollback_tasks:
+                continue
+            task = (entry.group_id, asyncio.ensure_future(
+                self._replay_rollback_host(entry, host)))
+            self._rollback_tasks[key] = task
+            task[1].add_done_callback(
+                functools.partial(self._forget_rollback_task, key))
+            scheduled.append(task)
+        return scheduled
+
+    async def _replay_rollback_host(self, entry: PendingRollback, host: str) -> bool:
+        self.metrics.rollbacks.inc(entry.operation)
+        with self.tracer.span('rollback_host', host=host, group=entry.group_id, operation=entry.operation) as span:
+            async with self._get_rollback_semaphore():
+                success = await self._rollback_request(entry.operation, host, entry.group_id)
+            if success:
+                # Recorded right away so a later replay only resends what is left.
+                with self.tracer.span('journal_mark_done'):
+                    await asyncio.get_event_loop().run_in_executor(
+                        None, self.journal.mark_done, entry.entry_id, host)
+                return True
+            span.fail('rollback request failed')
+        return self._rollback_host_failed(entry, host)
+
+    async def _rollback_request(self, operation: str, host: str, group_id: str) -> bool:
+        request = self._rollback_method(operation)
+        return request is not None and await request(host=host, group_id=group_id)
+
+    async def _make_post_request(self, host: str, group_id: str, deadline: Optional[Deadline] = None) -> bool:
+        url = self.base_url.format(host)
+        data = {"groupId": group_id}
+        response = await self._send_batched('POST', host, group_id, lambda: self._send(
+            'create', host, lambda client, timeout: client.post(url, json=data, timeout=timeout),
+            deadline=deadline, final_statuses=(400,)), deadline=deadline, final_statuses=(400,))
+        if response is None:
+            self._update_status_cache(host, group_id, None)
+            return False
+        self._update_status_cache(host, group_id, True)
+        if response.status_code == 400:
+            logger.info(
+                "Group already exist on host %s. Moving on to next host...", host,
+                extra={'host': host, 'group': group_id})
+        return True
+
+    async def _make_delete_request(self, host: str, group_id: str, deadline: Optional[Deadline] = None) -> bool:
+        url = self.base_url.format(host)
+        data = {"groupId": group_id}
+        response = await self._send_batched('DELETE', host, group_id, lambda: self._send(
+            'delete', host, lambda client, timeout: client.request("DELETE", url, json=data, timeout=timeout),
+            deadline=deadline, retry_on=(Exception,)), deadline=deadline)
+        self._update_status_cache(
+            host, group_id, False if response is not None else None)
+        return response is not None
+
+    async def _make_get_request(self, host: str, group_id: str, deadline: Optional[Deadline] = None) -> bool:
+        cached, headers = self._cached_status(host, group_id)
+        if cached is not None:
+            return cached
+
+        url = f"{self.base_url.format(host)}/{group_id}"
+
+        async def read(headers):
+            return await self._send_hedged(host, lambda: self._send('Get', host, lambda client, timeout: client.get(
+                url, headers=headers, timeout=timeout), deadline=deadline, final_statuses=(404, 304)))
+
+        # Revalidating a cached status needs its ETag, which bulk reads do not carry.
+        if headers is None:
+            response = await self._send_batched('GET', host, group_id, lambda: read(None), deadline=deadline,
+                                              final_statuses=(404,))
+        else:
+            response = await read(headers)
+        exists = self._read_status_response(host, group_id, response)
+        if exists is None and headers is not None:
+            exists = self._read_status_response(host, group_id, await read(None))
+        return bool(exists)
+
+    async def _send_batched(self, method: str, host: str, group_id: str,
+                            send_single: Callable[[], Awaitable[Optional[httpx.Response]]],
+                            deadline: Optional[Deadline] = None, final_statuses: Tuple[int, ...] = ()):
+        # Queues the request for the host's next bulk request when bulk is
+        # enabled for it. Items the bulk request could not settle, or answered
+        # with a status the single request would retry, are sent on their own.
+        if self.bulk is None or not self.bulk.enabled(host):
+            return await send_single()
+        response = await self._get_batcher().submit(host, method, group_id, deadline)
+        if response is None or (response is not FALLBACK and (
+                response.status_code < 400 or response.status_code in final_statuses)):
+            self.metrics.bulk_items.inc(host, 'batched')
+            return response
+        self.metrics.bulk_items.inc(host, 'fallback')
+        return await send_single()
+
+    async def _send_bulk(self, host: str, batch: List[BulkItem]):
+        # One request for the whole batch, with the usual retries, circuit
+        # breaker and limits. A host without the endpoint is switched to
+        # single requests and the batch falls back to them. Items whose
+        # deadline passed while queued get no response, as a single request
+        # would, and the rest are sent within the earliest of their deadlines.
+        for item in batch:
+            if item.deadline is not None and item.deadline.expired():
+                item.future.set_result(None)
+        batch = [item for item in batch if not item.future.done()]
+        if not batch:
+            return
+        deadlines = [item.deadline for item in batch if item.deadline is not None]
+        deadline = min(deadlines, key=lambda item_deadline: item_deadline.expires_at) if deadlines else None
+        url = BULK_URL.format(host)
+        operations = [{'method': item.method, 'groupId': item.group_id} for item in batch]
+        data = {'operations': operations}
+        response = await self._send('bulk', host, lambda client, timeout: client.post(
+            url, json=data, timeout=timeout), deadline=deadline, final_statuses=UNSUPPORTED_STATUSES)
+        if response is None:
+            results = [None] * len(batch)
+        elif response.status_code in UNSUPPORTED_STATUSES:
+            logger.info("Host %s has no bulk endpoint. Sending single requests to it", host, extra={'host': host})
+            self.bulk.disable(host)
+            results = [FALLBACK] * len(batch)
+        else:
+            try:
+                statuses = read_bulk_results(response.json(), operations)
+            except ValueError:
+                statuses = None
+            if statuses is None:
+                logger.warning("Unreadable bulk response from host %s. Sending single requests", host,
+                               extra={'host': host})
+                statuses = [FALLBACK] * len(batch)
+            results = [status if status is FALLBACK else BulkItemResponse(status) for status in statuses]
+        for item, result in zip(batch, results):
+            if not item.future.done():
+                item.future.set_result(result)
+
+    async def _timed_read(self, host: str, read: Callable[[], Awaitable[Optional[httpx.Response]]]) -> Optional[httpx.Response]:
+        start = self.clock()
+        response = await read()
+        if response is not None:
+            self.hedging.record(host, self.clock() - start)
+        return response
+
+    async def _send_hedged(self, host: str, read: Callable[[], Awaitable[Optional[httpx.Response]]]) -> Optional[httpx.Response]:
+        # Unlike the sync client, the slower read is cancelled once one answers.
+        if self.hedging is None:
+            return await read()
+        delay = self.hedging.delay(host)
+        if delay is None:
+            return await self._timed_read(host, read)
+        primary = asyncio.ensure_future(self._timed_read(host, read))
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self.hedging.try_start():
+            return await primary
+        logger.info("Status read from host %s is slower than %.3fs. Sending a hedged request", host, delay,
+                    extra={'host': host})
+        self.metrics.hedges.inc(host)
+        hedge = asyncio.ensure_future(self._timed_read(host, read))
+        hedge.add_done_callback(self.hedging.finish)
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.result() is not None:
+                        return task.result()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _send(self, action: str, host: str, send: Callable[[httpx.AsyncClient, float], Awaitable[httpx.Response]],
+                    deadline: Optional[Deadline] = None, final_statuses: Tuple[int, ...] = (),
+                    retry_on: Tuple[type, ...] = (httpx.RequestError,)) -> Optional[httpx.Response]:
+        with self.tracer.span('request', host=host, action=action.lower()) as span:
+            response = await self._send_with_retries(action, host, send, deadline, final_statuses, retry_on)
+            if response is None:
+                span.fail('no response')
+            else:
+                span.set(status_code=response.status_code)
+            return response
+
+    async def _send_with_retries(self, action: str, host: str,
+                                 send: Callable[[httpx.AsyncClient, float], Awaitable[httpx.Response]],
+                                 deadline: Optional[Deadline], final_statuses: Tuple[int, ...],
+                                 retry_on: Tuple[type, ...]) -> Optional[httpx.Response]:
+        # ClusterClient._send_with_retries with awaits; the decisions are the
+        # same shared helpers.
+        self.retry_policy.record_request()
+        operation = action.lower()
+        limiter = self.limits.limiter(host)
+        attempt = 0
+        while True:
+            if not self._may_send(action, host, deadline):
+                return None
+            with self.tracer.span('limit_wait'):
+                try:
+                    acquired = await limiter.limit.acquire_async(None if deadline is None else deadline.remaining())
+                except asyncio.CancelledError:
+                    self.health.release_trial(host)
+                    raise
+                wait = self._reserve_token(limiter, acquired, deadline)
+                if wait:
+                    try:
+                        await self._async_sleep(wait)
+                    except asyncio.CancelledError:
+                        limiter.refund()
+                        limiter.limit.cancel()
+                        self.health.release_trial(host)
+                        raise
+            if wait is None:
+                self._skip_unsent(action, host)
+                return None
+            timeout = self.request_timeout if deadline is None else deadline.cap(self.request_timeout)
+            start = self._begin_attempt(host, operation)
+            succeeded = False
+            with self.tracer.span('attempt', attempt=attempt + 1) as span:
+                try:
+                    response, succeeded = self._read_attempt(
+                        host, operation, await send(self.pool.async_client(host), timeout), final_statuses, span)
+                    if response is not None:
+                        return response
+                except retry_on as e:
+                    self._record_request_error(host, operation, e, span)
+                except asyncio.CancelledError:
+                    # A hedged read that lost the race; the host did nothing
+                    # wrong, and a half-open trial goes to the next request.
+                    succeeded = True
+                    self.health.release_trial(host)
+                    raise
+                finally:
+                    self._end_attempt(limiter, host, operation, start, succeeded)
+            attempt += 1
+            delay = self._retry_delay(action, host, operation, attempt, deadline)
+            if delay is None:
+                return None
+            with self.tracer.span('backoff', delay=delay):
+                await self._async_sleep(delay)
+
+    async def _async_sleep(self, delay: float):
+        if self.simulation is not None:
+            await self.simulation.clock.async_sleep(delay)
+        else:
+            await asyncio.sleep(delay)
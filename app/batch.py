@@ -0,0 +1,122 @@
+import asyncio
+import functools
+import json
+import sys
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, TextIO
+
+from app.async_cluster_client import AsyncClusterClient
+
+logger = logging.getLogger(__name__)
+
+BATCH_OPERATIONS = ('create', 'delete', 'status')
+
+
+def read_batch_file(file_path) -> Iterator[Dict]:
+    with open(file_path, 'r') as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield {'line': line_number, 'error': f"Invalid JSON: {e}"}
+                continue
+            if not isinstance(record, dict):
+                yield {'line': line_number, 'error': "Record must be a JSON object"}
+                continue
+            record['line'] = line_number
+            yield record
+
+
+async def _run_record(client: AsyncClusterClient, record: Dict) -> Dict:
+    result = {'line': record['line']}
+    if 'error' in record:
+        result.update(success=False, error=record['error'])
+        return result
+
+    operation = record.get('operation')
+    group_name = record.get('group_name')
+    result.update(operation=operation, group_name=group_name)
+    if operation not in BATCH_OPERATIONS:
+        result.update(success=False,
+                      error=f"Unsupported operation: {operation}")
+        return result
+    if not group_name:
+        result.update(success=False, error="group_name is required")
+        return result
+
+    try:
+        # Rollbacks that failed earlier are retried before the group is touched.
+        if operation in ('create', 'delete'):
+            client.start_rollback_drain()
+        if operation in ('create', 'delete') and not await client.wait_for_rollbacks(group_name):
+            result.update(success=False,
+                          error="Pending rollbacks for this group failed")
+        elif operation == 'create':
+            result['success'] = await client.create_group(group_name)
+        elif operation == 'delete':
+            result['success'] = await client.delete_group(group_name)
+        else:
+            status = await client.get_group_status(group_name)
+            result.update(success=bool(status), status=status)
+    except Exception as e:
+        logger.error("Batch record on line %s failed: %s", record['line'], e)
+        result.update(success=False, error=str(e))
+    return result
+
+
+async def run_batch(client: AsyncClusterClient, records: Iterable[Dict], output: TextIO = sys.stdout, max_in_flight: int = 100,
+                    run_record: Callable[[AsyncClusterClient, Dict], Awaitable[Dict]] = _run_record) -> Dict[str, int]:
+    summary = {'total': 0, 'succeeded': 0, 'failed': 0}
+    pending = set()
+    # Last in-flight task per group, so records for the same group keep file order.
+    group_tails = {}
+
+    def report(task):
+        result = task.result()
+        summary['total'] += 1
+        summary['succeeded' if result.get('success') else 'failed'] += 1
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+
+    def forget_tail(group_name, task):
+        if group_tails.get(group_name) is task:
+            del group_tails[group_name]
+
+    async def run_after(previous, record):
+        if previous is not None:
+            await asyncio.wait([previous])
+        return await run_record(client, record)
+
+    for record in records:
+        if len(pending) >= max_in_flight:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                report(task)
+
+        group_name = record.get('group_name')
+        previous = group_tails.get(group_name)
+        if previous is not None and previous.done():
+            previous = None
+        task = asyncio.ensure_future(run_after(previous, record))
+        if group_name is not None:
+            group_tails[group_name] = task
+            task.add_done_callback(functools.partial(forget_tail, group_name))
+        pending.add(task)
+
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            report(task)
+
+    return summary
+
+
+async def run_batch_file(client: AsyncClusterClient, file_path, output: TextIO = sys.stdout, max_in_flight: int = 100) -> Dict[str, int]:
+    async with client:
+        # Pending rollbacks drain in the background; only records for the
+        # same group wait for them.
+        client.start_rollback_drain()
+        return await run_batch(client, read_batch_file(file_path), output=output, max_in_flight=max_in_flight)
@@ -0,0 +1,153 @@
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Union
+
+from app.async_cluster_client import AsyncClusterClient
+from app.fake_server import FakeCluster
+from app.simulation import SimulatedCluster
+from app.structured_logging import configure_logging
+
+logger = logging.getLogger(__name__)
+
+PHASES = ('create', 'status', 'delete')
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def _run_phase(client: AsyncClusterClient, phase: str, group_ids: List[str], concurrency: int,
+                     clock: Callable[[], float]) -> Dict:
+    operation = {'create': client.create_group, 'delete': client.delete_group,
+                 'status': client.get_group_status}[phase]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    failures = 0
+
+    async def run(group_id):
+        nonlocal failures
+        async with semaphore:
+            start = clock()
+            result = await operation(group_id)
+            latencies.append(clock() - start)
+            if not result or (phase == 'status' and not all(result.values())):
+                failures += 1
+
+    start = clock()
+    await asyncio.gather(*(run(group_id) for group_id in group_ids))
+    elapsed = clock() - start
+    return {'operations': len(group_ids), 'failures': failures,
+            'seconds': round(elapsed, 4),
+            'ops_per_sec': round(len(group_ids) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3)}
+
+
+async def run_benchmark(hosts: List[str], cluster: Union[FakeCluster, SimulatedCluster] = None, groups: int = 100,
+                        concurrency: int = 50, rollback_file: Optional[str] = None, **client_options) -> Dict:
+    # Against a SimulatedCluster, timings are in the cluster's virtual time.
+    # Without a rollback_file the journal lives in a temporary directory.
+    if rollback_file is None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            return await run_benchmark(hosts, cluster, groups, concurrency,
+                                       os.path.join(tmp_dir, 'rollback.journal'), **client_options)
+    if isinstance(cluster, SimulatedCluster):
+        client_options.setdefault('simulation', cluster)
+        clock = cluster.clock
+    else:
+        clock = time.perf_counter
+    client_options.setdefault('max_connections', concurrency)
+    client = AsyncClusterClient(hosts, max_concurrency=max(concurrency * len(hosts), 1),
+                                rollback_file=rollback_file, **client_options)
+    group_ids = [f"bench-group-{index}" for index in range(groups)]
+    report = {}
+    async with client:
+        for phase in PHASES + ('rollback',):
+            before = cluster.request_counts() if cluster is not None else None
+            if phase == 'rollback':
+                start = clock()
+                pending = len(client.journal.pending())
+                succeeded = await client.continue_rollbacks()
+                report[phase] = {'pending': pending, 'succeeded': succeeded,
+                                 'seconds': round(clock() - start, 4)}
+            else:
+                report[phase] = await _run_phase(client, phase, group_ids, concurrency, clock)
+            if cluster is not None:
+                requests = cluster.request_counts() - before
+                report[phase]['requests'] = dict(requests)
+                if phase != 'rollback':
+                    # Everything beyond one request per host for each operation
+                    # that succeeded: retries, readiness probes, writes to
+                    # operations that failed and their rollbacks.
+                    succeeded = report[phase]['operations'] - report[phase]['failures']
+                    report[phase]['wasted_requests'] = sum(requests.values()) - succeeded * len(hosts)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark ClusterClient against local fake cluster nodes.")
+    parser.add_argument('--nodes', type=int, default=3,
+                        help="Number of fake nodes (default: 3)")
+    parser.add_argument('--groups', type=int, default=200,
+                        help="Groups created, checked and deleted (default: 200)")
+    parser.add_argument('--concurrency', type=int, default=50,
+                        help="Operations in flight at the same time (default: 50)")
+    parser.add_argument('--latency', type=str, default='exp:0.002',
+                        help="Node latency: fixed:S, uniform:MIN,MAX or exp:MEAN in seconds (default: exp:0.002)")
+    parser.add_argument('--error_rate', type=float, default=0.0,
+                        help="Fraction of requests answered with 500 (default: 0)")
+    parser.add_argument('--timeout_rate', type=float, default=0.0,
+                        help="Fraction of requests that hang past the client timeout (default: 0)")
+    parser.add_argument('--exists_rate', type=float, default=0.0,
+                        help="Fraction of creates answered with 400 already exists (default: 0)")
+    parser.add_argument('--max_retries', type=int, default=3,
+                        help="Maximum attempts per request (default: 3)")
+    parser.add_argument('--retry_timeout', type=float, default=0.01,
+                        help="Base retry backoff in seconds (default: 0.01)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed for the fake nodes (default: 0)")
+    parser.add_argument('--flaky_nodes', type=int, default=0,
+                        help="Number of nodes, at the end of the host list, that fail more often (default: 0)")
+    parser.add_argument('--flaky_error_rate', type=float, default=0.5,
+                        help="Error rate of the flaky nodes (default: 0.5)")
+    parser.add_argument('--host_ordering', choices=['static', 'risk'], default='static',
+                        help="Order writes by host list or riskiest host first (default: static)")
+    parser.add_argument('--readiness_check', action='store_true',
+                        help="Probe failing hosts before each create or delete")
+    parser.add_argument('--simulate', action='store_true',
+                        help="Model the nodes in-process on a virtual clock instead of serving them over HTTP")
+    args = parser.parse_args()
+    configure_logging(level=logging.WARNING)
+
+    options = dict(latency=args.latency, timeout_rate=args.timeout_rate, exists_rate=args.exists_rate)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        benchmark_options = dict(groups=args.groups, concurrency=args.concurrency,
+                                 rollback_file=os.path.join(tmp_dir, 'rollback.journal'),
+                                 max_retries=args.max_retries, retry_timeout=args.retry_timeout,
+                                 host_ordering=args.host_ordering, readiness_check=args.readiness_check)
+        flaky = range(args.nodes - args.flaky_nodes, args.nodes)
+        if args.simulate:
+            hosts = [f"node-{index}:8080" for index in range(args.nodes)]
+            cluster = SimulatedCluster(seed=args.seed, failure_rate=args.error_rate, host_models={
+                hosts[index]: dict(options, failure_rate=args.flaky_error_rate) for index in flaky}, **options)
+            report = cluster.run(run_benchmark(hosts, cluster=cluster, **benchmark_options))
+        else:
+            overrides = {index: {'error_rate': args.flaky_error_rate} for index in flaky}
+            with FakeCluster(nodes=args.nodes, seed=args.seed, error_rate=args.error_rate,
+                             node_overrides=overrides, **options) as cluster:
+                report = asyncio.run(run_benchmark(cluster.hosts, cluster=cluster, **benchmark_options))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+from app.retry import Deadline
+
+BULK_URL = "http://{}/v1/groups/bulk"
+# Answers from a node that has no bulk endpoint.
+UNSUPPORTED_STATUSES = (404, 405, 501)
+# Resolved for an item the bulk request could not settle, which the caller
+# then sends as a single request.
+FALLBACK = object()
+
+
+class BulkItemResponse:
+    # One item's answer from a bulk response. It carries what the single
+    # request paths read, so each group's outcome, status cache update and
+    # rollback are decided exactly as for a single request.
+    __slots__ = ('status_code', 'headers')
+
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.headers: Dict[str, str] = {}
+
+
+class BulkItem(NamedTuple):
+    method: str
+    group_id: str
+    deadline: Optional[Deadline]
+    future: asyncio.Future
+
+
+class BulkPolicy:
+    # Which hosts get batched requests and how large batches grow. With
+    # `hosts` set only those are batched; otherwise every host is tried and
+    # one answering UNSUPPORTED_STATUSES is sent single requests from then on.
+    # A batch is sent once it has max_batch items or its oldest item has
+    # waited max_delay seconds.
+    def __init__(self, max_batch: int = 100, max_delay: float = 0.005, hosts: Optional[Iterable[str]] = None):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.configured = None if hosts is None else set(hosts)
+        self._unsupported = set()
+        self._lock = threading.Lock()
+
+    def enabled(self, host: str) -> bool:
+        if self.configured is not None and host not in self.configured:
+            return False
+        return host not in self._unsupported
+
+    def disable(self, host: str):
+        with self._lock:
+            self._unsupported.add(host)
+
+    def unsupported(self) -> List[str]:
+        with self._lock:
+            return sorted(self._unsupported)
+
+
+def read_bulk_results(body, operations: List[Dict]) -> Optional[List[int]]:
+    # The per-item status codes, or None when the body does not answer every
+    # operation in order.
+    results = body.get('results') if isinstance(body, dict) else None
+    if not isinstance(results, list) or len(results) != len(operations):
+        return None
+    statuses = []
+    for operation, result in zip(operations, results):
+        if not isinstance(result, dict) or result.get('groupId') != operation['groupId'] \
+                or not isinstance(result.get('status'), int):
+            return None
+        statuses.append(result['status'])
+    return statuses
+
+
+class AsyncBatcher:
+    # Collects items per host and hands each full or expired batch to
+    # send_batch, which resolves the items' futures. Must be used from a
+    # single event loop.
+    def __init__(self, policy: BulkPolicy, send_batch: Callable[[str, List[BulkItem]], Awaitable[None]]):
+        self.policy = policy
+        self._send_batch = send_batch
+        self._pending: Dict[str, List[BulkItem]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._tasks = set()
+
+    def submit(self, host: str, method: str, group_id: str, deadline: Optional[Deadline] = None) -> asyncio.Future:
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        batch = self._pending.setdefault(host, [])
+        batch.append(BulkItem(method, group_id, deadline, future))
+        if len(batch) >= self.policy.max_batch:
+            self.flush(host)
+        elif len(batch) == 1:
+            self._timers[host] = loop.call_later(self.policy.max_delay, self.flush, host)
+        return future
+
+    def flush(self, host: str):
+        timer = self._timers.pop(host, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(host, None)
+        if not batch:
+            return
+        task = asyncio.ensure_future(self._run(host, batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, host: str, batch: List[BulkItem]):
+        try:
+            await self._send_batch(host, batch)
+        except Exception as e:
+            # Every caller still waiting sees the failure; the task itself
+            # has nobody to report it to.
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_exception(e)
+        finally:
+            # Anything send_batch left unresolved goes out on its own.
+            for item in batch:
+                if not item.future.done():
+                    item.future.set_result(FALLBACK)
+
+    async def close(self):
+        for host in list(self._pending):
+            self.flush(host)
+        if self._tasks:
+            await asyncio.wait(list(self._tasks))
@@ -1,173 +1,632 @@
 import httpx
-import random
+import contextvars
+import functools
+import threading
 import time
-import os
 import logging
-from typing import List, Dict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Iterator, List, Dict, Optional, Tuple
+
+from app.coalescing import KeyedLocks, SequencedKeys, SingleFlight
+from app.connection_pool import ConnectionPool
+from app.dns_cache import DnsCache
+from app.health import HostHealth
+from app.hedging import HedgePolicy
+from app.limiter import HostLimiter, HostLimits
+from app.metrics import ClientMetrics
+from app.retry import Deadline, RetryBudget, RetryPolicy
+from app.rollback_journal import PendingRollback, RollbackJournal
+from app.simulation import SimulatedCluster
+from app.status_cache import StatusCache
+from app.tracing import NullTracer, Tracer
 
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
 class ClusterClient:
-    def __init__(self, hosts: List[str], simulate: bool = False, retry_timeout: int = 1, max_retries: int = 3, rollback_file: str = 'rollback.txt'):
+    def __init__(self, hosts: List[str], simulate: bool = False, retry_timeout: int = 1, max_retries: int = 3, rollback_file: str = 'rollback.journal', rollback_parallelism: int = 10,
+                 pool: Optional[ConnectionPool] = None, max_connections: int = 10, keepalive_expiry: float = 5.0, http2: bool = False,
+                 health: Optional[HostHealth] = None, retry_policy: Optional[RetryPolicy] = None, operation_timeout: Optional[float] = None,
+                 status_cache: Optional[StatusCache] = None, simulation: Optional[SimulatedCluster] = None,
+                 metrics: Optional[ClientMetrics] = None, limits: Optional[HostLimits] = None,
+                 host_ordering: str = 'static', readiness_check: bool = False, risk_threshold: float = 0.05,
+                 hedging: Optional[HedgePolicy] = None, tracer: Optional[Tracer] = None,
+                 dns_cache: Optional[DnsCache] = None):
         self.hosts = hosts
         self.base_url = "http://{}/v1/group/"
         self.retry_timeout = retry_timeout
-        self.simulate = simulate
+        # Simulated clusters answer in-process on a virtual clock instead of
+        # going over the network.
+        if simulate and simulation is None:
+            simulation = SimulatedCluster()
+        self.simulation = simulation
+        self.simulate = simulation is not None
+        self.clock = simulation.clock if simulation is not None else time.monotonic
         self.max_retries = max_retries
+        self.retry_policy = retry_policy or RetryPolicy(
+            max_attempts=max_retries, base_delay=retry_timeout, budget=RetryBudget(clock=self.clock),
+            rng=simulation.rng() if simulation is not None else None)
+        self.operation_timeout = operation_timeout
+        # 'risk' writes to the hosts most likely to fail first, so a failed
+        # create or delete has as little as possible to roll back.
+        self.host_ordering = host_ordering
+        self.readiness_check = readiness_check
+        self.risk_threshold = risk_threshold
+        self.status_cache = status_cache
         self.rollback_file = rollback_file
+        self.journal = RollbackJournal(rollback_file)
+        self.metrics = metrics or ClientMetrics()
+        self.metrics.pending_rollbacks.function = lambda: len(self.journal.pending())
+        self.tracer = tracer or NullTracer()
+        self.rollback_parallelism = rollback_parallelism
+        self._rollback_executor = None
+        self._rollback_tasks: Dict[Tuple[int, str], Tuple[str, Future]] = {}
+        self._rollback_lock = threading.RLock()
+        # Identical concurrent operations share one fan-out, and mutations of
+        # the same group run one at a time so rollbacks cannot interleave.
+        self._in_flight = SingleFlight()
+        self._group_locks = KeyedLocks()
+        self._mutation_keys = SequencedKeys()
         self.request_timeout = 1
+        self.hedging = hedging
+        self.max_connections = max_connections
+        self._hedge_executors: Dict[str, ThreadPoolExecutor] = {}
+        self._hedge_lock = threading.Lock()
+        # A pool passed in by the caller is shared and stays open on close().
+        self._owns_pool = pool is None
+        if simulation is not None:
+            pool = pool or simulation
+        self.pool = pool or ConnectionPool(max_connections=max_connections,
+                                           max_keepalive_connections=max_connections,
+                                           keepalive_expiry=keepalive_expiry,
+                                           http2=http2, timeout=self.request_timeout, dns_cache=dns_cache)
+        # Starts at the pool's connection limit and only backs off below it
+        # while a host is failing or slowing down.
+        self.limits = limits or HostLimits(initial_limit=max_connections, max_limit=max_connections,
+                                           clock=self.clock)
+        self.health = health or HostHealth(clock=self.clock)
+        # Simulated hosts recover through half-open trial requests; a probe
+        # thread would run on real time.
+        if self.health.probe is None and simulation is None:
+            self.health.probe = self._probe_host
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        # Lets an in-progress rollback drain finish before the journal closes.
+        if self._rollback_executor is not None:
+            self._rollback_executor.shutdown(wait=True)
+            self._rollback_executor = None
+        with self._hedge_lock:
+            hedge_executors, self._hedge_executors = list(self._hedge_executors.values()), {}
+        for executor in hedge_executors:
+            executor.shutdown(wait=True)
+        self.health.stop()
+        self.journal.close()
+        if self._owns_pool:
+            self.pool.close()
+
+    def _fail_fast(self, operation: str, group_id: str, hosts: List[str]) -> bool:
+        # Refusing up front is cheaper than failing halfway and rolling back.
+        open_hosts = self.health.open_hosts(hosts)
+        if open_hosts:
+            logger.info(
+                "Circuit breaker is open for hosts %s. Not attempting to %s group %s", open_hosts, operation, group_id,
+                extra={'hosts': open_hosts, 'operation': operation, 'group': group_id})
+            return True
+        return False
+
+    def _ordered_hosts(self, hosts: List[str]) -> List[str]:
+        if self.host_ordering == 'risk':
+            return self.health.order_by_risk(hosts)
+        return hosts
+
+    def _host_stages(self, hosts: List[str]) -> List[List[str]]:
+        # Concurrent writes go to the risky hosts first and only then to the rest.
+        if self.host_ordering != 'risk':
+            return [hosts]
+        risky = self.health.risky_hosts(hosts, self.risk_threshold)
+        if not risky or len(risky) == len(hosts):
+            return [hosts]
+        return [risky, [host for host in hosts if host not in risky]]
+
+    def _hosts_to_check(self, hosts: List[str]) -> List[str]:
+        # The readiness phase only probes hosts that have been failing.
+        if not self.readiness_check:
+            return []
+        return self.health.risky_hosts(hosts, self.risk_threshold)
+
+    def _not_ready(self, operation: str, group_id: str, hosts: List[str]) -> bool:
+        unready = [host for host in self._hosts_to_check(hosts) if not self._check_ready(host)]
+        return self._report_unready(unready, operation, group_id)
+
+    def _check_ready(self, host: str) -> bool:
+        start = self.clock()
+        ready = self._probe_host(host)
+        self.health.observe(host, ready, self.clock() - start)
+        return ready
+
+    def _report_unready(self, unready: List[str], operation: str, group_id: str) -> bool:
+        if unready:
+            logger.info(
+                "Hosts %s failed the readiness check. Not attempting to %s group %s", unready, operation, group_id,
+                extra={'hosts': unready, 'operation': operation, 'group': group_id})
+            return True
+        return False
+
+    def _operation_deadline(self) -> Optional[Deadline]:
+        if self.operation_timeout is None:
+            return None
+        return Deadline(self.operation_timeout, clock=self.clock)
+
+    def _mutate(self, operation: str, group_id: str, hosts: List[str],
+                mutation: Callable[[str, List[str]], bool]) -> bool:
+        def serialized():
+            with self.tracer.span(operation, group=group_id, hosts=len(hosts)) as span:
+                with self._group_locks.hold(group_id):
+                    success = mutation(group_id, hosts)
+                span.set(success=success)
+                return success
+
+        with self._mutation_keys.key(group_id, (operation, tuple(hosts))) as key:
+            return self._in_flight.run(key, serialized, on_join=lambda: self.metrics.coalesced.inc(operation))
+
+    def create_group(self, group_id: str, hosts: Optional[List[str]] = None) -> bool:
+        # hosts narrows the operation to some of the cluster's hosts.
+        hosts = self.hosts if hosts is None else hosts
+        return self._mutate('create', group_id, hosts, self._create_group)
+
+    def delete_group(self, group_id: str, hosts: Optional[List[str]] = None) -> bool:
+        hosts = self.hosts if hosts is None else hosts
+        return self._mutate('delete', group_id, hosts, self._delete_group)
 
-    def create_group(self, group_id: str) -> bool:
+    def get_group_status(self, group_id: str) -> Dict[str, Optional[bool]]:
+        # Each caller gets its own copy of a shared result.
+        return dict(self._in_flight.run(('status', group_id), lambda: self._get_group_status(group_id),
+                                        on_join=lambda: self.metrics.coalesced.inc('status')))
+
+    def _get_group_status(self, group_id: str) -> Dict[str, Optional[bool]]:
+        with self.tracer.span('status', group=group_id, hosts=len(self.hosts)):
+            return dict(self.iter_group_status(group_id))
+
+    def _create_group(self, group_id: str, hosts: List[str]) -> bool:
+        if self._fail_fast('create', group_id, hosts) or self._not_ready('create', group_id, hosts):
+            return False
+        deadline = self._operation_deadline()
         successful_hosts = []
-        for host in self.hosts:
-            if self._make_post_request(host=host, group_id=group_id):
+        for host in self._ordered_hosts(hosts):
+            if self._make_post_request(host=host, group_id=group_id, deadline=deadline):
                 successful_hosts.append(host)
             else:
                 logger.info(
-                    f"Create group failed on host {host}. Attempting rollback...")
+                    "Create group failed on host %s. Attempting rollback...", host,
+                    extra={'host': host, 'group': group_id})
                 self._rollback(group_id, 'delete', successful_hosts)
                 return False
 
         return True
 
-    def delete_group(self, group_id: str) -> bool:
+    def _delete_group(self, group_id: str, hosts: List[str]) -> bool:
+        if self._fail_fast('delete', group_id, hosts) or self._not_ready('delete', group_id, hosts):
+            return False
+        deadline = self._operation_deadline()
         successful_hosts = []
-        for host in self.hosts:
+        for host in self._ordered_hosts(hosts):
             success = self._make_delete_request(
-                host=host, group_id=group_id)
+                host=host, group_id=group_id, deadline=deadline)
             if success:
                 successful_hosts.append(host)
             else:
                 logger.info(
-                    f"Delete group failed on host {host}. Attempting rollback...")
+                    "Delete group failed on host %s. Attempting rollback...", host,
+                    extra={'host': host, 'group': group_id})
                 self._rollback(group_id, 'create', successful_hosts)
                 return False
         return True
 
-    def get_group_status(self, group_id: str) -> Dict[str, bool]:
-        status = {}
+    def iter_group_status(self, group_id: str) -> Iterator[Tuple[str, Optional[bool]]]:
+        # Yields (host, exists) as each host answers. Hosts after the point
+        # where the caller stops iterating are not queried.
+        deadline = self._operation_deadline()
         for host in self.hosts:
-            success = self._make_get_request(host, group_id)
-            status[host] = success
-        return status
+            if self.health.is_open(host):
+                # Unknown rather than waiting on a host that is known to be down.
+                yield host, None
+                continue
+            yield host, self._make_get_request(host, group_id, deadline=deadline)
+
+    def has_pending_rollbacks(self) -> bool:
+        return self.journal.has_pending()
 
     def continue_rollbacks(self) -> bool:
-        if os.path.exists(self.rollback_file):
-            try:
-                with open(self.rollback_file, 'r') as file:
-                    operation = file.readline().strip()
-                    group_id = file.readline().strip()
-                    hosts = [line.strip() for line in file]
-            except IOError as e:
-                logger.error(f"Error reading rollback file: {e}")
-                return False
-            os.remove(self.rollback_file)
-            return self._rollback(group_id, operation, hosts)
+        futures = [future for _, future in self.start_rollback_drain()]
+        return all(future.result() for future in futures)
+
+    def start_rollback_drain(self) -> List[Tuple[str, Future]]:
+        # Schedules every outstanding (entry, host) rollback that is not already
+        # running, without waiting for any of them.
+        with self._rollback_lock:
+            tasks = list(self._rollback_tasks.values())
+            for entry in self.journal.pending():
+                tasks.extend(self._schedule_rollback(entry))
+        return tasks
+
+    def wait_for_rollbacks(self, group_id: str) -> bool:
+        with self._rollback_lock:
+            futures = [future for task_group, future in self._rollback_tasks.values()
+                       if task_group == group_id]
+        wait(futures)
+        return not any(entry.group_id == group_id for entry in self.journal.pending())
 
     def _rollback(self, group_id: str, operation: str, hosts_to_rollback: List[str]) -> bool:
-        failed_rollbacks = []
-        for host in hosts_to_rollback:
-            if operation == 'delete':
-                if not self._make_delete_request(host=host, group_id=group_id):
-                    failed_rollbacks.append(host)
-                    logger.info(
-                        f"Rollback failed for host {host} during {operation} operation")
-            elif operation == 'create':
-                if not self._make_post_request(host=host, group_id=group_id):
-                    failed_rollbacks.append(host)
-                    logger.info(
-                        f"Rollback failed for host {host} during {operation} operation")
-
-        if not failed_rollbacks:
+        if not hosts_to_rollback:
+            return self._rollback_finished(None, True)
+        with self.tracer.span('rollback', group=group_id, operation=operation, hosts=len(hosts_to_rollback)) as span:
+            # Written ahead of the requests so a crash mid-rollback can be replayed.
+            with self.tracer.span('journal_add'):
+                entry_id = self.journal.add(group_id, operation, hosts_to_rollback)
+            entry = PendingRollback(entry_id, group_id, operation, list(hosts_to_rollback))
+            with self._rollback_lock:
+                futures = [future for _, future in self._schedule_rollback(entry)]
+            return self._rollback_finished(span, all(future.result() for future in futures))
+
+    def _rollback_finished(self, span, succeeded: bool) -> bool:
+        if succeeded:
             logger.info(
-                f"Rollback operation successful")
+                "Rollback operation successful")
             return True
-        else:
-            logger.info(
-                "Found failed rollback operations. storing it in a file to continue later...")
-            with open(self.rollback_file, 'w') as file:
-                file.write(operation + '\n')
-                file.write(group_id + '\n')
-                for host in failed_rollbacks:
-                    file.write(host + '\n')
+        span.fail('hosts left in journal')
+        logger.info(
+            "Found failed rollback operations. Keeping them in the rollback journal to continue later...")
+        return False
+
+    def _schedule_rollback(self, entry: PendingRollback) -> List[Tuple[str, Future]]:
+        # Called with the rollback lock held.
+        if self._rollback_executor is None:
+            self._rollback_executor = ThreadPoolExecutor(
+                max_workers=self.rollback_parallelism, thread_name_prefix='rollback')
+        scheduled = []
+        for host in entry.hosts:
+            key = (entry.entry_id, host)
+            if key in self._rollback_tasks:
+                continue
+            # The context carries the current span into the worker thread.
+            future = self._rollback_executor.submit(
+                contextvars.copy_context().run, self._replay_rollback_host, entry, host)
+            task = (entry.group_id, future)
+            self._rollback_tasks[key] = task
+            future.add_done_callback(
+                functools.partial(self._forget_rollback_task, key))
+            scheduled.append(task)
+        return scheduled
+
+    def _forget_rollback_task(self, key, future: Future):
+        with self._rollback_lock:
+            self._rollback_tasks.pop(key, None)
+
+    def _replay_rollback_host(self, entry: PendingRollback, host: str) -> bool:
+        self.metrics.rollbacks.inc(entry.operation)
+        with self.tracer.span('rollback_host', host=host, group=entry.group_id, operation=entry.operation) as span:
+            if self._rollback_request(entry.operation, host, entry.group_id):
+                # Recorded right away so a later replay only resends what is left.
+                with self.tracer.span('journal_mark_done'):
+                    self.journal.mark_done(entry.entry_id, host)
+                return True
+            span.fail('rollback request failed')
+        return self._rollback_host_failed(entry, host)
+
+    def _rollback_host_failed(self, entry: PendingRollback, host: str) -> bool:
+        self.metrics.rollback_failures.inc(entry.operation)
+        logger.info(
+            "Rollback failed for host %s during %s operation", host, entry.operation,
+            extra={'host': host, 'group': entry.group_id, 'operation': entry.operation})
+        return False
+
+    def _rollback_method(self, operation: str) -> Optional[Callable]:
+        # The request that undoes a journalled operation, for either client.
+        if operation == 'delete':
+            return self._make_delete_request
+        elif operation == 'create':
+            return self._make_post_request
+        logger.error("Unknown rollback operation %s", operation)
+        return None
 
+    def _rollback_request(self, operation: str, host: str, group_id: str) -> bool:
+        request = self._rollback_method(operation)
+        return request is not None and request(host=host, group_id=group_id)
+
+    def _probe_host(self, host: str) -> bool:
+        try:
+            response = self.pool.client(host).get(
+                self.base_url.format(host), timeout=self.request_timeout)
+        except httpx.RequestError:
             return False
+        return response.status_code < 500
 
-    def _make_post_request(self, host: str, group_id: str) -> bool:
-        if self.simulate:
-            return random.choice([True, False])
+    def _make_post_request(self, host: str, group_id: str, deadline: Optional[Deadline] = None) -> bool:
+        url = self.base_url.format(host)
+        data = {"groupId": group_id}
+        response = self._send('create', host, lambda client, timeout: client.post(
+            url, json=data, timeout=timeout), deadline=deadline, final_statuses=(400,))
+        if response is None:
+            self._update_status_cache(host, group_id, None)
+            return False
+        self._update_status_cache(host, group_id, True)
+        if response.status_code == 400:
+            logger.info(
+                "Group already exist on host %s. Moving on to next host...", host,
+                extra={'host': host, 'group': group_id})
+        return True
 
+    def _make_delete_request(self, host: str, group_id: str, deadline: Optional[Deadline] = None) -> bool:
         url = self.base_url.format(host)
         data = {"groupId": group_id}
-        backoff = self.retry_timeout
+        # httpx's delete() helper does not accept a request body.
+        response = self._send('delete', host, lambda client, timeout: client.request(
+            "DELETE", url, json=data, timeout=timeout), deadline=deadline, retry_on=(Exception,))
+        self._update_status_cache(
+            host, group_id, False if response is not None else None)
+        return response is not None
 
-        for attempt in range(self.max_retries):
-            try:
-                with httpx.Client(timeout=self.request_timeout) as client:
-                    response = client.post(
-                        url, json=data, timeout=self.request_timeout)
+    def _make_get_request(self, host: str, group_id: str, deadline: Optional[Deadline] = None) -> bool:
+        cached, headers = self._cached_status(host, group_id)
+        if cached is not None:
+            return cached
 
-                response.raise_for_status()
-                return True
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 400:
-                    logger.info(
-                        f"Group already exist on host {host}. Moving on to next host...")
-                    return True
-            except httpx.RequestError as e:
-                logger.info(
-                    f"create attempt {attempt + 1} failed for host {host}. Retrying...")
-            time.sleep(backoff)
-            backoff *= 2
-        return False
+        url = f"{self.base_url.format(host)}/{group_id}"
 
-    def _make_delete_request(self, host: str, group_id: str) -> bool:
-        if self.simulate:
-            return random.choice([True, False])
+        def read(headers):
+            return self._send_hedged(host, lambda: self._send('Get', host, lambda client, timeout: client.get(
+                url, headers=headers, timeout=timeout), deadline=deadline, final_statuses=(404, 304)))
 
-        url = self.base_url.format(host)
-        data = {"groupId": group_id}
-        backoff = self.retry_timeout
+        exists = self._read_status_response(host, group_id, read(headers))
+        if exists is None and headers is not None:
+            exists = self._read_status_response(host, group_id, read(None))
+        return bool(exists)
 
-        for attempt in range(self.max_retries):
-            try:
-                with httpx.Client(timeout=self.request_timeout) as client:
-                    response = client.delete(
-                        url, json=data, timeout=self.request_timeout)
+    def _timed_read(self, host: str, read: Callable[[], Optional[httpx.Response]]) -> Optional[httpx.Response]:
+        start = self.clock()
+        response = read()
+        if response is not None:
+            self.hedging.record(host, self.clock() - start)
+        return response
 
-                response.raise_for_status()
-                return True
-            except Exception as e:
-                logger.info(
-                    f"delete attempt {attempt + 1} failed for host {host}. Retrying...")
-            time.sleep(backoff)
-            backoff *= 2
-        return False
+    def _hedge_executor(self, host: str) -> ThreadPoolExecutor:
+        # One pool per host, with a read per connection to it plus the hedges
+        # the policy lets run, so a slow host cannot hold the workers that
+        # reads from other hosts need.
+        executor = self._hedge_executors.get(host)
+        if executor is None:
+            with self._hedge_lock:
+                executor = self._hedge_executors.get(host)
+                if executor is None:
+                    executor = self._hedge_executors[host] = ThreadPoolExecutor(
+                        max_workers=self.max_connections + self.hedging.max_outstanding, thread_name_prefix='hedge')
+        return executor
 
-    def _make_get_request(self, host: str, group_id: str) -> bool:
-        if self.simulate:
-            return random.choice([True, False])
+    def _send_hedged(self, host: str, read: Callable[[], Optional[httpx.Response]]) -> Optional[httpx.Response]:
+        # Sends a second read when the first is slower than usual for the host
+        # and returns whichever answers first. The slower one is left to finish
+        # in the background.
+        if self.hedging is None:
+            return read()
+        delay = self.hedging.delay(host)
+        if delay is None:
+            return self._timed_read(host, read)
+        executor = self._hedge_executor(host)
+        started = threading.Event()
 
-        url = f"{self.base_url.format(host)}/{group_id}"
-        backoff = self.retry_timeout
+        def primary_read():
+            started.set()
+            return self._timed_read(host, read)
 
-        for attempt in range(self.max_retries):
-            try:
-                with httpx.Client(timeout=self.request_timeout) as client:
-                    response = client.get(url, timeout=self.request_timeout)
-                response.raise_for_status()
-                return True
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 404:
-                    logger.info(
-                        f"Get request failed for host {host}. Status code: {e.response.status_code}")
-                    return False
-            except httpx.RequestError as e:
+        primary = executor.submit(contextvars.copy_context().run, primary_read)
+        # The delay counts from when the read runs, so time spent queued here
+        # does not look like a slow host. A read still queued after the delay
+        # means every worker for the host is busy, and a hedge would only
+        # queue behind it.
+        if not started.wait(delay) or wait([primary], timeout=delay).done or not self.hedging.try_start():
+            return primary.result()
+        logger.info("Status read from host %s is slower than %.3fs. Sending a hedged request", host, delay,
+                    extra={'host': host})
+        self.metrics.hedges.inc(host)
+        hedge = executor.submit(contextvars.copy_context().run, self._timed_read, host, read)
+        hedge.add_done_callback(self.hedging.finish)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.result() is not None:
+                    return future.result()
+        return None
+
+    def _cached_status(self, host: str, group_id: str) -> Tuple[Optional[bool], Optional[Dict[str, str]]]:
+        # Returns a fresh cached status, or the headers to revalidate a stale one.
+        if self.status_cache is None:
+            return None, None
+        entry, fresh = self.status_cache.get(host, group_id)
+        if entry is None:
+            return None, None
+        if fresh:
+            return entry.exists, None
+        return None, {'If-None-Match': entry.etag}
+
+    def _read_status_response(self, host: str, group_id: str, response: Optional[httpx.Response]) -> Optional[bool]:
+        # None for a 304 whose cached status is gone, which says nothing about
+        # the group; the caller reads it again without If-None-Match.
+        if response is None:
+            return False
+        if response.status_code == 304:
+            exists = None if self.status_cache is None else self.status_cache.refresh(host, group_id)
+            if exists is None:
                 logger.info(
-                    f"Get attempt {attempt + 1} failed for host {host}. Retrying...")
-            time.sleep(backoff)
-            backoff *= 2
-        return False
+                    "Cached status for host %s is gone. Reading it again", host,
+                    extra={'host': host, 'group': group_id})
+                if self.status_cache is not None:
+                    self.status_cache.invalidate(host, group_id)
+            return exists
+        if response.status_code == 404:
+            logger.info(
+                "Get request failed for host %s. Status code: %s", host, response.status_code,
+                extra={'host': host, 'group': group_id, 'status_code': response.status_code})
+            exists = False
+        else:
+            exists = True
+        if self.status_cache is not None:
+            self.status_cache.put(host, group_id, exists,
+                                  response.headers.get('ETag'))
+        return exists
+
+    def _update_status_cache(self, host: str, group_id: str, exists: Optional[bool]):
+        # A write that failed leaves the host's state unknown.
+        if self.status_cache is None:
+            return
+        if exists is None:
+            self.status_cache.invalidate(host, group_id)
+        else:
+            self.status_cache.put(host, group_id, exists)
+
+    def _send(self, action: str, host: str, send: Callable[[httpx.Client, float], httpx.Response],
+              deadline: Optional[Deadline] = None, final_statuses: Tuple[int, ...] = (),
+              retry_on: Tuple[type, ...] = (httpx.RequestError,)) -> Optional[httpx.Response]:
+        with self.tracer.span('request', host=host, action=action.lower()) as span:
+            response = self._send_with_retries(action, host, send, deadline, final_statuses, retry_on)
+            if response is None:
+                span.fail('no response')
+            else:
+                span.set(status_code=response.status_code)
+            return response
+
+    def _send_with_retries(self, action: str, host: str, send: Callable[[httpx.Client, float], httpx.Response],
+                           deadline: Optional[Deadline], final_statuses: Tuple[int, ...],
+                           retry_on: Tuple[type, ...]) -> Optional[httpx.Response]:
+        # Sends one request with the client's retry policy. Returns the response
+        # once it succeeds or answers with one of final_statuses, or None when
+        # the host keeps failing. The decisions live in the helpers below,
+        # which the async client shares.
+        self.retry_policy.record_request()
+        operation = action.lower()
+        limiter = self.limits.limiter(host)
+        attempt = 0
+        while True:
+            if not self._may_send(action, host, deadline):
+                return None
+            with self.tracer.span('limit_wait'):
+                acquired = limiter.limit.acquire(None if deadline is None else deadline.remaining())
+                wait = self._reserve_token(limiter, acquired, deadline)
+                if wait:
+                    self._sleep(wait)
+            if wait is None:
+                self._skip_unsent(action, host)
+                return None
+            timeout = self.request_timeout if deadline is None else deadline.cap(self.request_timeout)
+            start = self._begin_attempt(host, operation)
+            succeeded = False
+            with self.tracer.span('attempt', attempt=attempt + 1) as span:
+                try:
+                    response, succeeded = self._read_attempt(
+                        host, operation, send(self.pool.client(host), timeout), final_statuses, span)
+                    if response is not None:
+                        return response
+                except retry_on as e:
+                    self._record_request_error(host, operation, e, span)
+                finally:
+                    self._end_attempt(limiter, host, operation, start, succeeded)
+            attempt += 1
+            delay = self._retry_delay(action, host, operation, attempt, deadline)
+            if delay is None:
+                return None
+            with self.tracer.span('backoff', delay=delay):
+                self._sleep(delay)
+
+    def _may_send(self, action: str, host: str, deadline: Optional[Deadline]) -> bool:
+        # Past this point every path that does not send gives the half-open
+        # trial back through _skip_unsent, or the breaker would never decide.
+        if deadline is not None and deadline.expired():
+            logger.info(
+                "Deadline exceeded before %s request to host %s", action, host, extra={'host': host})
+            return False
+        if not self.health.allow_request(host):
+            logger.info(
+                "Circuit breaker for host %s is open. Skipping request", host, extra={'host': host})
+            return False
+        return True
+
+    def _reserve_token(self, limiter: HostLimiter, acquired: bool, deadline: Optional[Deadline]) -> Optional[float]:
+        # The concurrency slot is taken first so a rate token is only spent
+        # once the request can go out. Returns how long to wait for the token,
+        # or None, with the slot given back, when it does not come in time.
+        if not acquired:
+            return None
+        wait = limiter.reserve(None if deadline is None else deadline.remaining())
+        if wait is None:
+            limiter.limit.cancel()
+        return wait
+
+    def _skip_unsent(self, action: str, host: str):
+        self.health.release_trial(host)
+        logger.info(
+            "Deadline exceeded waiting to send %s request to host %s", action, host, extra={'host': host})
+
+    def _begin_attempt(self, host: str, operation: str) -> float:
+        self.metrics.attempts.inc(host, operation)
+        self.metrics.in_flight.inc()
+        return self.clock()
+
+    def _read_attempt(self, host: str, operation: str, response: httpx.Response, final_statuses: Tuple[int, ...],
+                      span) -> Tuple[Optional[httpx.Response], bool]:
+        # (response to return or None to retry, whether the host did its
+        # part). Only 5xx answers count as the host struggling.
+        span.set(status_code=response.status_code)
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            status = e.response.status_code
+            self.metrics.record_status(host, operation, status)
+            if status in final_statuses:
+                self.health.record_success(host)
+                return e.response, status < 500
+            span.fail(f"HTTP {status}")
+            if status < 500:
+                self.health.record_success(host)
+                return None, True
+            self.health.record_failure(host)
+            return None, False
+        self.health.record_success(host)
+        return response, True
+
+    def _record_request_error(self, host: str, operation: str, error: Exception, span):
+        if isinstance(error, httpx.TimeoutException):
+            self.metrics.timeouts.inc(host, operation)
+        span.fail(type(error).__name__)
+        self.health.record_failure(host)
+
+    def _end_attempt(self, limiter: HostLimiter, host: str, operation: str, start: float, succeeded: bool):
+        finished = self.clock()
+        limiter.limit.release(start, finished, succeeded)
+        self.health.observe(host, succeeded, finished - start)
+        self.metrics.in_flight.dec()
+        self.metrics.request_duration.observe(finished - start, host, operation)
+
+    def _retry_delay(self, action: str, host: str, operation: str, attempt: int,
+                     deadline: Optional[Deadline]) -> Optional[float]:
+        # The backoff before the next attempt, or None once the policy, the
+        # retry budget or the deadline rules out another one.
+        delay = self.retry_policy.next_delay(attempt, deadline)
+        if delay is None:
+            return None
+        self.metrics.retries.inc(host, operation)
+        logger.info(
+            "%s attempt %d failed for host %s. Retrying...", action, attempt, host,
+            extra={'host': host, 'attempt': attempt})
+        return delay
+
+    def _sleep(self, delay: float):
+        if self.simulation is not None:
+            self.simulation.clock.sleep(delay)
+        else:
+            time.sleep(delay)
@@ -0,0 +1,141 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from contextlib import asynccontextmanager, contextmanager
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    # Merges identical concurrent calls: while a call for a key runs, later
+    # calls for the same key wait for it and get its result (or exception)
+    # instead of running again.
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: Hashable, function: Callable[[], T], on_join: Optional[Callable[[], None]] = None) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            if on_join is not None:
+                on_join()
+            return future.result()
+        try:
+            result = function()
+        except BaseException as e:
+            self._finish(key)
+            future.set_exception(e)
+            raise
+        self._finish(key)
+        future.set_result(result)
+        return result
+
+    def _finish(self, key: Hashable):
+        # Callers arriving after this start a fresh call.
+        with self._lock:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class SequencedKeys:
+    # Single-flight keys for calls that are applied in order per group. A call
+    # shares a key with the latest call queued for its group only if the two
+    # are identical, so it never joins a call that a different one for the
+    # group was queued after. Groups are forgotten once no call uses them.
+    def __init__(self):
+        self._latest: Dict[Hashable, List] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def key(self, group: Hashable, call: Hashable):
+        with self._lock:
+            entry = self._latest.get(group)
+            if entry is None:
+                entry = self._latest[group] = [call, 0, 0]
+            elif entry[0] != call:
+                entry[0] = call
+                entry[1] += 1
+            entry[2] += 1
+            key = (group, entry[1], call)
+        try:
+            yield key
+        finally:
+            with self._lock:
+                entry[2] -= 1
+                if not entry[2]:
+                    del self._latest[group]
+
+
+class KeyedLocks:
+    # One lock per key, kept only while someone holds or waits for it.
+    def __init__(self):
+        self._locks: Dict[Hashable, List] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def hold(self, key: Hashable):
+        with self._lock:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+
+class AsyncSingleFlight:
+    # SingleFlight for coroutines. The shared call runs as its own task, so a
+    # caller that is cancelled does not cancel it for the others.
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+
+    async def run(self, key: Hashable, function: Callable[[], Awaitable[T]],
+                  on_join: Optional[Callable[[], None]] = None) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(function())
+            task.add_done_callback(lambda done: self._forget(key, done))
+        elif on_join is not None:
+            on_join()
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        # Done callbacks run later; a newer call may already use the key.
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class AsyncKeyedLocks:
+    def __init__(self):
+        self._locks: Dict[Hashable, List] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
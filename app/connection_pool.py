@@ -0,0 +1,61 @@
+import httpx
+import threading
+from typing import Dict, Optional
+
+from app.dns_cache import AsyncCachedDnsTransport, CachedDnsTransport, DnsCache
+
+
+class ConnectionPool:
+    def __init__(self, max_connections: int = 10, max_keepalive_connections: int = 10, keepalive_expiry: float = 5.0, http2: bool = False, timeout: float = 1,
+                 dns_cache: Optional[DnsCache] = None):
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_keepalive_connections,
+                                   keepalive_expiry=keepalive_expiry)
+        self.http2 = http2
+        self.timeout = timeout
+        # Connections go to the cached address instead of resolving the host each time.
+        self.dns_cache = dns_cache
+        self._clients: Dict[str, httpx.Client] = {}
+        self._async_clients: Dict[str, httpx.AsyncClient] = {}
+        self._lock = threading.Lock()
+
+    def client(self, host: str) -> httpx.Client:
+        client = self._clients.get(host)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(host)
+                if client is None:
+                    transport = None if self.dns_cache is None else CachedDnsTransport(
+                        self.dns_cache, self.limits, self.http2)
+                    client = httpx.Client(timeout=self.timeout, limits=self.limits,
+                                          http2=self.http2, transport=transport)
+                    self._clients[host] = client
+        return client
+
+    def async_client(self, host: str) -> httpx.AsyncClient:
+        client = self._async_clients.get(host)
+        if client is None:
+            with self._lock:
+                client = self._async_clients.get(host)
+                if client is None:
+                    transport = None if self.dns_cache is None else AsyncCachedDnsTransport(
+                        self.dns_cache, self.limits, self.http2)
+                    client = httpx.AsyncClient(timeout=self.timeout, limits=self.limits,
+                                               http2=self.http2, transport=transport)
+                    self._async_clients[host] = client
+        return client
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    async def aclose(self):
+        self.close()
+        with self._lock:
+            clients = list(self._async_clients.values())
+            self._async_clients.clear()
+        for client in clients:
+            await client.aclose()
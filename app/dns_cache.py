@@ -0,0 +1,165 @@
+import asyncio
+import ipaddress
+import socket
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+import httpcore
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def host_name(host: str) -> str:
+    # The name to resolve in a hosts-file entry such as "node1:8080" or "[::1]:8080".
+    if host.startswith('['):
+        return host[1:].partition(']')[0]
+    name, _, port = host.rpartition(':')
+    return name if name and port.isdigit() else host
+
+
+def _is_address(name: str) -> bool:
+    try:
+        ipaddress.ip_address(name)
+    except ValueError:
+        return False
+    return True
+
+
+def _getaddrinfo(name: str) -> str:
+    return socket.getaddrinfo(name, None, type=socket.SOCK_STREAM)[0][4][0]
+
+
+class DnsCache:
+    # Resolved addresses per host name, kept for `ttl` seconds. Failed
+    # lookups are remembered for `negative_ttl` so an unresolvable host does
+    # not hit the resolver on every retry. httpx otherwise resolves the name
+    # again for every new connection.
+    def __init__(self, ttl: float = 300.0, negative_ttl: float = 5.0,
+                 resolver: Callable[[str], str] = _getaddrinfo, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._resolver = resolver
+        self._clock = clock
+        self._entries: Dict[str, Tuple[Optional[str], float]] = {}
+        self._lock = threading.Lock()
+
+    def cached(self, name: str) -> Tuple[bool, Optional[str]]:
+        # (found, address): a fresh entry's address, None for a cached failure.
+        if _is_address(name):
+            return True, name
+        entry = self._entries.get(name)
+        if entry is None or entry[1] <= self._clock():
+            return False, None
+        return True, entry[0]
+
+    def resolve(self, name: str) -> Optional[str]:
+        found, address = self.cached(name)
+        if found:
+            return address
+        try:
+            address = self._resolver(name)
+        except OSError as e:
+            logger.info("Cannot resolve host %s: %s", name, e)
+            address = None
+        ttl = self.ttl if address is not None else self.negative_ttl
+        with self._lock:
+            self._entries[name] = (address, self._clock() + ttl)
+        return address
+
+    def invalidate(self, name: str):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def pre_resolve(self, hosts: Iterable[str], parallelism: int = 32) -> Dict[str, Optional[str]]:
+        # Resolves every host up front, in parallel, so requests start with
+        # warm entries. Returns the address per host, None where it failed.
+        hosts = list(hosts)
+        with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix='dns') as executor:
+            addresses = dict(zip(hosts, executor.map(lambda host: self.resolve(host_name(host)), hosts)))
+        unresolved = [host for host, address in addresses.items() if address is None]
+        if unresolved:
+            logger.warning("Could not resolve %d of %d hosts: %s", len(unresolved), len(hosts), unresolved[:10])
+        return addresses
+
+
+class CachedDnsBackend(httpcore.NetworkBackend):
+    # Connects to the cached address instead of letting the socket layer
+    # resolve the name. TLS still verifies against the requested name. A
+    # connection that fails drops the entry, so a moved host is looked up
+    # again on the next attempt.
+    def __init__(self, dns: DnsCache, backend: Optional[httpcore.NetworkBackend] = None):
+        self.dns = dns
+        self._backend = backend or httpcore.SyncBackend()
+
+    def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        address = self.dns.resolve(host)
+        try:
+            return self._backend.connect_tcp(address or host, port, timeout=timeout,
+                                             local_address=local_address, socket_options=socket_options)
+        except httpcore.ConnectError:
+            self.dns.invalidate(host)
+            raise
+
+    def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    def sleep(self, seconds):
+        self._backend.sleep(seconds)
+
+
+class AsyncCachedDnsBackend(httpcore.AsyncNetworkBackend):
+    # Cache misses are resolved in the default executor, off the event loop.
+    def __init__(self, dns: DnsCache, backend: Optional[httpcore.AsyncNetworkBackend] = None):
+        self.dns = dns
+        self._backend = backend or httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        found, address = self.dns.cached(host)
+        if not found:
+            address = await asyncio.get_running_loop().run_in_executor(None, self.dns.resolve, host)
+        try:
+            return await self._backend.connect_tcp(address or host, port, timeout=timeout,
+                                                   local_address=local_address, socket_options=socket_options)
+        except httpcore.ConnectError:
+            self.dns.invalidate(host)
+            raise
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        return await self._backend.connect_unix_socket(path, timeout=timeout, socket_options=socket_options)
+
+    async def sleep(self, seconds):
+        await self._backend.sleep(seconds)
+
+
+def _pool_options(limits: httpx.Limits, http2: bool, verify, cert, trust_env: bool, retries: int,
+                  local_address: Optional[str], socket_options) -> Dict:
+    # What httpx.HTTPTransport passes its connection pool for the same arguments.
+    return dict(ssl_context=httpx.create_ssl_context(verify=verify, cert=cert, trust_env=trust_env),
+                max_connections=limits.max_connections, max_keepalive_connections=limits.max_keepalive_connections,
+                keepalive_expiry=limits.keepalive_expiry, http1=True, http2=http2, retries=retries,
+                local_address=local_address, socket_options=socket_options)
+
+
+class CachedDnsTransport(httpx.HTTPTransport):
+    # httpx.HTTPTransport takes no network backend, so instead of letting its
+    # __init__ build a pool that would only be replaced, this builds the pool
+    # itself, with a backend that resolves through the cache and the same TLS,
+    # retry and socket settings. Proxies from the environment are mounted by
+    # httpx.Client as separate transports and resolve names themselves.
+    def __init__(self, dns: DnsCache, limits: httpx.Limits, http2: bool = False,
+                 verify=True, cert=None, trust_env: bool = True, retries: int = 0,
+                 local_address: Optional[str] = None, socket_options=None):
+        self._pool = httpcore.ConnectionPool(network_backend=CachedDnsBackend(dns), **_pool_options(
+            limits, http2, verify, cert, trust_env, retries, local_address, socket_options))
+
+
+class AsyncCachedDnsTransport(httpx.AsyncHTTPTransport):
+    def __init__(self, dns: DnsCache, limits: httpx.Limits, http2: bool = False,
+                 verify=True, cert=None, trust_env: bool = True, retries: int = 0,
+                 local_address: Optional[str] = None, socket_options=None):
+        self._pool = httpcore.AsyncConnectionPool(network_backend=AsyncCachedDnsBackend(dns), **_pool_options(
+            limits, http2, verify, cert, trust_env, retries, local_address, socket_options))
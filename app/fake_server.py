@@ -0,0 +1,236 @@
+import json
+import random
+import threading
+import time
+import logging
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+GROUP_PATH = '/v1/group/'
+BULK_PATH = '/v1/groups/bulk'
+BULK_METHODS = ('POST', 'DELETE', 'GET')
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    # "fixed:0.01", "uniform:0.001,0.02" or "exp:0.005" (exponential with that mean), in seconds.
+    kind, _, params = spec.partition(':')
+    values = [float(value) for value in params.split(',') if value]
+    if kind == 'fixed' and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == 'uniform' and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'exp' and len(values) == 1:
+        return lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+def apply_group_request(groups: Set[str], method: str, group_id: Optional[str], already_exists: bool = False):
+    # The node side of the /v1/group/ contract: POST creates (400 if the
+    # group exists), DELETE always answers 200 and GET answers 200 or 404.
+    if not group_id:
+        return 400, {'error': "groupId is required"}
+    if method == 'POST':
+        if group_id in groups or already_exists:
+            groups.add(group_id)
+            return 400, {'error': "Group already exists"}
+        groups.add(group_id)
+        return 201, {'groupId': group_id}
+    if method == 'DELETE':
+        groups.discard(group_id)
+        return 200, {'groupId': group_id}
+    if group_id in groups:
+        return 200, {'groupId': group_id}
+    return 404, {'error': "Group not found"}
+
+
+def apply_bulk_request(groups: Set[str], operations, already_exists: Callable[[], bool]):
+    # The bulk contract: {"operations": [{"method", "groupId"}, ...]} answers
+    # 200 with {"results": [{"groupId", "status"}, ...]} in the same order,
+    # each status being what the single request would have answered.
+    if not isinstance(operations, list) or not all(
+            isinstance(item, dict) and item.get('method') in BULK_METHODS for item in operations):
+        return 400, {'error': "operations must be a list of {method, groupId}"}
+    results = []
+    for item in operations:
+        status_code, _ = apply_group_request(groups, item['method'], item.get('groupId'), already_exists())
+        results.append({'groupId': item.get('groupId'), 'status': status_code})
+    return 200, {'results': results}
+
+
+class FakeNode:
+    # Stand-in for one cluster node serving apply_group_request over HTTP.
+    def __init__(self, latency: str = 'fixed:0', error_rate: float = 0.0, timeout_rate: float = 0.0,
+                 timeout_delay: float = 2.0, exists_rate: float = 0.0, seed: Optional[int] = None,
+                 port: int = 0, bulk: bool = True):
+        self.latency = parse_latency(latency)
+        # Nodes without the bulk endpoint answer 404 on it.
+        self.bulk = bulk
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.timeout_delay = timeout_delay
+        self.exists_rate = exists_rate
+        self.groups: Set[str] = set()
+        self.requests = Counter()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        handler = type('BoundFakeNodeHandler',
+                       (FakeNodeHandler,), {'node': self})
+        self.server = FakeNodeServer(('127.0.0.1', port), handler)
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return f"127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _draw(self):
+        # Decides the fate of one request: (delay, outcome, roll for "already exists").
+        with self._lock:
+            delay = self.latency(self._rng)
+            roll = self._rng.random()
+            exists_roll = self._rng.random()
+        if roll < self.timeout_rate:
+            return self.timeout_delay, 'timeout', exists_roll
+        if roll < self.timeout_rate + self.error_rate:
+            return delay, 'error', exists_roll
+        return delay, 'ok', exists_roll
+
+    def handle(self, method: str, group_id: Optional[str]):
+        with self._lock:
+            self.requests[method] += 1
+        delay, outcome, exists_roll = self._draw()
+        if delay:
+            time.sleep(delay)
+        if outcome != 'ok':
+            return 500, {'error': outcome}
+        with self._lock:
+            return apply_group_request(self.groups, method, group_id, exists_roll < self.exists_rate)
+
+    def handle_bulk(self, operations):
+        # One draw decides the latency and outcome of the whole batch.
+        if not self.bulk:
+            return 404, {'error': "Not found"}
+        with self._lock:
+            self.requests['BULK'] += 1
+        delay, outcome, _ = self._draw()
+        if delay:
+            time.sleep(delay)
+        if outcome != 'ok':
+            return 500, {'error': outcome}
+        with self._lock:
+            return apply_bulk_request(self.groups, operations,
+                                      lambda: self._rng.random() < self.exists_rate)
+
+
+class FakeNodeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes.
+    disable_nagle_algorithm = True
+    node: FakeNode = None
+
+    def do_POST(self):
+        if self.path.startswith(BULK_PATH):
+            status_code, body = self.node.handle_bulk(self._body().get('operations'))
+            self._send(status_code, body)
+            return
+        if not self.path.startswith(GROUP_PATH.rstrip('/')):
+            self._read_body()
+            self._send(404, {'error': "Not found"})
+            return
+        self._handle('POST', self._body_group_id())
+
+    def do_DELETE(self):
+        self._handle('DELETE', self._body_group_id())
+
+    def do_GET(self):
+        if not self.path.startswith(GROUP_PATH):
+            self._send(404, {'error': "Not found"})
+            return
+        self._handle('GET', self.path[len(GROUP_PATH):].strip('/'))
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _body(self) -> Dict:
+        body = self._read_body()
+        try:
+            parsed = json.loads(body) if body else {}
+        except ValueError:
+            return {}
+        return parsed if isinstance(parsed, dict) else {}
+
+    def _body_group_id(self) -> Optional[str]:
+        return self._body().get('groupId')
+
+    def _handle(self, method: str, group_id: Optional[str]):
+        status_code, body = self.node.handle(method, group_id)
+        self._send(status_code, body)
+
+    def _send(self, status_code: int, body):
+        payload = json.dumps(body).encode()
+        try:
+            self.send_response(status_code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a slow answer.
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeNodeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 drops connections under a concurrent benchmark.
+    request_queue_size = 1024
+
+
+class FakeCluster:
+    # node_overrides maps a node index to options replacing node_options for it.
+    def __init__(self, nodes: int = 3, seed: Optional[int] = None,
+                 node_overrides: Optional[Dict[int, Dict]] = None, **node_options):
+        node_overrides = node_overrides or {}
+        self.nodes: List[FakeNode] = [
+            FakeNode(seed=None if seed is None else seed + index, **{**node_options, **node_overrides.get(index, {})})
+            for index in range(nodes)]
+
+    @property
+    def hosts(self) -> List[str]:
+        return [node.host for node in self.nodes]
+
+    def request_counts(self) -> Counter:
+        total = Counter()
+        for node in self.nodes:
+            total.update(node.requests)
+        return total
+
+    def start(self):
+        for node in self.nodes:
+            node.start()
+        return self
+
+    def stop(self):
+        for node in self.nodes:
+            node.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
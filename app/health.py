@@ -0,0 +1,191 @@
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    # closed: requests flow and consecutive failures are counted.
+    # open: requests fail fast until recovery_timeout has passed.
+    # half_open: a single trial request (or probe) decides between the two.
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._clock = clock
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == OPEN and self._clock() - self._opened_at >= self.recovery_timeout:
+            self._state = HALF_OPEN
+            self._trial_in_flight = False
+        return self._state
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release_trial(self):
+        # Gives back a trial that was allowed but never sent, so the next
+        # request can take it.
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record_success(self) -> bool:
+        with self._lock:
+            recovered = self._state != CLOSED
+            self._state = CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+            return recovered
+
+    def record_failure(self) -> bool:
+        with self._lock:
+            state = self._current_state()
+            self._failures += 1
+            if state == HALF_OPEN or (state == CLOSED and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = self._clock()
+                self._trial_in_flight = False
+                return True
+            return False
+
+
+class HostStats:
+    # Moving averages of how often a host fails and how slow it is, used to
+    # try the riskiest hosts first.
+    __slots__ = ('failure_rate', 'latency')
+
+    def __init__(self):
+        self.failure_rate = 0.0
+        self.latency = 0.0
+
+    def observe(self, succeeded: bool, latency: float, smoothing: float):
+        self.failure_rate += smoothing * ((0.0 if succeeded else 1.0) - self.failure_rate)
+        self.latency += smoothing * (latency - self.latency)
+
+
+class HostHealth:
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0, probe_interval: float = 5.0,
+                 probe: Optional[Callable[[str], bool]] = None, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.probe_interval = probe_interval
+        self.probe = probe
+        self._clock = clock
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._stats: Dict[str, HostStats] = {}
+        self.stats_smoothing = 0.1
+        self._lock = threading.Lock()
+        self._probe_thread = None
+        self._stopped = threading.Event()
+
+    def breaker(self, host: str) -> CircuitBreaker:
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(host, CircuitBreaker(
+                    self.failure_threshold, self.recovery_timeout, clock=self._clock))
+        return breaker
+
+    def state(self, host: str) -> str:
+        return self.breaker(host).state
+
+    def allow_request(self, host: str) -> bool:
+        return self.breaker(host).allow_request()
+
+    def release_trial(self, host: str):
+        self.breaker(host).release_trial()
+
+    def is_open(self, host: str) -> bool:
+        return self.breaker(host).state == OPEN
+
+    def open_hosts(self, hosts: List[str]) -> List[str]:
+        return [host for host in hosts if self.is_open(host)]
+
+    def stats(self, host: str) -> HostStats:
+        stats = self._stats.get(host)
+        if stats is None:
+            with self._lock:
+                stats = self._stats.setdefault(host, HostStats())
+        return stats
+
+    def observe(self, host: str, succeeded: bool, latency: float):
+        self.stats(host).observe(succeeded, latency, self.stats_smoothing)
+
+    def order_by_risk(self, hosts: List[str]) -> List[str]:
+        # Most failure-prone first, then slowest; ties keep their configured order.
+        return sorted(hosts, key=lambda host: (-self.stats(host).failure_rate, -self.stats(host).latency))
+
+    def risky_hosts(self, hosts: List[str], threshold: float) -> List[str]:
+        return [host for host in self.order_by_risk(hosts) if self.stats(host).failure_rate >= threshold]
+
+    def record_success(self, host: str):
+        if self.breaker(host).record_success():
+            logger.info("Host %s recovered. Closing its circuit breaker", host)
+
+    def record_failure(self, host: str):
+        if self.breaker(host).record_failure():
+            logger.info("Host %s keeps failing. Opening its circuit breaker for %ss", host, self.recovery_timeout)
+            self._start_probes()
+
+    def _start_probes(self):
+        if self.probe is None:
+            return
+        with self._lock:
+            if self._probe_thread is not None and self._probe_thread.is_alive():
+                return
+            self._stopped.clear()
+            self._probe_thread = threading.Thread(
+                target=self._run_probes, name='health-probes', daemon=True)
+            self._probe_thread.start()
+
+    def _run_probes(self):
+        # Runs while any breaker is not closed, probing the ones whose
+        # recovery timeout has passed.
+        while not self._stopped.wait(self.probe_interval):
+            with self._lock:
+                breakers = list(self._breakers.items())
+            unhealthy = [(host, breaker) for host, breaker in breakers
+                         if breaker.state != CLOSED]
+            if not unhealthy:
+                return
+            for host, breaker in unhealthy:
+                if not breaker.allow_request():
+                    continue
+                try:
+                    healthy = self.probe(host)
+                except Exception as e:
+                    logger.info("Health probe for host %s failed: %s", host, e)
+                    healthy = False
+                if healthy:
+                    self.record_success(host)
+                else:
+                    self.record_failure(host)
+
+    def stop(self):
+        self._stopped.set()
+        thread = self._probe_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
@@ -0,0 +1,48 @@
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+class HedgePolicy:
+    # Decides when a status read has waited long enough to send a second,
+    # hedged request: once it is slower than `percentile` of the host's last
+    # `window` answered reads. At most max_outstanding hedges run at a time,
+    # so a cluster-wide slowdown cannot double the load.
+    def __init__(self, percentile: float = 0.95, window: int = 100, min_samples: int = 20,
+                 min_delay: float = 0.001, max_outstanding: int = 10):
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_outstanding = max_outstanding
+        self.outstanding = 0
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, host: str, latency: float):
+        with self._lock:
+            latencies = self._latencies.get(host)
+            if latencies is None:
+                latencies = self._latencies[host] = deque(maxlen=self.window)
+            latencies.append(latency)
+
+    def delay(self, host: str) -> Optional[float]:
+        # None until the host has answered often enough to have a percentile.
+        with self._lock:
+            latencies = self._latencies.get(host)
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            ordered = sorted(latencies)
+        index = min(len(ordered) - 1, int(self.percentile * len(ordered)))
+        return max(self.min_delay, ordered[index])
+
+    def try_start(self) -> bool:
+        with self._lock:
+            if self.outstanding >= self.max_outstanding:
+                return False
+            self.outstanding += 1
+            return True
+
+    def finish(self, *_):
+        with self._lock:
+            self.outstanding -= 1
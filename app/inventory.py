@@ -0,0 +1,142 @@
+import os
+import sys
+import threading
+import logging
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Host(NamedTuple):
+    name: str
+    labels: Dict[str, str]
+
+
+def parse_host_line(line: str) -> Optional[Host]:
+    # "node1.example.com zone=us-east-1a role=primary"; a bare name has no
+    # labels, and everything after a # is a comment.
+    fields = line.split('#', 1)[0].split()
+    if not fields:
+        return None
+    labels = {}
+    for field in fields[1:]:
+        key, separator, value = field.partition('=')
+        if not separator or not key:
+            raise ValueError(f"Invalid host label {field!r}, expected key=value")
+        # Thousands of hosts share a handful of zones and roles.
+        labels[sys.intern(key)] = sys.intern(value)
+    return Host(fields[0], labels)
+
+
+def parse_selector(spec: Optional[str]) -> Callable[[Dict[str, str]], bool]:
+    # "zone=us-east-1a|us-east-1b,role!=canary": every comma-separated term
+    # must hold, and | separates the values a term accepts.
+    terms: List[Tuple[str, bool, frozenset]] = []
+    for term in (spec or '').split(','):
+        term = term.strip()
+        if not term:
+            continue
+        negated = '!=' in term
+        key, _, values = term.partition('!=' if negated else '=')
+        if not key or not values:
+            raise ValueError(f"Invalid host selector term {term!r}, expected key=value or key!=value")
+        terms.append((key.strip(), negated, frozenset(value.strip() for value in values.split('|'))))
+
+    def matches(labels: Dict[str, str]) -> bool:
+        return all((labels.get(key) in values) != negated for key, negated, values in terms)
+
+    return matches
+
+
+def parse_hosts(lines: Iterable[str], selector: Optional[str] = None) -> Iterator[Host]:
+    # Streams the hosts matching selector, skipping repeats, so a large file
+    # is never held in memory beyond the hosts kept.
+    matches = parse_selector(selector)
+    seen = set()
+    for number, line in enumerate(lines, 1):
+        try:
+            host = parse_host_line(line)
+        except ValueError as e:
+            logger.warning("Skipping line %d of the hosts file: %s", number, e)
+            continue
+        if host is None or host.name in seen or not matches(host.labels):
+            continue
+        seen.add(host.name)
+        yield host
+
+
+class HostInventory:
+    # The hosts file's hosts matching `selector`, with their labels. A file
+    # that changes on disk is read again by reload_if_changed(), or in the
+    # background once watch() is started.
+    def __init__(self, path, selector: Optional[str] = None):
+        self.path = path
+        self.selector = selector
+        parse_selector(selector)
+        self.hosts: List[str] = []
+        self._labels: Dict[str, Dict[str, str]] = {}
+        self._signature = None
+        self._stopped = threading.Event()
+        self._watch_thread = None
+
+    def _stat(self) -> Tuple[int, int]:
+        status = os.stat(self.path)
+        return status.st_mtime_ns, status.st_size
+
+    def load(self) -> List[str]:
+        signature = self._stat()
+        with open(self.path, 'r') as file:
+            labels = {host.name: host.labels for host in parse_hosts(file, self.selector)}
+        self.hosts, self._labels, self._signature = list(labels), labels, signature
+        return self.hosts
+
+    def reload_if_changed(self) -> bool:
+        # True when the file changed and the selected hosts are different.
+        # A file that cannot be read keeps the hosts loaded before.
+        try:
+            if self._stat() == self._signature:
+                return False
+            previous = self.hosts
+            return self.load() != previous
+        except OSError as e:
+            logger.warning("Keeping the current hosts, cannot read hosts file: %s", e)
+            return False
+
+    def labels(self, host: str) -> Dict[str, str]:
+        return self._labels.get(host, {})
+
+    def group_by(self, key: str) -> Dict[Optional[str], List[str]]:
+        # For example the selected hosts per zone.
+        groups: Dict[Optional[str], List[str]] = {}
+        for host in self.hosts:
+            groups.setdefault(self._labels[host].get(key), []).append(host)
+        return groups
+
+    def watch(self, on_change: Callable[[List[str]], None], interval: float = 5.0):
+        # Checks the file every interval seconds and calls on_change with the
+        # new hosts when they change.
+        if self._watch_thread is not None:
+            return
+        self._stopped.clear()
+        self._watch_thread = threading.Thread(
+            target=self._run_watch, args=(on_change, interval), name='host-inventory', daemon=True)
+        self._watch_thread.start()
+
+    def _run_watch(self, on_change: Callable[[List[str]], None], interval: float):
+        while not self._stopped.wait(interval):
+            if not self.reload_if_changed():
+                continue
+            if not self.hosts:
+                # More likely a file caught mid-write than a cluster with no hosts.
+                logger.warning("Hosts file %s changed but selects no hosts. Keeping the current hosts", self.path)
+                self._signature = None
+                continue
+            logger.info("Hosts file %s changed. Now targeting %d hosts", self.path, len(self.hosts))
+            on_change(self.hosts)
+
+    def stop(self):
+        self._stopped.set()
+        thread = self._watch_thread
+        if thread is not None:
+            thread.join()
+            self._watch_thread = None
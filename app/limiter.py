@@ -0,0 +1,198 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._clock = clock
+        self._tokens = self.burst
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        # Takes a token and returns how long to wait before using it, or None
+        # (taking nothing) when that would be longer than max_wait.
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if max_wait is not None and wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def refund(self):
+        # Returns a reserved token that was never used.
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + 1)
+
+
+class AdaptiveLimit:
+    # AIMD concurrency limit: grows by one for every `limit` requests that
+    # succeed in time and is cut by backoff_ratio when a request fails or
+    # recent latency rises past latency_tolerance times the long-run
+    # baseline. Both are moving averages, so single slow outliers do not
+    # count. Requests that started before the last cut do not cut it again,
+    # so one burst of failures only backs off once.
+    def __init__(self, initial_limit: float = 10, min_limit: float = 1, max_limit: float = 100,
+                 backoff_ratio: float = 0.5, latency_tolerance: float = 2.0, smoothing: float = 0.1,
+                 baseline_smoothing: float = 0.01):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.baseline_smoothing = baseline_smoothing
+        self.in_flight = 0
+        self.recent_latency: Optional[float] = None
+        self.baseline_latency: Optional[float] = None
+        self._decreased_at = float('-inf')
+        self._condition = threading.Condition()
+        self._async_waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = deque()
+
+    def _try_acquire(self) -> bool:
+        # Called with the condition held.
+        if self.in_flight < max(1, int(self.limit)):
+            self.in_flight += 1
+            return True
+        return False
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            return self._try_acquire()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        with self._condition:
+            return self._condition.wait_for(self._try_acquire, timeout)
+
+    async def acquire_async(self, timeout: Optional[float] = None) -> bool:
+        loop = asyncio.get_running_loop()
+        expires_at = None if timeout is None else loop.time() + timeout
+        while True:
+            with self._condition:
+                if self._try_acquire():
+                    return True
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+            remaining = None if expires_at is None else expires_at - loop.time()
+            try:
+                if remaining is None or remaining > 0:
+                    await asyncio.wait({waiter[1]}, timeout=remaining)
+            except asyncio.CancelledError:
+                self._forget_waiter(waiter, pass_on=True)
+                raise
+            self._forget_waiter(waiter)
+            if expires_at is not None and loop.time() >= expires_at:
+                with self._condition:
+                    return self._try_acquire()
+
+    def _forget_waiter(self, waiter: Tuple[asyncio.AbstractEventLoop, asyncio.Future], pass_on: bool = False):
+        # A waiter that is no longer queued was already picked by a release.
+        # One that gives up (is cancelled) passes that wakeup on, or the next
+        # waiter could wait for a slot that is already free.
+        with self._condition:
+            try:
+                self._async_waiters.remove(waiter)
+                waiters = []
+            except ValueError:
+                waiters = self._wake_waiters() if pass_on else []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def release(self, started_at: float, finished_at: float, succeeded: bool):
+        latency = finished_at - started_at
+        with self._condition:
+            self.in_flight -= 1
+            slow = False
+            if succeeded:
+                if self.baseline_latency is None:
+                    self.recent_latency = self.baseline_latency = latency
+                else:
+                    self.recent_latency += self.smoothing * (latency - self.recent_latency)
+                    self.baseline_latency += self.baseline_smoothing * (latency - self.baseline_latency)
+                    slow = self.recent_latency > self.baseline_latency * self.latency_tolerance
+            if not succeeded or slow:
+                if started_at >= self._decreased_at:
+                    self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+                    self._decreased_at = finished_at
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            waiters = self._wake_waiters()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def cancel(self):
+        # Gives back a slot whose request was never sent, without counting it
+        # for or against the limit.
+        with self._condition:
+            self.in_flight -= 1
+            waiters = self._wake_waiters()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def _wake_waiters(self) -> List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]:
+        # Called with the condition held. Wakes as many threads as there are
+        # free slots and returns the async waiters to wake the same way.
+        free = max(0, int(self.limit) - self.in_flight)
+        self._condition.notify(free)
+        return [self._async_waiters.popleft() for _ in range(min(free, len(self._async_waiters)))]
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class HostLimiter:
+    def __init__(self, limit: AdaptiveLimit, bucket: Optional[TokenBucket] = None):
+        self.limit = limit
+        self.bucket = bucket
+
+    def reserve(self, max_wait: Optional[float] = None) -> Optional[float]:
+        if self.bucket is None:
+            return 0.0
+        return self.bucket.reserve(max_wait)
+
+    def refund(self):
+        if self.bucket is not None:
+            self.bucket.refund()
+
+
+class HostLimits:
+    # One HostLimiter per host: an optional token bucket of `rate` requests
+    # per second plus an adaptive concurrency limit.
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None, initial_limit: float = 10,
+                 min_limit: float = 1, max_limit: float = 100, backoff_ratio: float = 0.5,
+                 latency_tolerance: float = 2.0, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.latency_tolerance = latency_tolerance
+        self._clock = clock
+        self._limiters: Dict[str, HostLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, host: str) -> HostLimiter:
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(host)
+                if limiter is None:
+                    limit = AdaptiveLimit(min(self.initial_limit, self.max_limit), self.min_limit, self.max_limit,
+                                          self.backoff_ratio, self.latency_tolerance)
+                    bucket = TokenBucket(self.rate, self.burst, clock=self._clock) if self.rate else None
+                    limiter = self._limiters[host] = HostLimiter(limit, bucket)
+        return limiter
+
+    def concurrency_limit(self, host: str) -> float:
+        return self.limiter(host).limit.limit
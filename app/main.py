@@ -1,23 +1,55 @@
 import argparse
+import asyncio
+from contextlib import ExitStack
+import json
 import os
+import time
 import logging
 from pathlib import Path
 from app.cluster_client import ClusterClient
+from app.connection_pool import ConnectionPool
+from app.async_cluster_client import AsyncClusterClient
+from app.bulk import BulkPolicy
+from app.batch import run_batch_file
+from app.health import HostHealth
+from app.dns_cache import DnsCache
+from app.hedging import HedgePolicy
+from app.inventory import HostInventory, parse_hosts, parse_selector
+from app.limiter import HostLimits
+from app.metrics import ClientMetrics
+from app.membership import sweep_file
+from app.multi_cluster import MultiClusterClient, read_clusters_file
+from app.partition import LeaseStore, PartitionedWorker, run_partitioned_batch_file
+from app.profiling import profiled
+from app.reconcile import reconcile_file
+from app.retry import RetryBudget, RetryPolicy
+from app.service import ClusterService, serve
+from app.simulation import SimulatedCluster
+from app.status_cache import StatusCache
+from app.structured_logging import configure_logging
+from app.tracing import Tracer, span_exporter
 
-logging.basicConfig(level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 hosts_file_path = Path(__file__).parent / 'hosts.txt'
-rollback_file_path = Path(__file__).parent / 'rollback.txt'
+rollback_file_path = Path(__file__).parent / 'rollback.journal'
+legacy_rollback_file_path = Path(__file__).parent / 'rollback.txt'
+managed_groups_file_path = Path(__file__).parent / 'managed_groups.json'
+membership_snapshot_path = Path(__file__).parent / 'membership.snapshot'
+lease_store_path = Path(__file__).parent / 'leases.db'
 
+MULTI_CLUSTER_OPERATIONS = ('create', 'delete', 'status', 'rollback')
 
-def read_hosts_file(file_path):
+STATUS_LABELS = {True: 'Exists', False: 'Does not exist',
+                 None: 'Unknown (host unavailable)'}
+
+
+def read_hosts_file(file_path, selector=None):
     try:
         with open(file_path, 'r') as file:
-            hosts = [line.strip() for line in file if line.strip()]
+            hosts = [host.name for host in parse_hosts(file, selector)]
         if not hosts:
-            logger.error(f"No hosts found in {file_path}")
+            logger.error(f"No hosts found in {file_path}" + (f" matching {selector}" if selector else ''))
             return None
         return hosts
     except FileNotFoundError:
@@ -28,9 +60,15 @@ def read_hosts_file(file_path):
         return None
 
 
+def import_legacy_rollback_file(client):
+    if os.path.exists(legacy_rollback_file_path):
+        logger.info("Found existing rollback.txt. Moving it to the rollback journal")
+        client.journal.import_legacy_file(legacy_rollback_file_path)
+
+
 def rollback(client):
-    if os.path.exists(rollback_file_path):
-        logger.info("Found existing rollback.txt. Processing rollback")
+    if client.has_pending_rollbacks():
+        logger.info("Found pending rollbacks. Processing rollback")
         if not client.continue_rollbacks():
             logger.error("Rollbacks failed again. Try again!")
             return False
@@ -41,10 +79,27 @@ def rollback(client):
         return True
 
 
-def perform_operation(client, operation, group_name):
+def rollback_group(client, group_name):
+    # Other groups' pending rollbacks keep draining in the background.
+    client.start_rollback_drain()
+    if not client.wait_for_rollbacks(group_name):
+        logger.error(
+            f"Rollbacks for group {group_name} failed again. Try again!")
+        return False
+    return True
+
+
+def print_status_ndjson(client, group_name):
+    # One line per host as soon as it answers, for piping into other tools.
+    for host, exists in client.iter_group_status(group_name):
+        print(json.dumps({'group_name': group_name, 'host': host, 'exists': exists}), flush=True)
+    return True
+
+
+def perform_operation(client, operation, group_name, ndjson=False):
     if operation == 'create':
         logger.info(f"Attempting to create group: {group_name}")
-        rollback_result = rollback(client)
+        rollback_result = rollback_group(client, group_name)
         if not rollback_result:
             return False
         success = client.create_group(group_name)
@@ -57,7 +112,7 @@ def perform_operation(client, operation, group_name):
             return False
     elif operation == 'delete':
         logger.info(f"Attempting to delete group: {group_name}")
-        rollback_result = rollback(client)
+        rollback_result = rollback_group(client, group_name)
         if not rollback_result:
             return False
         success = client.delete_group(group_name)
@@ -69,13 +124,15 @@ def perform_operation(client, operation, group_name):
                 f"Failed to delete group {group_name} after all retries")
             return False
     elif operation == 'status':
+        if ndjson:
+            return print_status_ndjson(client, group_name)
         logger.info(f"Checking status of group: {group_name}")
         status = client.get_group_status(group_name)
         if status:
             logger.info(f"Group {group_name} status:")
             for host, exists in status.items():
                 logger.info(
-                    f"{host}: {'Exists' if exists else 'Does not exist'}")
+                    f"{host}: {STATUS_LABELS[exists]}")
             return True
         else:
             logger.error(f"Failed to get status for group {group_name}")
@@ -92,40 +149,350 @@ def perform_operation(client, operation, group_name):
             return False
 
 
-def main():
+def follow_hosts(client, hosts, dns_cache=None):
+    # Called by the inventory watcher when the hosts file changes.
+    if dns_cache is not None:
+        dns_cache.pre_resolve(hosts)
+    client.hosts = hosts
+
+
+def write_metrics(client, metrics_file):
+    # For the node exporter's textfile collector after one-shot runs.
+    if metrics_file:
+        client.metrics.write_textfile(metrics_file)
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Manage cluster groups.")
     parser.add_argument('--operation', type=str, choices=[
-                        'create', 'delete', 'status', 'rollback'], required=True, help="The operation to perform on the group: create, delete, status or rollback")
+                        'create', 'delete', 'status', 'rollback', 'reconcile', 'sweep', 'serve'], help="The operation to perform on the group: create, delete, status or rollback, reconcile to match --desired_state, sweep to check --groups_file on every host, or serve to run the HTTP service")
+    parser.add_argument('--batch', type=str,
+                        help="Path to a JSONL file of {\"operation\", \"group_name\"} records to run instead of a single operation")
+    parser.add_argument('--max_in_flight', type=int, default=100,
+                        help="Maximum batch records processed at the same time (default: 100)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Split the batch between this many worker processes or pods by group (default: 1)")
+    parser.add_argument('--worker_id', type=str,
+                        help="Stable, unique name of this worker, required when --workers is more than 1. It names "
+                             "the worker's rollback journal, so a restarted worker must keep it to replay its "
+                             "rollbacks (for example a StatefulSet pod name, not a Deployment pod's hostname)")
+    parser.add_argument('--lease_store', type=str, default=str(lease_store_path),
+                        help="SQLite file the workers share for membership and group leases (default: app/leases.db)")
+    parser.add_argument('--desired_state', type=str,
+                        help="File of group IDs, one per line, that reconcile keeps on every host")
+    parser.add_argument('--dry_run', action='store_true',
+                        help="With reconcile, print the per-host creates and deletes without applying them")
+    parser.add_argument('--groups_file', type=str,
+                        help="File of group IDs, one per line, whose status sweep reads on every host")
+    parser.add_argument('--full_sweep', action='store_true',
+                        help="With sweep, read every group again instead of only those the last snapshot left unknown or inconsistent")
     parser.add_argument('--group_name', type=str,
                         help="The name of the group to create or delete")
-    parser.add_argument('--simulate', type=bool, default=True,
-                        help="Simulate the operations (default: True)")
+    parser.add_argument('--ndjson', action='store_true',
+                        help="With status, print one JSON line per host as results arrive instead of logging them at the end")
+    parser.add_argument('--clusters', type=str,
+                        help="JSON file of named clusters, each with its hosts and retry settings, to run create, delete, status or rollback on all at once")
+    parser.add_argument('--hosts_file', type=str, default=str(hosts_file_path),
+                        help="File with one host per line, optionally followed by key=value labels such as zone=us-east-1a (default: app/hosts.txt)")
+    parser.add_argument('--hosts_selector', type=str,
+                        help="Only target hosts whose labels match, e.g. \"zone=us-east-1a|us-east-1b,role!=canary\"")
+    parser.add_argument('--hosts_reload_interval', type=float, default=5.0,
+                        help="Seconds between checks of the hosts file for changes while serving (default: 5)")
+    parser.add_argument('--dns_ttl', type=float, default=300.0,
+                        help="Seconds resolved host addresses are cached; hosts are resolved at startup. 0 resolves on every connection (default: 300)")
+    parser.add_argument('--simulate', dest='simulate', action='store_true', default=True,
+                        help="Run against an in-process simulated cluster instead of the hosts (default)")
+    parser.add_argument('--no-simulate', dest='simulate', action='store_false',
+                        help="Send requests to the real hosts")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed for the simulated cluster (default: 0)")
+    parser.add_argument('--simulated_latency', type=str, default='exp:0.005',
+                        help="Simulated node latency: fixed:S, uniform:MIN,MAX or exp:MEAN in seconds (default: exp:0.005)")
+    parser.add_argument('--simulated_failure_rate', type=float, default=0.0,
+                        help="Fraction of simulated requests answered with 500 (default: 0)")
+    parser.add_argument('--simulated_timeout_rate', type=float, default=0.0,
+                        help="Fraction of simulated requests that time out (default: 0)")
     parser.add_argument('--max_retries', type=int, default=2,
                         help="Maximum number of retries (default: 2)")
     parser.add_argument('--retry_timeout', type=int, default=1,
                         help="Retry timeout in seconds (default: 1)")
+    parser.add_argument('--operation_timeout', type=float,
+                        help="Overall deadline in seconds for each create, delete or status, retries included (default: none)")
+    parser.add_argument('--retry_budget', type=float, default=0.2,
+                        help="Retries allowed as a fraction of requests sent (default: 0.2)")
+    parser.add_argument('--status_cache_ttl', type=float, default=0,
+                        help="Seconds a status result is cached per host and group, 0 disables the cache (default: 0)")
+    parser.add_argument('--status_cache_size', type=int, default=100000,
+                        help="Maximum cached status results (default: 100000)")
+    parser.add_argument('--rollback_parallelism', type=int, default=10,
+                        help="Maximum rollback requests replayed at the same time (default: 10)")
+    parser.add_argument('--max_connections', type=int, default=10,
+                        help="Maximum pooled connections per host (default: 10)")
+    parser.add_argument('--keepalive_expiry', type=float, default=5.0,
+                        help="Seconds an idle connection is kept alive (default: 5)")
+    parser.add_argument('--http2', action='store_true',
+                        help="Use HTTP/2 when the nodes support it (requires httpx[http2])")
+    parser.add_argument('--failure_threshold', type=int, default=5,
+                        help="Consecutive failures before a host's circuit breaker opens (default: 5)")
+    parser.add_argument('--recovery_timeout', type=float, default=30.0,
+                        help="Seconds a host's circuit breaker stays open before it is probed again (default: 30)")
+    parser.add_argument('--host_ordering', choices=['static', 'risk'], default='static',
+                        help="Write to hosts in hosts.txt order, or riskiest first so failures roll back less (default: static)")
+    parser.add_argument('--readiness_check', action='store_true',
+                        help="Probe recently failing hosts before each create or delete")
+    parser.add_argument('--hedge_percentile', type=float,
+                        help="Send a second status read when a host is slower than this percentile of its recent reads, e.g. 0.95 (default: off)")
+    parser.add_argument('--max_hedges', type=int, default=10,
+                        help="Maximum hedged status reads outstanding at once (default: 10)")
+    parser.add_argument('--bulk', action='store_true',
+                        help="Batch the group requests of batch, reconcile and sweep runs into bulk requests to nodes that support them")
+    parser.add_argument('--bulk_max_batch', type=int, default=100,
+                        help="Maximum group requests in one bulk request (default: 100)")
+    parser.add_argument('--bulk_max_delay', type=float, default=0.005,
+                        help="Seconds a group request waits for its bulk request to fill up (default: 0.005)")
+    parser.add_argument('--rate_limit', type=float,
+                        help="Maximum requests per second sent to each host (default: no limit)")
+    parser.add_argument('--rate_burst', type=float,
+                        help="Requests a host may receive at once before --rate_limit applies (default: one second's worth)")
+    parser.add_argument('--listen', type=str, default='127.0.0.1:8080',
+                        help="Address the service listens on. The service has no authentication, so it stays on loopback unless this is set (default: 127.0.0.1:8080)")
+    parser.add_argument('--unix_socket', type=str,
+                        help="Serve on this Unix socket instead of --listen")
+    parser.add_argument('--service_concurrency', type=int, default=32,
+                        help="Maximum operations the service runs at the same time (default: 32)")
+    parser.add_argument('--service_queue', type=int, default=1000,
+                        help="Maximum operations waiting for a slot before the service answers 503 (default: 1000)")
+    parser.add_argument('--metrics_file', type=str,
+                        help="Write client metrics in Prometheus text format to this file when the run finishes")
+    parser.add_argument('--trace_file', type=str,
+                        help="Write a span per operation, request, attempt, backoff and rollback step to this file: Chrome trace format for .json, JSON lines otherwise")
+    parser.add_argument('--profile_file', type=str,
+                        help="Sample the stacks of the whole run and write them to this file in folded (flame graph) format")
+    parser.add_argument('--profile_interval', type=float, default=0.005,
+                        help="Seconds between profiler samples (default: 0.005)")
+    parser.add_argument('--log_format', choices=['text', 'json'], default='text',
+                        help="Write log records as text lines or as one JSON object per line (default: text)")
+    parser.add_argument('--log_level', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], default='INFO',
+                        help="Lowest level of log records written (default: INFO)")
+    parser.add_argument('--log_rate_limit', type=int, default=10,
+                        help="Info records of one kind, such as retries, written per second before the rest are dropped and counted, 0 for no limit (default: 10)")
+    return parser
+
+
+def main():
+    parser = build_parser()
     args = parser.parse_args()
 
+    # Records are formatted and written by a background thread.
+    logs = configure_logging(level=getattr(logging, args.log_level), log_format=args.log_format,
+                             rate_limit_burst=args.log_rate_limit)
+    with ExitStack() as cleanup:
+        cleanup.callback(logs.stop)
+        cleanup.enter_context(profiled(args.profile_file, args.profile_interval))
+        run_operation(args, parser, cleanup)
+
+
+def build_client_options(args, simulation, clock, tracer=None, dns_cache=None):
+    # ClusterClient arguments from the command line, or from one cluster's
+    # settings layered over it.
+    max_retries = args.max_retries
+    retry_timeout = args.retry_timeout
+    return dict(simulation=simulation, max_retries=max_retries, retry_timeout=retry_timeout,
+                rollback_file=rollback_file_path, rollback_parallelism=args.rollback_parallelism,
+                max_connections=args.max_connections, keepalive_expiry=args.keepalive_expiry,
+                http2=args.http2, dns_cache=dns_cache,
+                health=HostHealth(failure_threshold=args.failure_threshold,
+                                  recovery_timeout=args.recovery_timeout, clock=clock),
+                retry_policy=RetryPolicy(max_attempts=max_retries, base_delay=retry_timeout,
+                                         budget=RetryBudget(ratio=args.retry_budget, clock=clock),
+                                         rng=simulation.rng() if simulation is not None else None),
+                limits=HostLimits(rate=args.rate_limit, burst=args.rate_burst,
+                                  initial_limit=args.max_connections,
+                                  max_limit=args.max_connections, clock=clock),
+                tracer=tracer, host_ordering=args.host_ordering, readiness_check=args.readiness_check,
+                hedging=HedgePolicy(percentile=args.hedge_percentile, max_outstanding=args.max_hedges)
+                if args.hedge_percentile else None,
+                operation_timeout=args.operation_timeout,
+                status_cache=StatusCache(ttl=args.status_cache_ttl, max_entries=args.status_cache_size,
+                                         clock=clock)
+                if args.status_cache_ttl > 0 else None)
+
+
+def build_cluster_clients(args, clusters, clusters_dir, simulation, clock, tracer=None, dns_cache=None):
+    # One ClusterClient per named cluster. They share a connection pool (or
+    # the simulation) and one set of metrics, and each has its own journal.
+    pool = None
+    if simulation is None:
+        pool = ConnectionPool(max_connections=args.max_connections, max_keepalive_connections=args.max_connections,
+                              keepalive_expiry=args.keepalive_expiry, http2=args.http2, dns_cache=dns_cache)
+    metrics = ClientMetrics()
+    clients = {}
+    for name, settings in clusters.items():
+        cluster_args = argparse.Namespace(**{**vars(args), **settings})
+        if 'hosts' in settings:
+            hosts = [host.name for host in parse_hosts(settings['hosts'], cluster_args.hosts_selector)]
+        else:
+            hosts = read_hosts_file(clusters_dir / settings['hosts_file'], cluster_args.hosts_selector)
+        if not hosts:
+            raise ValueError(f"No hosts found for cluster {name}")
+        if dns_cache is not None:
+            dns_cache.pre_resolve(hosts)
+        options = build_client_options(cluster_args, simulation, clock, tracer, dns_cache)
+        options.update(pool=pool, metrics=metrics,
+                       rollback_file=rollback_file_path.with_name(f'rollback.{name}.journal'))
+        clients[name] = ClusterClient(hosts, **options)
+    metrics.pending_rollbacks.function = lambda: sum(len(client.journal.pending()) for client in clients.values())
+    return MultiClusterClient(clients, pool=pool, metrics=metrics)
+
+
+def run_clusters(args, parser, simulation, clock, tracer=None, dns_cache=None):
+    try:
+        clusters = read_clusters_file(args.clusters)
+        multi = build_cluster_clients(args, clusters, Path(args.clusters).parent, simulation, clock,
+                                      tracer, dns_cache)
+    except (OSError, ValueError) as e:
+        parser.error(f"Cannot use clusters file {args.clusters}: {e}")
+    with multi:
+        logger.info(f"Running {args.operation} on clusters {', '.join(multi.clusters)}")
+        results = multi.run_operation(args.operation, args.group_name)
+        if args.metrics_file:
+            multi.metrics.write_textfile(args.metrics_file)
+    if args.ndjson:
+        for name, result in results.items():
+            print(json.dumps({'cluster': name, 'operation': args.operation, 'group_name': args.group_name,
+                              **result}), flush=True)
+    else:
+        print(json.dumps(results, indent=2))
+    return results
+
+
+def run_operation(args, parser, cleanup):
     group_name = args.group_name
     operation = args.operation
     simulate = args.simulate
-    max_retries = args.max_retries
-    retry_timeout = args.retry_timeout
+
+    if not operation and not args.batch:
+        parser.error("one of --operation or --batch is required.")
 
     if operation in ['create', 'delete', 'status'] and not group_name:
         parser.error(
             "--group_name is required for create, delete, and status operations.")
 
-    hosts = read_hosts_file(hosts_file_path)
+    if operation == 'reconcile' and not args.desired_state:
+        parser.error("--desired_state is required for the reconcile operation.")
+
+    if operation == 'sweep' and not args.groups_file:
+        parser.error("--groups_file is required for the sweep operation.")
+
+    if args.batch and args.workers > 1 and not args.worker_id:
+        parser.error("--worker_id is required when --workers is more than 1.")
+
+    try:
+        parse_selector(args.hosts_selector)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.clusters and (args.batch or operation not in MULTI_CLUSTER_OPERATIONS):
+        parser.error("--clusters supports the create, delete, status and rollback operations.")
+
+    simulation = SimulatedCluster(seed=args.seed, latency=args.simulated_latency,
+                                  failure_rate=args.simulated_failure_rate,
+                                  timeout_rate=args.simulated_timeout_rate) if simulate else None
+    clock = simulation.clock if simulation is not None else time.monotonic
+    # Simulated hosts are never resolved.
+    dns_cache = DnsCache(ttl=args.dns_ttl) if simulation is None and args.dns_ttl > 0 else None
+    tracer = None
+    if args.trace_file:
+        tracer = Tracer(span_exporter(args.trace_file), clock=clock)
+        cleanup.callback(tracer.close)
+
+    if args.clusters:
+        run_clusters(args, parser, simulation, clock, tracer, dns_cache)
+        return
+
+    hosts = read_hosts_file(args.hosts_file, args.hosts_selector)
     if not hosts:
-        logger.error("No hosts found in hosts.txt")
+        logger.error(f"No hosts found in {args.hosts_file}")
+        return
+    if dns_cache is not None:
+        dns_cache.pre_resolve(hosts)
+    client_options = build_client_options(args, simulation, clock, tracer, dns_cache)
+    # Only the async clients behind batch, reconcile and sweep batch requests:
+    # the sync client sends one group's requests at a time.
+    async_options = dict(client_options, bulk=BulkPolicy(max_batch=args.bulk_max_batch,
+                                                         max_delay=args.bulk_max_delay)
+                         if args.bulk else None)
+
+    if args.batch and args.workers > 1:
+        # Each worker replays only its own rollbacks, so workers sharing a
+        # directory need their own journal.
+        async_options['rollback_file'] = rollback_file_path.with_name(f'rollback.{args.worker_id}.journal')
+        client = AsyncClusterClient(hosts, **async_options)
+        store = LeaseStore(args.lease_store)
+        worker = PartitionedWorker(store, args.worker_id, expected_workers=args.workers)
+        run = simulation.run if simulation is not None else asyncio.run
+        try:
+            summary = run(run_partitioned_batch_file(
+                client, args.batch, worker, max_in_flight=args.max_in_flight))
+        finally:
+            store.close()
+        write_metrics(client, args.metrics_file)
+        logger.info(
+            f"Worker {args.worker_id} finished its share of the batch: {summary['total']} records, "
+            f"{summary['succeeded']} succeeded, {summary['failed']} failed")
+        return
+
+    if args.batch:
+        client = AsyncClusterClient(hosts, **async_options)
+        import_legacy_rollback_file(client)
+        run = simulation.run if simulation is not None else asyncio.run
+        summary = run(run_batch_file(
+            client, args.batch, max_in_flight=args.max_in_flight))
+        write_metrics(client, args.metrics_file)
+        logger.info(
+            f"Batch finished: {summary['total']} records, {summary['succeeded']} succeeded, {summary['failed']} failed")
+        return
+
+    if operation == 'reconcile':
+        client = AsyncClusterClient(hosts, **async_options)
+        import_legacy_rollback_file(client)
+        run = simulation.run if simulation is not None else asyncio.run
+        summary = run(reconcile_file(client, args.desired_state, managed_groups_file_path,
+                                     max_in_flight=args.max_in_flight, dry_run=args.dry_run))
+        write_metrics(client, args.metrics_file)
+        if args.dry_run:
+            print(json.dumps(summary['plan'], indent=2))
+        logger.info(
+            f"Reconcile finished: {summary['groups']} groups, {summary['creates']} creates, "
+            f"{summary['deletes']} deletes, unknown {summary['unknown']}, failed {summary['failed']}")
         return
 
-    client = ClusterClient(hosts, simulate=simulate,
-                           max_retries=max_retries, retry_timeout=retry_timeout, rollback_file=rollback_file_path)
+    if operation == 'sweep':
+        client = AsyncClusterClient(hosts, **async_options)
+        run = simulation.run if simulation is not None else asyncio.run
+        summary = run(sweep_file(client, args.groups_file, membership_snapshot_path,
+                                 max_in_flight=args.max_in_flight, full=args.full_sweep))
+        write_metrics(client, args.metrics_file)
+        print(json.dumps(summary, indent=2))
+        return
+
+    if operation == 'serve':
+        client = ClusterClient(hosts, **client_options)
+        import_legacy_rollback_file(client)
+        inventory = HostInventory(args.hosts_file, args.hosts_selector)
+        inventory.load()
+        inventory.watch(lambda hosts: follow_hosts(client, hosts, dns_cache), args.hosts_reload_interval)
+        cleanup.callback(inventory.stop)
+        service = ClusterService(client, max_concurrency=args.service_concurrency,
+                                 max_queue=args.service_queue)
+        serve(service, listen=args.listen, unix_socket=args.unix_socket)
+        return
 
-    perform_operation(client=client, operation=operation,
-                      group_name=group_name)
+    with ClusterClient(hosts, **client_options) as client:
+        import_legacy_rollback_file(client)
+        perform_operation(client=client, operation=operation,
+                          group_name=group_name, ndjson=args.ndjson)
+    write_metrics(client, args.metrics_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import os
+import tempfile
+import zlib
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from app.async_cluster_client import AsyncClusterClient
+from app.reconcile import read_desired_state
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+def _members(bits: int) -> Iterator[int]:
+    # Positions of the set bits, lowest first, in one pass over the bitmap.
+    digits = bin(bits)[:1:-1]
+    position = digits.find('1')
+    while position != -1:
+        yield position
+        position = digits.find('1', position + 1)
+
+
+class MembershipIndex:
+    # Which hosts have which groups, as two bitmaps per host with one bit per
+    # group: `known` is set once the host answered for the group and `present`
+    # when it has it. 100k groups on 1k hosts take about 25 MB. Results are
+    # set in place in bytearrays; queries turn each bitmap into an int once
+    # and combine whole bitmaps with bitwise operations.
+    def __init__(self, hosts: List[str]):
+        self.hosts = list(hosts)
+        self.groups: List[str] = []
+        self._positions: Dict[str, int] = {}
+        self._present = {host: bytearray() for host in self.hosts}
+        self._known = {host: bytearray() for host in self.hosts}
+
+    def __len__(self):
+        return len(self.groups)
+
+    def __contains__(self, group_id):
+        return group_id in self._positions
+
+    def add_group(self, group_id: str) -> int:
+        position = self._positions.get(group_id)
+        if position is None:
+            position = self._positions[group_id] = len(self.groups)
+            self.groups.append(group_id)
+            size = len(self._present[self.hosts[0]]) if self.hosts else 0
+            if position // 8 >= size:
+                grow = max(size, 1024)
+                for bitmap in (*self._present.values(), *self._known.values()):
+                    bitmap.extend(bytes(grow))
+        return position
+
+    def record(self, group_id: str, host: str, exists: Optional[bool]):
+        self.record_status(group_id, {host: exists}, [host])
+
+    def record_status(self, group_id: str, status: Dict[str, Optional[bool]], hosts: Optional[List[str]] = None):
+        # A host missing from status, or None (host unavailable), clears what
+        # an earlier sweep knew.
+        position = self.add_group(group_id)
+        byte, bit = position // 8, 1 << position % 8
+        clear = ~bit
+        for host in self.hosts if hosts is None else hosts:
+            exists = status.get(host)
+            if exists is None:
+                self._known[host][byte] &= clear
+                self._present[host][byte] &= clear
+            else:
+                self._known[host][byte] |= bit
+                if exists:
+                    self._present[host][byte] |= bit
+                else:
+                    self._present[host][byte] &= clear
+
+    def status(self, group_id: str) -> Dict[str, Optional[bool]]:
+        position = self._positions.get(group_id)
+        status = {}
+        for host in self.hosts:
+            if position is None or not self._known[host][position // 8] >> position % 8 & 1:
+                status[host] = None
+            else:
+                status[host] = bool(self._present[host][position // 8] >> position % 8 & 1)
+        return status
+
+    def _everything(self) -> int:
+        return (1 << len(self.groups)) - 1
+
+    @staticmethod
+    def _bits(bitmap: bytearray) -> int:
+        return int.from_bytes(bitmap, 'little')
+
+    def _groups(self, bits: int) -> List[str]:
+        return [self.groups[position] for position in _members(bits)]
+
+    def present_on(self, host: str) -> List[str]:
+        return self._groups(self._bits(self._present[host]))
+
+    def missing_on(self, host: str) -> List[str]:
+        return self._groups(self._bits(self._known[host]) & ~self._bits(self._present[host]))
+
+    def unknown_on(self, host: str) -> List[str]:
+        return self._groups(self._everything() & ~self._bits(self._known[host]))
+
+    def _any_present(self) -> int:
+        bits = 0
+        for host in self.hosts:
+            bits |= self._bits(self._present[host])
+        return bits
+
+    def _any_missing(self) -> int:
+        bits = 0
+        for host in self.hosts:
+            bits |= self._bits(self._known[host]) & ~self._bits(self._present[host])
+        return bits
+
+    def _all_known(self) -> int:
+        bits = self._everything()
+        for host in self.hosts:
+            bits &= self._bits(self._known[host])
+        return bits
+
+    def inconsistent(self) -> List[str]:
+        # Groups some host has and another known host does not.
+        return self._groups(self._any_present() & self._any_missing())
+
+    def incomplete(self) -> List[str]:
+        # Groups at least one host has not answered for.
+        return self._groups(self._everything() & ~self._all_known())
+
+    def stale(self, groups: Iterable[str]) -> List[str]:
+        # What an incremental sweep has to read again: groups not in the
+        # index, with a host that has not answered, or inconsistent.
+        recheck = (self._any_present() & self._any_missing()) | ~self._all_known()
+        return [group_id for group_id in groups
+                if group_id not in self._positions or recheck >> self._positions[group_id] & 1]
+
+    def save(self, file_path):
+        # A JSON header line, the group IDs one per line, then each host's
+        # bitmaps as little-endian bytes, all zlib-compressed and replaced
+        # atomically so a crash keeps the previous snapshot.
+        size = (len(self.groups) + 7) // 8
+        header = {'version': SNAPSHOT_VERSION, 'hosts': self.hosts, 'groups': len(self.groups), 'bytes': size}
+        compressor = zlib.compressobj()
+        directory = os.path.dirname(os.path.abspath(file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.membership-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(compressor.compress(json.dumps(header).encode() + b'\n'))
+                for group_id in self.groups:
+                    file.write(compressor.compress(group_id.encode() + b'\n'))
+                for host in self.hosts:
+                    file.write(compressor.compress(self._present[host][:size]))
+                    file.write(compressor.compress(self._known[host][:size]))
+                file.write(compressor.flush())
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, file_path, hosts: Optional[List[str]] = None) -> 'MembershipIndex':
+        # Hosts that were not in the snapshot start out unknown, and hosts no
+        # longer listed in `hosts` are dropped.
+        with open(file_path, 'rb') as file:
+            data = zlib.decompress(file.read())
+        header_end = data.index(b'\n')
+        header = json.loads(data[:header_end])
+        if header.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported membership snapshot version: {header.get('version')}")
+        offset = header_end + 1
+        groups = []
+        for _ in range(header['groups']):
+            end = data.index(b'\n', offset)
+            groups.append(data[offset:end].decode())
+            offset = end + 1
+        index = cls(hosts if hosts is not None else header['hosts'])
+        index.groups = groups
+        index._positions = {group_id: position for position, group_id in enumerate(groups)}
+        size = header['bytes']
+        for host in header['hosts']:
+            present = bytearray(data[offset:offset + size])
+            known = bytearray(data[offset + size:offset + 2 * size])
+            offset += 2 * size
+            if host in index._present:
+                index._present[host] = present
+                index._known[host] = known
+        for host in index.hosts:
+            if host not in header['hosts']:
+                index._present[host] = bytearray(size)
+                index._known[host] = bytearray(size)
+        return index
+
+
+async def sweep(client: AsyncClusterClient, groups: Iterable[str], index: Optional[MembershipIndex] = None,
+                max_in_flight: int = 100, full: bool = False) -> MembershipIndex:
+    # Reads the status of `groups` into the index. Without `full`, groups the
+    # index already has complete and consistent are not read again. A fixed
+    # set of workers pulls from the groups so a large sweep never holds more
+    # than max_in_flight statuses at once.
+    if index is None:
+        index = MembershipIndex(client.hosts)
+    pending = iter(groups if full else index.stale(groups))
+
+    async def worker():
+        for group_id in pending:
+            index.record_status(group_id, await client.get_group_status(group_id))
+
+    await asyncio.gather(*(worker() for _ in range(max_in_flight)))
+    return index
+
+
+async def sweep_file(client: AsyncClusterClient, groups_path, snapshot_path=None,
+                     max_in_flight: int = 100, full: bool = False) -> Dict:
+    groups = read_desired_state(groups_path)
+    index = None
+    if snapshot_path is not None and os.path.exists(snapshot_path):
+        index = MembershipIndex.load(snapshot_path, client.hosts)
+    async with client:
+        index = await sweep(client, groups, index, max_in_flight=max_in_flight, full=full)
+    if snapshot_path is not None:
+        index.save(snapshot_path)
+    wanted = set(groups)
+    return {'groups': len(groups),
+            'missing': {host: sum(1 for group_id in index.missing_on(host) if group_id in wanted)
+                        for host in index.hosts},
+            'inconsistent': [group_id for group_id in index.inconsistent() if group_id in wanted],
+            'unknown': [group_id for group_id in index.incomplete() if group_id in wanted]}
@@ -0,0 +1,208 @@
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Request latencies in seconds, from a fast local node up to the request timeout.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}"
+                for key, value in sorted(values)]
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation)
+        self._value = 0
+        self.function = function
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float):
+        self._value = value
+
+    def value(self) -> float:
+        # A gauge backed by a function is only evaluated when scraped.
+        return self.function() if self.function is not None else self._value
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.value())}"]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum].
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return sum(series[0]) if series is not None else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total) for key, (counts, total) in self._series.items()]
+        lines = []
+        for key, counts, total in sorted(series):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        # Prometheus text exposition format, version 0.0.4.
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path: str):
+        # Written to a temporary file and renamed, so the node exporter's
+        # textfile collector never reads a half-written file.
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                file.write(self.render())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+class ClientMetrics:
+    # The instruments ClusterClient records into. Request paths only touch
+    # counters and histograms; journal-backed gauges are computed when scraped.
+    def __init__(self, registry: Optional[Registry] = None, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.registry = registry or Registry()
+        register = self.registry.register
+        self.request_duration = register(Histogram(
+            'cluster_client_request_duration_seconds', "Duration of each request attempt.",
+            ('host', 'operation'), buckets))
+        self.attempts = register(Counter(
+            'cluster_client_attempts_total', "Request attempts sent.", ('host', 'operation')))
+        self.retries = register(Counter(
+            'cluster_client_retries_total', "Attempts retried after a failure.", ('host', 'operation')))
+        self.http_errors = register(Counter(
+            'cluster_client_http_errors_total', "Responses with a 4xx or 5xx status.",
+            ('host', 'operation', 'status_class')))
+        self.timeouts = register(Counter(
+            'cluster_client_timeouts_total', "Attempts that timed out.", ('host', 'operation')))
+        self.hedges = register(Counter(
+            'cluster_client_hedged_requests_total', "Second status reads sent because the first was slow.",
+            ('host',)))
+        self.coalesced = register(Counter(
+            'cluster_client_coalesced_operations_total',
+            "Operations that shared an identical in-flight operation's result instead of sending requests.",
+            ('operation',)))
+        self.bulk_items = register(Counter(
+            'cluster_client_bulk_items_total',
+            "Group requests queued for bulk requests, by whether the bulk answer settled them or they were resent singly.",
+            ('host', 'result')))
+        self.rollbacks = register(Counter(
+            'cluster_client_rollbacks_total', "Rollback requests sent, one per host.", ('operation',)))
+        self.rollback_failures = register(Counter(
+            'cluster_client_rollback_failures_total', "Rollback requests that failed and stay pending.",
+            ('operation',)))
+        self.in_flight = register(Gauge(
+            'cluster_client_in_flight_requests', "Requests waiting for a response."))
+        self.pending_rollbacks = register(Gauge(
+            'cluster_client_pending_rollbacks', "Entries in the rollback journal with hosts left to replay."))
+
+    def record_status(self, host: str, operation: str, status_code: int):
+        self.http_errors.inc(host, operation, f"{status_code // 100}xx")
+
+    def render(self) -> str:
+        return self.registry.render()
+
+    def write_textfile(self, path: str):
+        self.registry.write_textfile(path)
@@ -0,0 +1,123 @@
+import contextvars
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TypeVar
+
+from app.cluster_client import ClusterClient
+from app.connection_pool import ConnectionPool
+from app.metrics import ClientMetrics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# What a cluster in a clusters file may set; anything else comes from the command line.
+CLUSTER_SETTINGS = ('hosts', 'hosts_file', 'hosts_selector', 'max_retries', 'retry_timeout', 'operation_timeout',
+                    'retry_budget', 'rollback_parallelism')
+
+
+def read_clusters_file(file_path) -> Dict[str, Dict]:
+    # {"east": {"hosts_file": "east.txt", "max_retries": 3},
+    #  "west": {"hosts": ["node1.west", "node2.west"], "retry_timeout": 2}}
+    with open(file_path, 'r') as file:
+        clusters = json.load(file)
+    if not isinstance(clusters, dict) or not clusters:
+        raise ValueError("The clusters file must map cluster names to their settings")
+    for name, settings in clusters.items():
+        if not isinstance(settings, dict):
+            raise ValueError(f"Settings of cluster {name} must be an object")
+        unknown = sorted(set(settings) - set(CLUSTER_SETTINGS))
+        if unknown:
+            raise ValueError(f"Unknown settings for cluster {name}: {', '.join(unknown)}")
+        if ('hosts' in settings) == ('hosts_file' in settings):
+            raise ValueError(f"Cluster {name} needs exactly one of hosts or hosts_file")
+        if 'hosts' in settings and not (isinstance(settings['hosts'], list) and settings['hosts']):
+            raise ValueError(f"hosts of cluster {name} must be a non-empty list")
+    return clusters
+
+
+def run_cluster_operation(client: ClusterClient, operation: str, group_id: Optional[str] = None) -> Dict:
+    # One cluster's share of an operation, as main.perform_operation runs it.
+    if operation in ('create', 'delete'):
+        client.start_rollback_drain()
+        if not client.wait_for_rollbacks(group_id):
+            return {'success': False, 'error': "Pending rollbacks for this group failed"}
+        mutation = client.create_group if operation == 'create' else client.delete_group
+        return {'success': mutation(group_id)}
+    if operation == 'status':
+        status = client.get_group_status(group_id)
+        return {'success': bool(status), 'status': status}
+    if operation == 'rollback':
+        return {'success': client.continue_rollbacks()}
+    raise ValueError(f"Unsupported operation for several clusters: {operation}")
+
+
+class MultiClusterClient:
+    # Runs each operation on every named cluster at once, one thread per
+    # cluster, so a rollout takes as long as the slowest cluster rather than
+    # the sum of all of them. Each cluster keeps its own ClusterClient, with
+    # its own hosts, retry settings, circuit breakers and rollback journal.
+    # A pool passed in is shared by the clusters and closed with them, and
+    # metrics passed in are the ones the clusters record into.
+    def __init__(self, clusters: Dict[str, ClusterClient], pool: Optional[ConnectionPool] = None,
+                 metrics: Optional[ClientMetrics] = None):
+        self.clusters = clusters
+        self.pool = pool
+        self.metrics = metrics
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(clusters)), thread_name_prefix='cluster')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        for client in self.clusters.values():
+            client.close()
+        if self.pool is not None:
+            self.pool.close()
+
+    def _run_all(self, function: Callable[[str, ClusterClient], T]) -> Dict[str, T]:
+        # The context carries the current span into each cluster's thread.
+        futures = {name: self._executor.submit(contextvars.copy_context().run, function, name, client)
+                   for name, client in self.clusters.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+    def create_group(self, group_id: str) -> Dict[str, bool]:
+        return self._run_all(lambda name, client: client.create_group(group_id))
+
+    def delete_group(self, group_id: str) -> Dict[str, bool]:
+        return self._run_all(lambda name, client: client.delete_group(group_id))
+
+    def get_group_status(self, group_id: str) -> Dict[str, Dict[str, Optional[bool]]]:
+        return self._run_all(lambda name, client: client.get_group_status(group_id))
+
+    def continue_rollbacks(self) -> Dict[str, bool]:
+        return self._run_all(lambda name, client: client.continue_rollbacks())
+
+    def pending_rollbacks(self) -> Dict[str, List[Dict]]:
+        return {name: [{'group_id': entry.group_id, 'operation': entry.operation, 'hosts': entry.hosts}
+                       for entry in client.journal.pending()]
+                for name, client in self.clusters.items()}
+
+    def run_operation(self, operation: str, group_id: Optional[str] = None) -> Dict[str, Dict]:
+        # Each cluster's result with the rollbacks it still has pending. A
+        # cluster that raises is reported as failed without stopping the rest.
+        def run(name: str, client: ClusterClient) -> Dict:
+            try:
+                result = run_cluster_operation(client, operation, group_id)
+            except Exception as e:
+                logger.exception("%s failed on cluster %s", operation, name, extra={'cluster': name})
+                result = {'success': False, 'error': str(e)}
+            level = logging.INFO if result['success'] else logging.ERROR
+            logger.log(level, f"{operation} {'succeeded' if result['success'] else 'failed'} on cluster {name}",
+                       extra={'cluster': name, 'group': group_id})
+            return result
+
+        results = self._run_all(run)
+        for name, pending in self.pending_rollbacks().items():
+            results[name]['pending_rollbacks'] = pending
+        return results
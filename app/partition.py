@@ -0,0 +1,237 @@
+import asyncio
+import bisect
+import hashlib
+import sqlite3
+import sys
+import threading
+import time
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, TextIO
+
+from app.async_cluster_client import AsyncClusterClient
+from app.batch import _run_record, read_batch_file, run_batch
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    # Consistent hashing of group IDs onto workers. Each worker gets
+    # `replicas` points on the ring, so adding or removing one worker only
+    # moves about 1/N of the groups.
+    def __init__(self, workers: Iterable[str], replicas: int = 100):
+        self.workers = sorted(set(workers))
+        points = sorted((_hash(f'{worker}#{replica}'), worker)
+                        for worker in self.workers for replica in range(replicas))
+        self._points = [point for point, _ in points]
+        self._owners = [worker for _, worker in points]
+
+    def owner(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+class LeaseStore:
+    # Live workers and per-group leases in one SQLite file that every worker
+    # opens: a local stand-in for a shared store such as etcd. Expiry times
+    # are wall-clock so separate processes agree on them. Workers and leases
+    # that are not renewed within `ttl` seconds are treated as gone. Groups
+    # with rollbacks pending in a worker's journal are recorded too, without
+    # expiry, since only that worker can replay them.
+    def __init__(self, path, ttl: float = 30.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS workers (worker_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS leases (group_id TEXT PRIMARY KEY, worker_id TEXT NOT NULL, '
+            'expires_at REAL NOT NULL)')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS rollbacks (group_id TEXT NOT NULL, worker_id TEXT NOT NULL, '
+            'PRIMARY KEY (group_id, worker_id))')
+
+    def _execute(self, statement: str, parameters=()) -> int:
+        # The connection is shared between threads, so a statement's row
+        # count, like a query's rows, is read before the lock is released.
+        with self._lock:
+            return self._connection.execute(statement, parameters).rowcount
+
+    def _query(self, statement: str, parameters=()) -> List[tuple]:
+        with self._lock:
+            return self._connection.execute(statement, parameters).fetchall()
+
+    def heartbeat(self, worker_id: str):
+        # Registers the worker, or keeps it registered, and renews its leases.
+        now = self._clock()
+        self._execute('INSERT INTO workers (worker_id, expires_at) VALUES (?, ?) '
+                      'ON CONFLICT(worker_id) DO UPDATE SET expires_at = excluded.expires_at',
+                      (worker_id, now + self.ttl))
+        self._execute('UPDATE leases SET expires_at = ? WHERE worker_id = ? AND expires_at > ?',
+                      (now + self.ttl, worker_id, now))
+
+    def leave(self, worker_id: str):
+        # The worker stays registered until its heartbeat expires, so one that
+        # finishes quickly is still counted by workers that are still joining.
+        self._execute('DELETE FROM leases WHERE worker_id = ?', (worker_id,))
+
+    def live_workers(self) -> List[str]:
+        rows = self._query('SELECT worker_id FROM workers WHERE expires_at > ? ORDER BY worker_id',
+                           (self._clock(),))
+        return [worker_id for worker_id, in rows]
+
+    def acquire(self, group_id: str, worker_id: str) -> bool:
+        # One statement, so two workers racing for a group cannot both win.
+        # The holder may re-acquire; anyone may take an expired lease, unless
+        # another worker still has rollbacks pending for the group.
+        now = self._clock()
+        changed = self._execute(
+            'INSERT INTO leases (group_id, worker_id, expires_at) SELECT ?, ?, ? '
+            'WHERE NOT EXISTS (SELECT 1 FROM rollbacks WHERE group_id = ? AND worker_id != ?) '
+            'ON CONFLICT(group_id) DO UPDATE SET worker_id = excluded.worker_id, expires_at = excluded.expires_at '
+            'WHERE leases.worker_id = excluded.worker_id OR leases.expires_at <= ?',
+            (group_id, worker_id, now + self.ttl, group_id, worker_id, now))
+        return changed == 1
+
+    def set_rollback_pending(self, group_id: str, worker_id: str, pending: bool):
+        if pending:
+            self._execute('INSERT OR IGNORE INTO rollbacks (group_id, worker_id) VALUES (?, ?)', (group_id, worker_id))
+        else:
+            self._execute('DELETE FROM rollbacks WHERE group_id = ? AND worker_id = ?', (group_id, worker_id))
+
+    def replace_rollbacks(self, worker_id: str, group_ids: Iterable[str]):
+        # Records exactly the groups the worker's journal has pending.
+        with self._lock:
+            with self._connection:
+                self._connection.execute('BEGIN IMMEDIATE')
+                self._connection.execute('DELETE FROM rollbacks WHERE worker_id = ?', (worker_id,))
+                self._connection.executemany('INSERT INTO rollbacks (group_id, worker_id) VALUES (?, ?)',
+                                             [(group_id, worker_id) for group_id in set(group_ids)])
+
+    def pending_rollbacks(self, group_id: str) -> List[str]:
+        # The workers with rollbacks pending for the group.
+        rows = self._query('SELECT worker_id FROM rollbacks WHERE group_id = ? ORDER BY worker_id',
+                           (group_id,))
+        return [worker_id for worker_id, in rows]
+
+    def release(self, group_id: str, worker_id: str):
+        self._execute('DELETE FROM leases WHERE group_id = ? AND worker_id = ?', (group_id, worker_id))
+
+    def holder(self, group_id: str) -> Optional[str]:
+        rows = self._query('SELECT worker_id FROM leases WHERE group_id = ? AND expires_at > ?',
+                           (group_id, self._clock()))
+        return rows[0][0] if rows else None
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class PartitionedWorker:
+    # One of several workers splitting a batch. Once `expected_workers` have
+    # registered, the ring of live workers is fixed for the run and each
+    # worker only takes the records of the groups it owns. A lease is held
+    # on every group while its record runs, so even if rings disagree (a
+    # worker joined late, or a stale one had not expired) no group is worked
+    # on by two workers at once. A group whose rollback is still pending in
+    # this worker's journal is recorded in the store, and other workers keep
+    # off it until this worker, under the same worker_id, has replayed it.
+    def __init__(self, store: LeaseStore, worker_id: str, expected_workers: int = 1,
+                 join_timeout: float = 60.0, replicas: int = 100):
+        self.store = store
+        self.worker_id = worker_id
+        self.expected_workers = expected_workers
+        self.join_timeout = join_timeout
+        self.replicas = replicas
+        self.ring = HashRing([worker_id], replicas)
+
+    async def _store(self, method, *args):
+        # SQLite writes fsync, so keep them off the event loop.
+        return await asyncio.get_event_loop().run_in_executor(None, method, *args)
+
+    async def join(self) -> List[str]:
+        loop = asyncio.get_event_loop()
+        expires_at = loop.time() + self.join_timeout
+        while True:
+            await self._store(self.store.heartbeat, self.worker_id)
+            workers = await self._store(self.store.live_workers)
+            if len(workers) >= self.expected_workers or loop.time() >= expires_at:
+                break
+            await asyncio.sleep(min(1.0, self.store.ttl / 3))
+        if len(workers) < self.expected_workers:
+            logger.warning("Only %d of %d workers joined. Splitting the batch between them",
+                           len(workers), self.expected_workers)
+        self.ring = HashRing(workers, self.replicas)
+        logger.info("Worker %s joined with %d workers", self.worker_id, len(workers))
+        return workers
+
+    async def keep_alive(self):
+        while True:
+            await asyncio.sleep(self.store.ttl / 3)
+            await self._store(self.store.heartbeat, self.worker_id)
+
+    async def leave(self):
+        await self._store(self.store.leave, self.worker_id)
+
+    async def publish_rollbacks(self, client: AsyncClusterClient):
+        groups = [entry.group_id for entry in client.journal.pending()]
+        await self._store(self.store.replace_rollbacks, self.worker_id, groups)
+
+    def owns(self, record: Dict) -> bool:
+        # Records without a group (invalid ones) are reported by a single worker.
+        return self.ring.owner(record.get('group_name') or '') == self.worker_id
+
+    async def run_record(self, client: AsyncClusterClient, record: Dict) -> Dict:
+        group_name = record.get('group_name')
+        if not group_name or 'error' in record:
+            return await _run_record(client, record)
+        # A lease held by a worker that went away expires after ttl.
+        loop = asyncio.get_event_loop()
+        expires_at = loop.time() + 2 * self.store.ttl
+        while not await self._store(self.store.acquire, group_name, self.worker_id):
+            if loop.time() >= expires_at:
+                return {'line': record['line'], 'operation': record.get('operation'), 'group_name': group_name,
+                        'success': False, 'error': "Group is leased by another worker"}
+            await asyncio.sleep(self.store.ttl / 10)
+        try:
+            result = await _run_record(client, record)
+            # Recorded before the lease goes, so no other worker can take the
+            # group in between.
+            pending = not await client.wait_for_rollbacks(group_name)
+            await self._store(self.store.set_rollback_pending, group_name, self.worker_id, pending)
+        finally:
+            await self._store(self.store.release, group_name, self.worker_id)
+        result['worker'] = self.worker_id
+        return result
+
+
+async def run_partitioned_batch(client: AsyncClusterClient, records: Iterable[Dict], worker: PartitionedWorker,
+                                output: TextIO = sys.stdout, max_in_flight: int = 100) -> Dict[str, int]:
+    # Rollbacks left from an earlier run of this worker are published before
+    # it joins, so no worker starts on those groups first.
+    await worker.publish_rollbacks(client)
+    await worker.join()
+    heartbeat = asyncio.ensure_future(worker.keep_alive())
+    try:
+        return await run_batch(client, (record for record in records if worker.owns(record)),
+                               output=output, max_in_flight=max_in_flight, run_record=worker.run_record)
+    finally:
+        heartbeat.cancel()
+        await worker.publish_rollbacks(client)
+        await worker.leave()
+
+
+async def run_partitioned_batch_file(client: AsyncClusterClient, file_path, worker: PartitionedWorker,
+                                     output: TextIO = sys.stdout, max_in_flight: int = 100) -> Dict[str, int]:
+    async with client:
+        client.start_rollback_drain()
+        return await run_partitioned_batch(client, read_batch_file(file_path), worker,
+                                           output=output, max_in_flight=max_in_flight)
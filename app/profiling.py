@@ -0,0 +1,81 @@
+import sys
+import threading
+import time
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    # Samples every thread's stack each `interval` seconds from a background
+    # thread. The profiled code is never traced or instrumented, so the
+    # overhead stays small enough to leave on under real load. Stacks are
+    # written in the folded format that flamegraph.pl and speedscope read.
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own:
+                    self.samples[self._stack(frame)] += 1
+
+    @staticmethod
+    def _stack(frame) -> str:
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def top(self, count: int = 10) -> List[Tuple[str, int]]:
+        # Functions by how many samples had them on top of the stack.
+        leaves: Counter = Counter()
+        for stack, samples in self.samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += samples
+        return leaves.most_common(count)
+
+    def write(self, file_path):
+        with open(file_path, 'w') as file:
+            for stack, samples in self.samples.most_common():
+                file.write(f"{stack} {samples}\n")
+
+
+@contextmanager
+def profiled(file_path: Optional[str], interval: float = 0.005):
+    # Profiles the block when file_path is set, then writes the folded
+    # stacks there and logs the hottest functions.
+    if not file_path:
+        yield None
+        return
+    profiler = SamplingProfiler(interval)
+    profiler.start()
+    started = time.monotonic()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        profiler.write(file_path)
+        logger.info("Profiled %.1fs, %d samples written to %s",
+                    time.monotonic() - started, sum(profiler.samples.values()), file_path)
+        for function, samples in profiler.top(5):
+            logger.info("  %d samples in %s", samples, function)
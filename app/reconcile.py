@@ -0,0 +1,138 @@
+import asyncio
+import json
+import os
+import tempfile
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set
+
+from app.async_cluster_client import AsyncClusterClient
+
+logger = logging.getLogger(__name__)
+
+
+def read_desired_state(file_path) -> List[str]:
+    # One group ID per line; blank lines and lines starting with # are skipped.
+    groups = []
+    seen = set()
+    with open(file_path, 'r') as file:
+        for line in file:
+            group_id = line.strip()
+            if group_id and not group_id.startswith('#') and group_id not in seen:
+                seen.add(group_id)
+                groups.append(group_id)
+    return groups
+
+
+def read_managed_groups(file_path) -> Set[str]:
+    # Groups a previous reconcile put in place. Without a list endpoint on the
+    # nodes, this is how a group dropped from the desired state is found.
+    if file_path is None or not os.path.exists(file_path):
+        return set()
+    with open(file_path, 'r') as file:
+        return set(json.load(file))
+
+
+def write_managed_groups(file_path, groups: Iterable[str]):
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.managed-')
+    try:
+        with os.fdopen(fd, 'w') as file:
+            json.dump(sorted(groups), file)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+@dataclass
+class ReconcilePlan:
+    # Per group, the hosts that need a create or a delete. Groups with a host
+    # whose state is unknown are left alone rather than half-applied.
+    creates: Dict[str, List[str]] = field(default_factory=dict)
+    deletes: Dict[str, List[str]] = field(default_factory=dict)
+    unknown: Dict[str, List[str]] = field(default_factory=dict)
+
+    def is_empty(self) -> bool:
+        return not self.creates and not self.deletes
+
+    def to_record(self) -> Dict:
+        return {'creates': self.creates, 'deletes': self.deletes, 'unknown': self.unknown}
+
+
+def plan(desired: Iterable[str], statuses: Dict[str, Dict[str, Optional[bool]]]) -> ReconcilePlan:
+    desired = set(desired)
+    result = ReconcilePlan()
+    for group_id, status in statuses.items():
+        unknown = [host for host, exists in status.items() if exists is None]
+        if unknown:
+            result.unknown[group_id] = unknown
+            continue
+        if group_id in desired:
+            missing = [host for host, exists in status.items() if not exists]
+            if missing:
+                result.creates[group_id] = missing
+        else:
+            present = [host for host, exists in status.items() if exists]
+            if present:
+                result.deletes[group_id] = present
+    return result
+
+
+async def _bounded(coroutines, max_in_flight: int) -> List:
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def run(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    return await asyncio.gather(*(run(coroutine) for coroutine in coroutines))
+
+
+async def _apply_group(client: AsyncClusterClient, group_id: str, operation: str, hosts: List[str]) -> bool:
+    # Rollbacks that failed earlier are retried before the group is touched.
+    client.start_rollback_drain()
+    if not await client.wait_for_rollbacks(group_id):
+        logger.error("Pending rollbacks for group %s failed. Not reconciling it", group_id)
+        return False
+    if operation == 'create':
+        return await client.create_group(group_id, hosts)
+    return await client.delete_group(group_id, hosts)
+
+
+async def reconcile(client: AsyncClusterClient, desired: List[str], managed: Iterable[str] = (),
+                    max_in_flight: int = 100, dry_run: bool = False) -> Dict:
+    # Reads every desired or previously managed group on all hosts, then only
+    # writes to the hosts that differ. Each group's writes keep the usual
+    # rollback guarantee: a group fails as a whole and is rolled back.
+    groups = list(desired) + sorted(set(managed) - set(desired))
+    statuses = await _bounded((client.get_group_status(group_id) for group_id in groups), max_in_flight)
+    reconcile_plan = plan(desired, dict(zip(groups, statuses)))
+    summary = {'groups': len(groups),
+               'creates': sum(len(hosts) for hosts in reconcile_plan.creates.values()),
+               'deletes': sum(len(hosts) for hosts in reconcile_plan.deletes.values()),
+               'unknown': sorted(reconcile_plan.unknown), 'failed': []}
+    if dry_run:
+        summary['plan'] = reconcile_plan.to_record()
+        return summary
+
+    work = [(group_id, 'create', hosts) for group_id, hosts in reconcile_plan.creates.items()]
+    work += [(group_id, 'delete', hosts) for group_id, hosts in reconcile_plan.deletes.items()]
+    results = await _bounded((_apply_group(client, *item) for item in work), max_in_flight)
+    summary['failed'] = sorted(group_id for (group_id, _, _), success in zip(work, results) if not success)
+    return summary
+
+
+async def reconcile_file(client: AsyncClusterClient, desired_state_path, managed_groups_path=None,
+                         max_in_flight: int = 100, dry_run: bool = False) -> Dict:
+    desired = read_desired_state(desired_state_path)
+    managed = read_managed_groups(managed_groups_path)
+    async with client:
+        client.start_rollback_drain()
+        summary = await reconcile(client, desired, managed, max_in_flight=max_in_flight, dry_run=dry_run)
+    if managed_groups_path is not None and not dry_run:
+        # Groups that could not be removed, or whose state is unknown, stay
+        # managed so the next run tries again.
+        retained = (managed - set(desired)) & (set(summary['failed']) | set(summary['unknown']))
+        write_managed_groups(managed_groups_path, set(desired) | retained)
+    return summary
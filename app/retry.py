@@ -0,0 +1,90 @@
+import random
+import threading
+import time
+from typing import Callable, Optional
+
+
+class Deadline:
+    def __init__(self, timeout: Optional[float], clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self.expires_at = None if timeout is None else clock() + timeout
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - self._clock())
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def cap(self, timeout: float) -> float:
+        remaining = self.remaining()
+        return timeout if remaining is None else min(timeout, remaining)
+
+
+class RetryBudget:
+    # Caps retries at `ratio` of the requests sent, plus a small trickle of
+    # `min_per_second` so a quiet client can still retry at all.
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 10.0, max_tokens: float = 100.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._clock = clock
+        self._tokens = max_tokens
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, amount: float):
+        now = self._clock()
+        self._tokens = min(self.max_tokens, self._tokens + amount +
+                           (now - self._updated_at) * self.min_per_second)
+        self._updated_at = now
+
+    def record_request(self):
+        with self._lock:
+            self._refill(self.ratio)
+
+    def try_retry(self) -> bool:
+        with self._lock:
+            self._refill(0)
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 3, base_delay: float = 1.0, multiplier: float = 2.0, max_delay: float = 30.0,
+                 jitter: bool = True, budget: Optional[RetryBudget] = None, rng: Optional[random.Random] = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.budget = budget
+        self._rng = rng or random.Random()
+
+    def backoff(self, attempt: int) -> float:
+        # Full jitter: a uniform delay up to the exponential backoff, so clients
+        # that failed together do not retry together.
+        delay = min(self.max_delay, self.base_delay *
+                    self.multiplier ** (attempt - 1))
+        return self._rng.uniform(0, delay) if self.jitter else delay
+
+    def record_request(self):
+        if self.budget is not None:
+            self.budget.record_request()
+
+    def next_delay(self, attempt: int, deadline: Optional[Deadline] = None) -> Optional[float]:
+        # Returns how long to wait before the next attempt, or None to give up.
+        if attempt >= self.max_attempts:
+            return None
+        delay = self.backoff(attempt)
+        remaining = None if deadline is None else deadline.remaining()
+        if remaining is not None and remaining <= delay:
+            return None
+        if self.budget is not None and not self.budget.try_retry():
+            return None
+        return delay
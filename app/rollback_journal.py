@@ -0,0 +1,230 @@
+import json
+import os
+import threading
+import zlib
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PendingRollback:
+    entry_id: int
+    group_id: str
+    operation: str
+    hosts: List[str] = field(default_factory=list)
+
+    def to_record(self) -> Dict:
+        return {'id': self.entry_id, 'group_id': self.group_id,
+                'operation': self.operation, 'hosts': list(self.hosts)}
+
+
+def _encode(record: Dict) -> str:
+    payload = json.dumps(record, separators=(',', ':'))
+    return f"{zlib.crc32(payload.encode()):08x} {payload}\n"
+
+
+def _decode(line: str) -> Optional[Dict]:
+    if not line.endswith('\n'):
+        return None
+    checksum, _, payload = line.rstrip('\n').partition(' ')
+    try:
+        if int(checksum, 16) != zlib.crc32(payload.encode()):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+class RollbackJournal:
+    # Append-only log of rollbacks that still have to be replayed. Each line is
+    # "<crc32> <json>" and holds one of:
+    #   checkpoint - every outstanding entry, written when the log is compacted
+    #   pending    - a new rollback that still has to reach the listed hosts
+    #   done       - the rollback of one entry finished on one host
+    def __init__(self, path, compact_threshold: int = 1000):
+        self.path = str(path)
+        self.compact_threshold = compact_threshold
+        self._entries: 'OrderedDict[int, PendingRollback]' = OrderedDict()
+        self._next_id = 1
+        self._done_records = 0
+        self._file = None
+        self._lock = threading.Lock()
+        self._flushed = threading.Condition(self._lock)
+        self._written_seq = 0
+        self._durable_seq = 0
+        self._flushing = False
+        self._compacting = False
+        # Lines appended while a compaction writes its checkpoint, copied
+        # after the checkpoint when the new file is swapped in.
+        self._compaction_tail: Optional[List[Tuple[str, bool]]] = None
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        valid_end = 0
+        with open(self.path, 'r') as file:
+            for line in file:
+                record = _decode(line)
+                if record is None:
+                    if line.endswith('\n'):
+                        logger.error("Skipping corrupt record in rollback journal %s", self.path)
+                        valid_end += len(line.encode())
+                        continue
+                    # A torn write can only be the last line of the journal.
+                    break
+                valid_end += len(line.encode())
+                self._apply(record)
+        if valid_end < os.path.getsize(self.path):
+            logger.error("Truncating incomplete record at the end of rollback journal %s", self.path)
+            with open(self.path, 'r+') as file:
+                file.truncate(valid_end)
+
+    def _apply(self, record: Dict):
+        record_type = record.get('type')
+        if record_type == 'checkpoint':
+            self._entries = OrderedDict()
+            for entry in record['entries']:
+                self._entries[entry['id']] = PendingRollback(
+                    entry['id'], entry['group_id'], entry['operation'], list(entry['hosts']))
+            self._next_id = record['next_id']
+            self._done_records = 0
+        elif record_type == 'pending':
+            entry = PendingRollback(record['id'], record['group_id'],
+                                    record['operation'], list(record['hosts']))
+            self._entries[entry.entry_id] = entry
+            self._next_id = max(self._next_id, entry.entry_id + 1)
+        elif record_type == 'done':
+            entry = self._entries.get(record['id'])
+            if entry is not None and record['host'] in entry.hosts:
+                entry.hosts.remove(record['host'])
+                if not entry.hosts:
+                    del self._entries[entry.entry_id]
+            self._done_records += 1
+
+    def _append(self, record: Dict) -> int:
+        # Called with the lock held.
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        line = _encode(record)
+        self._file.write(line)
+        if self._compaction_tail is not None:
+            self._compaction_tail.append((line, record['type'] == 'done'))
+        self._written_seq += 1
+        self._apply(record)
+        return self._written_seq
+
+    def _sync(self, seq: int):
+        # Group commit: the first writer to arrive fsyncs everything written so
+        # far, the others wait for it and return if their record was covered.
+        with self._lock:
+            while self._durable_seq < seq:
+                if self._flushing:
+                    self._flushed.wait()
+                    continue
+                self._flushing = True
+                target = self._written_seq
+                self._file.flush()
+                file = self._file
+                self._lock.release()
+                try:
+                    os.fsync(file.fileno())
+                finally:
+                    self._lock.acquire()
+                    self._flushing = False
+                    self._durable_seq = max(self._durable_seq, target)
+                    self._flushed.notify_all()
+
+    def add(self, group_id: str, operation: str, hosts: List[str]) -> int:
+        with self._lock:
+            entry_id = self._next_id
+            seq = self._append({'type': 'pending', 'id': entry_id, 'group_id': group_id,
+                                'operation': operation, 'hosts': list(hosts)})
+        self._sync(seq)
+        return entry_id
+
+    def mark_done(self, entry_id: int, host: str):
+        # Not synced on its own: losing a done record only means the host is
+        # sent its (idempotent) rollback request again.
+        with self._lock:
+            self._append({'type': 'done', 'id': entry_id, 'host': host})
+            start_compaction = (not self._compacting
+                                and self._done_records >= self.compact_threshold)
+            if start_compaction:
+                self._compacting = True
+        if start_compaction:
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def pending(self) -> List[PendingRollback]:
+        with self._lock:
+            return [PendingRollback(entry.entry_id, entry.group_id, entry.operation, list(entry.hosts))
+                    for entry in self._entries.values()]
+
+    def has_pending(self) -> bool:
+        return bool(self._entries)
+
+    def compact(self):
+        # Rewrites the journal as a single checkpoint of the outstanding
+        # entries. The checkpoint is written and synced without the lock, so
+        # add() and mark_done() carry on meanwhile; what they append in the
+        # meantime is copied after the checkpoint when the file is swapped in.
+        with self._lock:
+            if self._compaction_tail is not None:
+                return
+            self._compacting = True
+            self._compaction_tail = []
+            checkpoint = _encode({'type': 'checkpoint', 'next_id': self._next_id,
+                                  'entries': [entry.to_record() for entry in self._entries.values()]})
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as file:
+                file.write(checkpoint)
+                file.flush()
+                os.fsync(file.fileno())
+                with self._lock:
+                    while self._flushing:
+                        self._flushed.wait()
+                    tail = self._compaction_tail
+                    file.writelines(line for line, _ in tail)
+                    file.flush()
+                    os.fsync(file.fileno())
+                    if self._file is not None:
+                        self._file.close()
+                        self._file = None
+                    os.replace(tmp_path, self.path)
+                    self._done_records = sum(1 for _, done in tail if done)
+                    self._durable_seq = self._written_seq
+        finally:
+            with self._lock:
+                self._compaction_tail = None
+                self._compacting = False
+
+    def import_legacy_file(self, legacy_path) -> bool:
+        # Moves a pending rollback from the old single-record rollback.txt format.
+        try:
+            with open(legacy_path, 'r') as file:
+                operation = file.readline().strip()
+                group_id = file.readline().strip()
+                hosts = [line.strip() for line in file if line.strip()]
+        except IOError as e:
+            logger.error("Error reading rollback file: %s", e)
+            return False
+        if operation and group_id and hosts:
+            self.add(group_id, operation, hosts)
+        os.remove(legacy_path)
+        return True
+
+    def close(self):
+        with self._lock:
+            while self._flushing:
+                self._flushed.wait()
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+                self._durable_seq = self._written_seq
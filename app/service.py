@@ -0,0 +1,175 @@
+import json
+import os
+import signal
+import socketserver
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from app.cluster_client import ClusterClient
+
+logger = logging.getLogger(__name__)
+
+GROUPS_PATH = '/v1/groups/'
+
+
+class ServiceBusy(Exception):
+    pass
+
+
+class ClusterService:
+    # Runs operations on one warm ClusterClient. At most max_concurrency
+    # operations run at once and at most max_queue more wait for a slot;
+    # anything beyond that is rejected so callers can back off.
+    def __init__(self, client: ClusterClient, max_concurrency: int = 32, max_queue: int = 1000):
+        self.client = client
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix='service')
+        self._slots = threading.BoundedSemaphore(max_concurrency + max_queue)
+
+    def start(self):
+        self.client.start_rollback_drain()
+
+    def submit(self, operation: Callable, *args):
+        if not self._slots.acquire(blocking=False):
+            raise ServiceBusy()
+        try:
+            return self._executor.submit(operation, *args).result()
+        finally:
+            self._slots.release()
+
+    def create_group(self, group_name: str) -> Dict:
+        self.client.start_rollback_drain()
+        if not self.client.wait_for_rollbacks(group_name):
+            return {'group_name': group_name, 'operation': 'create', 'success': False,
+                    'error': "Pending rollbacks for this group failed"}
+        return {'group_name': group_name, 'operation': 'create',
+                'success': self.client.create_group(group_name)}
+
+    def delete_group(self, group_name: str) -> Dict:
+        self.client.start_rollback_drain()
+        if not self.client.wait_for_rollbacks(group_name):
+            return {'group_name': group_name, 'operation': 'delete', 'success': False,
+                    'error': "Pending rollbacks for this group failed"}
+        return {'group_name': group_name, 'operation': 'delete',
+                'success': self.client.delete_group(group_name)}
+
+    def get_group_status(self, group_name: str) -> Dict:
+        status = self.client.get_group_status(group_name)
+        return {'group_name': group_name, 'operation': 'status',
+                'success': bool(status), 'status': status}
+
+    def continue_rollbacks(self) -> Dict:
+        return {'operation': 'rollback', 'success': self.client.continue_rollbacks()}
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.client.close()
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    service: ClusterService = None
+
+    def do_GET(self):
+        if self.path == '/healthz':
+            self._send(200, {'status': 'ok'})
+            return
+        if self.path == '/metrics':
+            self._send_payload(200, self.service.client.metrics.render().encode(),
+                               'text/plain; version=0.0.4; charset=utf-8')
+            return
+        self._dispatch(self.service.get_group_status)
+
+    def do_POST(self):
+        if self.path == '/v1/rollbacks':
+            self._run(self.service.continue_rollbacks)
+            return
+        self._dispatch(self.service.create_group)
+
+    def do_DELETE(self):
+        self._dispatch(self.service.delete_group)
+
+    def _dispatch(self, operation: Callable):
+        group_name = self._group_name()
+        if not group_name:
+            self._send(404, {'error': f"Unknown path {self.path}"})
+            return
+        self._run(operation, group_name)
+
+    def _group_name(self) -> Optional[str]:
+        path = urlsplit(self.path).path
+        if not path.startswith(GROUPS_PATH):
+            return None
+        group_name = unquote(path[len(GROUPS_PATH):])
+        if not group_name or '/' in group_name:
+            return None
+        return group_name
+
+    def _run(self, operation: Callable, *args):
+        try:
+            result = self.service.submit(operation, *args)
+        except ServiceBusy:
+            self._send(503, {'error': "Service is at capacity, try again later"})
+            return
+        except Exception as e:
+            logger.error("Service request %s %s failed: %s", self.command, self.path, e)
+            self._send(500, {'error': str(e)})
+            return
+        self._send(200 if result['success'] else 502, result)
+
+    def _send(self, status_code: int, body: Dict):
+        self._send_payload(status_code, json.dumps(body).encode(), 'application/json')
+
+    def _send_payload(self, status_code: int, payload: bytes, content_type: str):
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self):
+        # Unix socket peers have no address.
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        logger.debug("%s - " + format, self.address_string(), *args)
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def parse_listen_address(listen: str) -> Tuple[str, int]:
+    host, _, port = listen.rpartition(':')
+    return host or '0.0.0.0', int(port)
+
+
+def create_server(service: ClusterService, listen: str = '127.0.0.1:8080', unix_socket: Optional[str] = None):
+    handler = type('BoundServiceRequestHandler',
+                   (ServiceRequestHandler,), {'service': service})
+    if unix_socket:
+        if os.path.exists(unix_socket):
+            os.remove(unix_socket)
+        return ThreadingUnixHTTPServer(unix_socket, handler)
+    return ThreadingHTTPServer(parse_listen_address(listen), handler)
+
+
+def serve(service: ClusterService, listen: str = '127.0.0.1:8080', unix_socket: Optional[str] = None):
+    server = create_server(service, listen=listen, unix_socket=unix_socket)
+    if threading.current_thread() is threading.main_thread():
+        # shutdown() blocks until serve_forever() returns, so it cannot run
+        # inside the signal handler on the serving thread.
+        signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(
+            target=server.shutdown, daemon=True).start())
+    service.start()
+    logger.info("Cluster client service listening on %s", unix_socket or listen)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
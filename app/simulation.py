@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import random
+import selectors
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+import httpx
+
+from app.fake_server import BULK_PATH, GROUP_PATH, apply_bulk_request, apply_group_request, parse_latency
+
+
+class VirtualClock:
+    # Monotonic clock that only moves when something sleeps on it. Callable,
+    # so it can stand in for time.monotonic anywhere a clock is accepted.
+    def __init__(self, start: float = 0.0):
+        self.now = start
+        self._lock = threading.Lock()
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        if seconds > 0:
+            with self._lock:
+                self.now += seconds
+
+    async def async_sleep(self, seconds: float):
+        # Inside a VirtualTimeEventLoop concurrent sleeps overlap; anywhere
+        # else they add up, as they would for a sequential caller.
+        if getattr(asyncio.get_running_loop(), 'clock', None) is self:
+            await asyncio.sleep(seconds)
+        else:
+            self.sleep(seconds)
+            await asyncio.sleep(0)
+
+
+class _VirtualTimeSelector(selectors.DefaultSelector):
+    def __init__(self, clock: VirtualClock):
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        # Instead of waiting for the next timer, jump the clock to it. Real
+        # I/O (executor threads waking the loop) is still waited for when no
+        # timer is scheduled.
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            return super().select(None)
+        self._clock.sleep(timeout)
+        return []
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock: VirtualClock):
+        self.clock = clock
+        super().__init__(_VirtualTimeSelector(clock))
+
+    def time(self) -> float:
+        return self.clock()
+
+
+class NodeModel:
+    def __init__(self, latency: str = 'exp:0.005', failure_rate: float = 0.0, timeout_rate: float = 0.0,
+                 exists_rate: float = 0.0, bulk: bool = True):
+        self.latency = parse_latency(latency)
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.exists_rate = exists_rate
+        self.bulk = bulk
+
+
+class SimulatedCluster:
+    # In-process model of the cluster nodes, plugged into ClusterClient in
+    # place of its ConnectionPool. Every request's latency and outcome is
+    # drawn from a generator seeded by (seed, host, method, group, attempt),
+    # so a run gives the same results whatever order concurrent requests
+    # happen to arrive in.
+    def __init__(self, seed: int = 0, latency: str = 'exp:0.005', failure_rate: float = 0.0,
+                 timeout_rate: float = 0.0, exists_rate: float = 0.0,
+                 host_models: Optional[Dict[str, Dict]] = None, clock: Optional[VirtualClock] = None,
+                 bulk: bool = True):
+        self.seed = seed
+        self.clock = clock or VirtualClock()
+        self.default_model = NodeModel(latency, failure_rate, timeout_rate, exists_rate, bulk)
+        self.host_models = {host: NodeModel(**options)
+                            for host, options in (host_models or {}).items()}
+        self.groups: Dict[str, Set[str]] = defaultdict(set)
+        self.requests = Counter()
+        self._attempts = Counter()
+        self._lock = threading.Lock()
+
+    def request_counts(self) -> Counter:
+        with self._lock:
+            return Counter(self.requests)
+
+    def rng(self) -> random.Random:
+        return random.Random(self.seed)
+
+    def client(self, host: str) -> 'SimulatedClient':
+        return SimulatedClient(self, host)
+
+    def async_client(self, host: str) -> 'AsyncSimulatedClient':
+        return AsyncSimulatedClient(self, host)
+
+    def close(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+    def _draw(self, host: str, method: str, key: Optional[str]) -> random.Random:
+        with self._lock:
+            self.requests[method] += 1
+            self._attempts[host, method, key] += 1
+            attempt = self._attempts[host, method, key]
+        digest = hashlib.blake2b(
+            f"{self.seed}|{host}|{method}|{key}|{attempt}".encode(), digest_size=8).digest()
+        return random.Random(int.from_bytes(digest, 'big'))
+
+    def respond(self, host: str, method: str, group_id: Optional[str],
+                timeout: Optional[float]) -> Tuple[float, Optional[int]]:
+        # Returns (latency, status code); a None status code is a timeout.
+        model = self.host_models.get(host, self.default_model)
+        rng = self._draw(host, method, group_id)
+        delay = model.latency(rng)
+        roll = rng.random()
+        if roll < model.timeout_rate or (timeout is not None and delay >= timeout):
+            return timeout or 0.0, None
+        if roll < model.timeout_rate + model.failure_rate:
+            return delay, 500
+        already_exists = rng.random() < model.exists_rate
+        with self._lock:
+            status_code, _ = apply_group_request(self.groups[host], method, group_id, already_exists)
+        return delay, status_code
+
+    def respond_bulk(self, host: str, operations, timeout: Optional[float]) -> Tuple[float, Optional[int], Dict]:
+        # Returns (latency, status code, body) for one bulk request, drawn
+        # once for the whole batch and keyed by the groups in it.
+        model = self.host_models.get(host, self.default_model)
+        if not model.bulk:
+            return 0.0, 404, {'error': "Not found"}
+        key = ','.join(str(item.get('groupId')) for item in operations or () if isinstance(item, dict))
+        rng = self._draw(host, 'BULK', key)
+        delay = model.latency(rng)
+        roll = rng.random()
+        if roll < model.timeout_rate or (timeout is not None and delay >= timeout):
+            return timeout or 0.0, None, {}
+        if roll < model.timeout_rate + model.failure_rate:
+            return delay, 500, {'error': 'error'}
+        with self._lock:
+            status_code, body = apply_bulk_request(self.groups[host], operations,
+                                                   lambda: rng.random() < model.exists_rate)
+        return delay, status_code, body
+
+    def run(self, coroutine):
+        # asyncio.run() on a VirtualTimeEventLoop driven by this cluster's clock.
+        loop = VirtualTimeEventLoop(self.clock)
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.run_until_complete(loop.shutdown_default_executor())
+            loop.close()
+
+
+class SimulatedResponse:
+    __slots__ = ('method', 'url', 'status_code', 'headers', 'body')
+
+    def __init__(self, method: str, url: str, status_code: int, body: Optional[Dict] = None):
+        self.method = method
+        self.url = url
+        self.status_code = status_code
+        self.headers: Dict[str, str] = {}
+        self.body = body
+
+    def json(self):
+        return self.body if self.body is not None else {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise httpx.HTTPStatusError(f"Simulated {self.status_code} for {self.url}",
+                                        request=httpx.Request(self.method, self.url), response=self)
+
+
+class SimulatedClient:
+    # Answers the subset of httpx.Client that ClusterClient uses. Skipping
+    # httpx's request and response models keeps a simulated request to a few
+    # microseconds, which is what makes large runs practical.
+    def __init__(self, cluster: SimulatedCluster, host: str):
+        self.cluster = cluster
+        self.host = host
+
+    def _respond(self, method: str, url: str, group_id: Optional[str],
+                 timeout: Optional[float]) -> Tuple[float, Optional[SimulatedResponse]]:
+        delay, status_code = self.cluster.respond(self.host, method, group_id, timeout)
+        return delay, None if status_code is None else SimulatedResponse(method, url, status_code)
+
+    def _respond_bulk(self, url: str, body: Optional[Dict],
+                      timeout: Optional[float]) -> Tuple[float, Optional[SimulatedResponse]]:
+        delay, status_code, response_body = self.cluster.respond_bulk(
+            self.host, (body or {}).get('operations'), timeout)
+        return delay, None if status_code is None else SimulatedResponse('POST', url, status_code, response_body)
+
+    def _finish(self, method: str, url: str, response: Optional[SimulatedResponse]) -> SimulatedResponse:
+        if response is None:
+            raise httpx.ReadTimeout(f"Simulated timeout for {method} {url}")
+        return response
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None):
+        return self.request('GET', url, timeout=timeout)
+
+    def post(self, url: str, json: Optional[Dict] = None, timeout: Optional[float] = None):
+        return self.request('POST', url, json=json, timeout=timeout)
+
+    def request(self, method: str, url: str, json: Optional[Dict] = None, headers: Optional[Dict[str, str]] = None,
+                timeout: Optional[float] = None):
+        if BULK_PATH in url:
+            delay, response = self._respond_bulk(url, json, timeout)
+        else:
+            delay, response = self._respond(method, url, _group_id(method, url, json), timeout)
+        self.cluster.clock.sleep(delay)
+        return self._finish(method, url, response)
+
+    def close(self):
+        pass
+
+
+class AsyncSimulatedClient(SimulatedClient):
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None):
+        return await self.request('GET', url, timeout=timeout)
+
+    async def post(self, url: str, json: Optional[Dict] = None, timeout: Optional[float] = None):
+        return await self.request('POST', url, json=json, timeout=timeout)
+
+    async def request(self, method: str, url: str, json: Optional[Dict] = None,
+                      headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None):
+        if BULK_PATH in url:
+            delay, response = self._respond_bulk(url, json, timeout)
+        else:
+            delay, response = self._respond(method, url, _group_id(method, url, json), timeout)
+        await self.cluster.clock.async_sleep(delay)
+        return self._finish(method, url, response)
+
+    async def aclose(self):
+        pass
+
+
+def _group_id(method: str, url: str, body: Optional[Dict]) -> Optional[str]:
+    if method == 'GET':
+        return url.partition(GROUP_PATH)[2].strip('/') or None
+    return (body or {}).get('groupId')
@@ -0,0 +1,66 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+
+class CachedStatus:
+    __slots__ = ('exists', 'etag', 'expires_at')
+
+    def __init__(self, exists: bool, etag: Optional[str], expires_at: float):
+        self.exists = exists
+        self.etag = etag
+        self.expires_at = expires_at
+
+
+class StatusCache:
+    # LRU cache of get_group_status results keyed by (host, group). Stale
+    # entries are kept while they have an ETag so they can be revalidated.
+    def __init__(self, ttl: float = 5.0, max_entries: int = 100000, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: 'OrderedDict[Tuple[str, str], CachedStatus]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, host: str, group_id: str) -> Tuple[Optional[CachedStatus], bool]:
+        # Returns the entry, if any, and whether it is still fresh.
+        key = (host, group_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, False
+            fresh = self._clock() < entry.expires_at
+            if not fresh and entry.etag is None:
+                del self._entries[key]
+                return None, False
+            self._entries.move_to_end(key)
+            return entry, fresh
+
+    def put(self, host: str, group_id: str, exists: bool, etag: Optional[str] = None):
+        key = (host, group_id)
+        with self._lock:
+            self._entries[key] = CachedStatus(
+                exists, etag, self._clock() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def refresh(self, host: str, group_id: str) -> Optional[bool]:
+        with self._lock:
+            entry = self._entries.get((host, group_id))
+            if entry is None:
+                return None
+            entry.expires_at = self._clock() + self.ttl
+            return entry.exists
+
+    def invalidate(self, host: str, group_id: str):
+        with self._lock:
+            self._entries.pop((host, group_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,127 @@
+import atexit
+import json
+import queue
+import sys
+import threading
+import time
+import logging
+import logging.handlers
+from typing import Dict, Optional, TextIO, Tuple
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through `extra`.
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per record with the time, level, logger and message,
+    # plus any fields passed through `extra` such as host or group.
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': self.formatTime(record), 'level': record.levelname, 'logger': record.name,
+                 'message': record.getMessage()}
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class RateLimitFilter(logging.Filter):
+    # Lets through at most `burst` records per message template every
+    # `interval` seconds, for records at or below max_level; warnings and
+    # errors always pass. The template is the unformatted message, so a retry
+    # message logged for a thousand hosts counts as one kind of record. The
+    # next record let through carries how many were dropped in `suppressed`.
+    def __init__(self, burst: int = 10, interval: float = 1.0, max_level: int = logging.INFO):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.max_level = max_level
+        self._windows: Dict[Tuple[str, int, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                window = self._windows[key] = [now, 0, 0]
+            else:
+                suppressed = 0
+            if window[1] >= self.burst:
+                window[2] += 1
+                return False
+            window[1] += 1
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    # Hands records to the listener thread without formatting them: the
+    # stdlib QueueHandler formats in the caller's thread, which is the cost
+    # this avoids. Arguments are formatted later, so they must not be mutated
+    # after logging. When the queue is full, records are dropped and counted
+    # rather than blocking a request.
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    def __init__(self, handler: DeferredQueueHandler, listener: logging.handlers.QueueListener):
+        self.handler = handler
+        self.listener = listener
+        self._stopped = False
+
+    def stop(self):
+        # Writes out what is still queued.
+        if self._stopped:
+            return
+        self._stopped = True
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+        if self.handler.dropped:
+            self.listener.handlers[0].handle(logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': "Dropped %d log records because the log queue was full",
+                'args': (self.handler.dropped,)}))
+        for handler in self.listener.handlers:
+            handler.flush()
+
+
+def configure_logging(level: int = logging.INFO, log_format: str = 'text', stream: Optional[TextIO] = None,
+                      rate_limit_burst: Optional[int] = 10, rate_limit_interval: float = 1.0,
+                      queue_size: int = 10000) -> LogPipeline:
+    # Routes the root logger through a bounded queue to a background thread
+    # that formats and writes the records. Replaces any handlers set before.
+    output = logging.StreamHandler(stream if stream is not None else sys.stderr)
+    output.setFormatter(JsonFormatter() if log_format == 'json' else logging.Formatter(TEXT_FORMAT))
+    handler = DeferredQueueHandler(queue.Queue(queue_size))
+    if rate_limit_burst:
+        handler.addFilter(RateLimitFilter(rate_limit_burst, rate_limit_interval))
+    listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    listener.start()
+    pipeline = LogPipeline(handler, listener)
+    atexit.register(pipeline.stop)
+    return pipeline
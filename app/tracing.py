@@ -0,0 +1,162 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+_current_span = contextvars.ContextVar('cluster_client_span', default=None)
+_ids = itertools.count(1)
+
+
+class Span:
+    # One timed step. Spans started while another is open (in the same thread
+    # or task, or in work handed off with its context) become its children
+    # and share its trace_id, so one operation's requests, attempts, backoff
+    # sleeps and rollback steps form one tree.
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'host', 'start', 'end', 'status',
+                 'attributes', '_tracer', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, parent: Optional['Span'], attributes: Dict):
+        self.name = name
+        self.span_id = next(_ids)
+        self.trace_id = parent.trace_id if parent is not None else self.span_id
+        self.parent_id = parent.span_id if parent is not None else None
+        # The host a span belongs to, inherited from the closest host-level parent.
+        self.host = attributes.get('host', parent.host if parent is not None else None)
+        self.start = tracer.clock()
+        self.end = None
+        self.status = 'ok'
+        self.attributes = attributes
+        self._tracer = tracer
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, error: str):
+        self.status = 'error'
+        self.attributes['error'] = error
+
+    def __enter__(self) -> 'Span':
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = self._tracer.clock()
+        if exc_type is not None and self.status == 'ok':
+            self.fail(exc_type.__name__)
+        _current_span.reset(self._token)
+        self._tracer.exporter.export(self)
+        return False
+
+    @property
+    def duration(self) -> Optional[float]:
+        return None if self.end is None else self.end - self.start
+
+    def to_record(self) -> Dict:
+        return {'name': self.name, 'trace_id': self.trace_id, 'span_id': self.span_id,
+                'parent_id': self.parent_id, 'start': self.start, 'duration': self.duration,
+                'status': self.status, 'attributes': self.attributes}
+
+
+class _NoSpan:
+    # Shared by every span of a disabled tracer, so tracing costs next to
+    # nothing when it is off.
+    def set(self, **attributes):
+        pass
+
+    def fail(self, error: str):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class JsonlExporter:
+    # One JSON object per finished span and line.
+    def __init__(self, file_path):
+        self._file = open(file_path, 'a')
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_record(), default=str) + '\n'
+        with self._lock:
+            self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class ChromeTraceExporter:
+    # Chrome trace event format, for chrome://tracing or ui.perfetto.dev.
+    # Each operation's spans for one host get their own row, so concurrent
+    # hosts do not overlap. A file cut short without the closing bracket
+    # still loads.
+    def __init__(self, file_path):
+        self._file = open(file_path, 'w')
+        self._file.write('[')
+        self._separator = '\n'
+        self._pid = os.getpid()
+        self._rows: Dict[Tuple[int, Optional[str]], int] = {}
+        self._lock = threading.Lock()
+
+    def _row(self, span: Span) -> int:
+        # Called with the lock held.
+        key = (span.trace_id, span.host)
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = len(self._rows) + 1
+            label = f"trace {span.trace_id}" + (f" {span.host}" if span.host else '')
+            self._write({'name': 'thread_name', 'ph': 'M', 'pid': self._pid, 'tid': row, 'args': {'name': label}})
+        return row
+
+    def _write(self, event: Dict):
+        self._file.write(self._separator + json.dumps(event, default=str))
+        self._separator = ',\n'
+
+    def export(self, span: Span):
+        with self._lock:
+            self._write({'name': span.name, 'cat': 'cluster_client', 'ph': 'X',
+                         'ts': span.start * 1e6, 'dur': span.duration * 1e6, 'pid': self._pid,
+                         'tid': self._row(span), 'args': dict(span.attributes, status=span.status)})
+
+    def close(self):
+        with self._lock:
+            self._file.write('\n]\n')
+            self._file.close()
+
+
+def span_exporter(file_path):
+    # .json files get the Chrome trace format, anything else JSON lines.
+    if str(file_path).endswith('.json'):
+        return ChromeTraceExporter(file_path)
+    return JsonlExporter(file_path)
+
+
+class Tracer:
+    def __init__(self, exporter, clock: Callable[[], float] = time.monotonic):
+        self.exporter = exporter
+        self.clock = clock
+
+    def span(self, name: str, **attributes) -> Span:
+        return Span(self, name, _current_span.get(), attributes)
+
+    def close(self):
+        self.exporter.close()
+
+
+class NullTracer:
+    def span(self, name: str, **attributes) -> _NoSpan:
+        return NO_SPAN
+
+    def close(self):
+        pass
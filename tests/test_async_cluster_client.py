@@ -0,0 +1,246 @@
+import asyncio
+import pytest
+import httpx
+from unittest.mock import patch, AsyncMock
+
+from app.async_cluster_client import AsyncClusterClient
+from app.health import HALF_OPEN, HostHealth
+from app.limiter import HostLimits
+from app.retry import Deadline
+from app.status_cache import StatusCache
+
+
+@pytest.fixture
+def async_client(tmp_path):
+    return AsyncClusterClient(simulate=False, hosts=['host1', 'host2', 'host3'], retry_timeout=0,
+                              rollback_file=tmp_path / 'rollback.journal')
+
+
+@pytest.mark.asyncio
+async def test_create_group_success(async_client):
+    with patch.object(async_client, '_make_post_request', AsyncMock(return_value=True)):
+        assert await async_client.create_group('test_group') == True
+
+
+@pytest.mark.asyncio
+async def test_create_group_failure_rolls_back_successful_hosts(async_client):
+    with patch.object(async_client, '_make_post_request', AsyncMock(side_effect=[True, False, True])):
+        with patch.object(async_client, '_rollback', AsyncMock()) as mock_rollback:
+            assert await async_client.create_group('test_group') == False
+            mock_rollback.assert_called_once_with(
+                'test_group', 'delete', ['host1', 'host3'])
+
+
+@pytest.mark.asyncio
+async def test_delete_group_failure_rolls_back_successful_hosts(async_client):
+    with patch.object(async_client, '_make_delete_request', AsyncMock(side_effect=[False, True, True])):
+        with patch.object(async_client, '_rollback', AsyncMock()) as mock_rollback:
+            assert await async_client.delete_group('test_group') == False
+            mock_rollback.assert_called_once_with(
+                'test_group', 'create', ['host2', 'host3'])
+
+
+@pytest.mark.asyncio
+async def test_get_group_status(async_client):
+    with patch.object(async_client, '_make_get_request', AsyncMock(side_effect=[True, False, True])):
+        status = await async_client.get_group_status('test_group')
+        assert status == {'host1': True, 'host2': False, 'host3': True}
+
+
+@pytest.mark.asyncio
+async def test_stream_group_status_yields_in_completion_order(async_client):
+    delays = {'host1': 0.03, 'host2': 0.01, 'host3': 0.02}
+
+    async def get(host, group_id, deadline=None):
+        await asyncio.sleep(delays[host])
+        return host != 'host3'
+
+    with patch.object(async_client, '_make_get_request', get):
+        results = [result async for result in async_client.stream_group_status('test_group')]
+    assert results == [('host2', True), ('host3', False), ('host1', True)]
+
+
+@pytest.mark.asyncio
+async def test_stream_group_status_cancels_outstanding_reads():
+    client = AsyncClusterClient(hosts=[f'host{i}' for i in range(10)], max_concurrency=3)
+    started = []
+    cancelled = []
+
+    async def get(host, group_id, deadline=None):
+        started.append(host)
+        try:
+            await asyncio.sleep(0 if host == 'host0' else 1)
+        except asyncio.CancelledError:
+            cancelled.append(host)
+            raise
+        return True
+
+    with patch.object(client, '_make_get_request', get):
+        results = client.stream_group_status('test_group')
+        assert await results.__anext__() == ('host0', True)
+        await results.aclose()
+    await asyncio.sleep(0)
+    # host3 was queued when host0 finished and is cancelled before it starts.
+    assert started == ['host0', 'host1', 'host2']
+    assert sorted(cancelled) == ['host1', 'host2']
+
+
+@pytest.mark.asyncio
+async def test_fan_out_respects_concurrency_limit():
+    client = AsyncClusterClient(
+        hosts=[f'host{i}' for i in range(10)], max_concurrency=2)
+    in_flight = 0
+    peak = 0
+
+    async def request(host, group_id):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return True
+
+    results = await client._fan_out(request, client.hosts, 'test_group')
+    assert all(results.values())
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_rollback_failure_keeps_failed_hosts_in_journal(async_client):
+    with patch.object(async_client, '_make_delete_request', AsyncMock(side_effect=[True, False])):
+        assert await async_client._rollback('test_group', 'delete', ['host1', 'host2']) == False
+    pending = async_client.journal.pending()
+    assert [(e.group_id, e.hosts) for e in pending] == [('test_group', ['host2'])]
+
+
+@pytest.mark.asyncio
+async def test_continue_rollbacks_replays_journal(async_client):
+    async_client.journal.add('test_group', 'create', ['host1', 'host2'])
+    with patch.object(async_client, '_make_post_request', AsyncMock(return_value=True)) as mock_post:
+        assert await async_client.continue_rollbacks() == True
+        assert mock_post.call_count == 2
+    assert not async_client.has_pending_rollbacks()
+
+
+@pytest.mark.asyncio
+async def test_make_post_request_group_exists(async_client, httpx_mock):
+    httpx_mock.add_response(url='http://host1/v1/group/', status_code=400)
+    assert await async_client._make_post_request('host1', 'test_group') == True
+
+
+@pytest.mark.asyncio
+async def test_make_post_request_retries_then_succeeds(async_client, httpx_mock):
+    httpx_mock.add_exception(httpx.ConnectError("Connection error"))
+    httpx_mock.add_response(url='http://host1/v1/group/', status_code=200)
+    assert await async_client._make_post_request('host1', 'test_group') == True
+    assert len(httpx_mock.get_requests()) == 2
+
+
+@pytest.mark.asyncio
+async def test_make_delete_request_failure(async_client, httpx_mock):
+    httpx_mock.add_response(status_code=500, is_reusable=True)
+    assert await async_client._make_delete_request('host1', 'test_group') == False
+    assert len(httpx_mock.get_requests()) == 3
+
+
+@pytest.mark.asyncio
+async def test_make_get_request_not_found(async_client, httpx_mock):
+    httpx_mock.add_response(url='http://host1/v1/group//test_group', status_code=404)
+    assert await async_client._make_get_request('host1', 'test_group') == False
+
+
+@pytest.mark.asyncio
+async def test_wait_for_rollbacks_ignores_other_groups(async_client):
+    async_client.journal.add('group1', 'delete', ['host1'])
+    async_client.journal.add('group2', 'delete', ['host2'])
+    release = asyncio.Event()
+
+    async def request(host, group_id):
+        if group_id == 'group2':
+            await release.wait()
+        return True
+
+    with patch.object(async_client, '_make_delete_request', side_effect=request):
+        async_client.start_rollback_drain()
+        assert await async_client.wait_for_rollbacks('group1') == True
+        assert [e.group_id for e in async_client.journal.pending()] == ['group2']
+        release.set()
+        await async_client.aclose()
+    assert not async_client.has_pending_rollbacks()
+
+
+@pytest.mark.asyncio
+async def test_rollback_parallelism_limit(tmp_path):
+    client = AsyncClusterClient(hosts=[], rollback_parallelism=2,
+                                rollback_file=tmp_path / 'rollback.journal')
+    client.journal.add('group1', 'delete', [f'host{i}' for i in range(6)])
+    in_flight = 0
+    peak = 0
+
+    async def request(host, group_id):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return True
+
+    with patch.object(client, '_make_delete_request', side_effect=request):
+        assert await client.continue_rollbacks() == True
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_get_group_status_marks_open_host_unknown(async_client):
+    async_client.health = HostHealth(failure_threshold=1)
+    async_client.health.record_failure('host1')
+    with patch.object(async_client, '_make_get_request', AsyncMock(return_value=True)) as mock_get:
+        status = await async_client.get_group_status('test_group')
+    assert status == {'host1': None, 'host2': True, 'host3': True}
+    assert mock_get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_open_breaker(async_client, httpx_mock):
+    async_client.health = HostHealth(failure_threshold=2)
+    httpx_mock.add_response(url='http://host1/v1/group/', status_code=409)
+    httpx_mock.add_response(url='http://host1/v1/group/', status_code=409)
+    async_client.retry_policy.max_attempts = 1
+    assert await async_client._make_post_request('host1', 'test_group') == False
+    assert await async_client._make_post_request('host1', 'test_group') == False
+    assert not async_client.health.is_open('host1')
+
+
+@pytest.mark.asyncio
+async def test_deadline_expiring_during_half_open_keeps_the_trial(async_client):
+    now = [0.0]
+    async_client.health = HostHealth(failure_threshold=1, recovery_timeout=10, clock=lambda: now[0])
+    async_client.health.record_failure('host1')
+    now[0] = 10
+    async_client.limits = HostLimits(rate=1, burst=1)
+    async_client.limits.limiter('host1').reserve()
+    with patch('httpx.AsyncClient') as mock_client:
+        assert await async_client._make_get_request('host1', 'test_group', deadline=Deadline(0)) == False
+        assert await async_client._make_get_request('host1', 'test_group', deadline=Deadline(0.1)) == False
+        mock_client.return_value.get.assert_not_called()
+    assert async_client.health.state('host1') == HALF_OPEN
+    assert async_client.health.allow_request('host1')
+
+
+@pytest.mark.asyncio
+async def test_not_modified_without_cached_status_reads_again(async_client, httpx_mock):
+    async_client.status_cache = StatusCache(ttl=0)
+
+    def evicted(request):
+        async_client.status_cache.invalidate('host1', 'test_group')
+        return httpx.Response(304)
+
+    httpx_mock.add_response(url='http://host1/v1/group//test_group', headers={'ETag': '"v1"'})
+    httpx_mock.add_callback(evicted, url='http://host1/v1/group//test_group',
+                            match_headers={'If-None-Match': '"v1"'})
+    httpx_mock.add_response(url='http://host1/v1/group//test_group', status_code=404)
+    assert await async_client._make_get_request('host1', 'test_group') == True
+    assert await async_client._make_get_request('host1', 'test_group') == False
+    requests = httpx_mock.get_requests()
+    assert len(requests) == 3
+    assert 'If-None-Match' not in requests[2].headers
@@ -0,0 +1,128 @@
+import io
+import json
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from app.async_cluster_client import AsyncClusterClient
+from app.batch import read_batch_file, run_batch, run_batch_file
+
+
+@pytest.fixture
+def async_client(tmp_path):
+    return AsyncClusterClient(hosts=['host1', 'host2'], rollback_file=tmp_path / 'rollback.journal')
+
+
+def test_read_batch_file(tmp_path):
+    batch_file = tmp_path / 'requests.jsonl'
+    batch_file.write_text(
+        '{"operation": "create", "group_name": "g1"}\n\nnot json\n[1]\n')
+    records = list(read_batch_file(batch_file))
+    assert records[0] == {'operation': 'create', 'group_name': 'g1', 'line': 1}
+    assert records[1]['line'] == 3 and 'error' in records[1]
+    assert records[2]['line'] == 4 and 'error' in records[2]
+
+
+@pytest.mark.asyncio
+async def test_run_batch_reports_ndjson(async_client):
+    records = [
+        {'line': 1, 'operation': 'create', 'group_name': 'g1'},
+        {'line': 2, 'operation': 'delete', 'group_name': 'g2'},
+        {'line': 3, 'operation': 'status', 'group_name': 'g3'},
+        {'line': 4, 'operation': 'rename', 'group_name': 'g4'},
+        {'line': 5, 'error': 'Invalid JSON'},
+    ]
+    output = io.StringIO()
+    with patch.object(async_client, 'create_group', AsyncMock(return_value=True)), \
+            patch.object(async_client, 'delete_group', AsyncMock(return_value=False)), \
+            patch.object(async_client, 'get_group_status', AsyncMock(return_value={'host1': True, 'host2': False})):
+        summary = await run_batch(async_client, records, output=output)
+
+    assert summary == {'total': 5, 'succeeded': 2, 'failed': 3}
+    results = {r['line']: r for r in map(json.loads, output.getvalue().splitlines())}
+    assert results[1]['success'] is True
+    assert results[2]['success'] is False
+    assert results[3]['status'] == {'host1': True, 'host2': False}
+    assert 'error' in results[4]
+    assert results[5]['error'] == 'Invalid JSON'
+
+
+@pytest.mark.asyncio
+async def test_run_batch_bounds_in_flight_records(async_client):
+    in_flight = 0
+    peak = 0
+
+    async def create_group(group_id):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0)
+        in_flight -= 1
+        return True
+
+    records = ({'line': i, 'operation': 'create', 'group_name': f'g{i}'}
+               for i in range(50))
+    with patch.object(async_client, 'create_group', side_effect=create_group):
+        summary = await run_batch(async_client, records, output=io.StringIO(), max_in_flight=5)
+    assert summary['succeeded'] == 50
+    assert peak == 5
+
+
+@pytest.mark.asyncio
+async def test_run_batch_keeps_file_order_per_group(async_client):
+    calls = []
+
+    async def create_group(group_id):
+        await asyncio.sleep(0)
+        calls.append('create')
+        return True
+
+    async def delete_group(group_id):
+        calls.append('delete')
+        return True
+
+    records = [
+        {'line': 1, 'operation': 'create', 'group_name': 'g1'},
+        {'line': 2, 'operation': 'delete', 'group_name': 'g1'},
+    ]
+    with patch.object(async_client, 'create_group', side_effect=create_group), \
+            patch.object(async_client, 'delete_group', side_effect=delete_group):
+        await run_batch(async_client, records, output=io.StringIO())
+    assert calls == ['create', 'delete']
+
+
+@pytest.mark.asyncio
+async def test_run_batch_skips_group_with_failed_rollbacks(async_client):
+    records = [
+        {'line': 1, 'operation': 'create', 'group_name': 'g1'},
+        {'line': 2, 'operation': 'create', 'group_name': 'g2'},
+    ]
+    output = io.StringIO()
+    with patch.object(async_client, 'wait_for_rollbacks', AsyncMock(side_effect=lambda g: g != 'g1')), \
+            patch.object(async_client, 'create_group', AsyncMock(return_value=True)) as mock_create:
+        summary = await run_batch(async_client, records, output=output)
+    assert summary == {'total': 2, 'succeeded': 1, 'failed': 1}
+    mock_create.assert_called_once_with('g2')
+
+
+@pytest.mark.asyncio
+async def test_run_batch_file_drains_rollbacks_in_background(async_client, tmp_path):
+    batch_file = tmp_path / 'requests.jsonl'
+    batch_file.write_text('{"operation": "create", "group_name": "g1"}\n')
+    async_client.journal.add('g2', 'delete', ['host1'])
+    with patch.object(async_client, '_make_delete_request', AsyncMock(return_value=True)), \
+            patch.object(async_client, 'create_group', AsyncMock(return_value=True)):
+        summary = await run_batch_file(async_client, batch_file, output=io.StringIO())
+    assert summary['succeeded'] == 1
+    assert not async_client.has_pending_rollbacks()
+
+
+@pytest.mark.asyncio
+async def test_run_batch_retries_a_failed_rollback_before_the_group(async_client):
+    async_client.journal.add('g1', 'delete', ['host1'])
+    records = [{'line': 1, 'operation': 'create', 'group_name': 'g1'}]
+    with patch.object(async_client, '_make_delete_request', AsyncMock(return_value=True)) as mock_delete, \
+            patch.object(async_client, 'create_group', AsyncMock(return_value=True)):
+        summary = await run_batch(async_client, records, output=io.StringIO())
+    assert summary['succeeded'] == 1
+    mock_delete.assert_called_once()
@@ -0,0 +1,45 @@
+import pytest
+
+from app.benchmark import percentile, run_benchmark
+from app.fake_server import FakeCluster
+
+
+def test_percentile():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 0.5) == 51
+    assert percentile(values, 0.99) == 99
+    assert percentile([], 0.5) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark_reports_every_phase(tmp_path):
+    with FakeCluster(nodes=2, seed=1) as cluster:
+        report = await run_benchmark(cluster.hosts, cluster=cluster, groups=10, concurrency=5,
+                                     rollback_file=str(tmp_path / 'rollback.journal'), retry_timeout=0)
+    assert set(report) == {'create', 'status', 'delete', 'rollback'}
+    assert report['create']['operations'] == 10
+    assert report['create']['failures'] == 0
+    assert report['create']['requests'] == {'POST': 20}
+    assert report['status']['requests'] == {'GET': 20}
+    assert report['delete']['requests'] == {'DELETE': 20}
+    assert report['rollback']['pending'] == 0
+    assert report['status']['p99_ms'] >= report['status']['p50_ms']
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark_counts_rollback_traffic(tmp_path):
+    with FakeCluster(nodes=2, seed=1, node_overrides={1: {'error_rate': 1.0}}) as cluster:
+        report = await run_benchmark(cluster.hosts, cluster=cluster, groups=2, concurrency=2,
+                                     rollback_file=str(tmp_path / 'rollback.journal'),
+                                     retry_timeout=0, max_retries=1)
+    assert report['create']['failures'] == 2
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark_keeps_its_default_journal_out_of_the_working_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with FakeCluster(nodes=2, seed=1, node_overrides={1: {'error_rate': 1.0}}) as cluster:
+        report = await run_benchmark(cluster.hosts, cluster=cluster, groups=2, concurrency=2,
+                                     retry_timeout=0, max_retries=1)
+    assert report['create']['failures'] == 2
+    assert list(tmp_path.iterdir()) == []
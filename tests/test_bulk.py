@@ -0,0 +1,130 @@
+import asyncio
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.async_cluster_client import AsyncClusterClient
+from app.bulk import AsyncBatcher, BulkItem, BulkPolicy, read_bulk_results
+from app.fake_server import FakeCluster, FakeNode
+from app.retry import Deadline
+from app.simulation import SimulatedCluster
+
+
+def test_read_bulk_results_checks_every_item():
+    operations = [{'method': 'POST', 'groupId': 'g1'}, {'method': 'GET', 'groupId': 'g2'}]
+    body = {'results': [{'groupId': 'g1', 'status': 201}, {'groupId': 'g2', 'status': 404}]}
+    assert read_bulk_results(body, operations) == [201, 404]
+    assert read_bulk_results({'results': body['results'][:1]}, operations) is None
+    assert read_bulk_results({'results': body['results'][::-1]}, operations) is None
+    assert read_bulk_results([], operations) is None
+
+
+def test_bulk_policy_configured_hosts_and_detection():
+    policy = BulkPolicy(hosts=['host1', 'host2'])
+    assert policy.enabled('host1') and not policy.enabled('host3')
+    policy.disable('host2')
+    assert not policy.enabled('host2')
+    assert policy.unsupported() == ['host2']
+
+
+def test_fake_node_bulk_endpoint():
+    node = FakeNode().start()
+    legacy = FakeNode(bulk=False).start()
+    try:
+        operations = [{'method': 'POST', 'groupId': 'g1'}, {'method': 'POST', 'groupId': 'g1'},
+                      {'method': 'GET', 'groupId': 'g1'}, {'method': 'DELETE', 'groupId': 'g1'},
+                      {'method': 'GET', 'groupId': 'g1'}]
+        response = httpx.post(f"http://{node.host}/v1/groups/bulk", json={'operations': operations})
+        assert response.status_code == 200
+        assert [item['status'] for item in response.json()['results']] == [201, 400, 200, 200, 404]
+        assert node.requests == {'BULK': 1}
+        assert httpx.post(f"http://{node.host}/v1/groups/bulk", json={'operations': 'g1'}).status_code == 400
+        assert httpx.post(f"http://{legacy.host}/v1/groups/bulk", json={'operations': operations}).status_code == 404
+    finally:
+        node.stop()
+        legacy.stop()
+
+
+@pytest.mark.asyncio
+async def test_batches_requests_and_falls_back_on_nodes_without_bulk(tmp_path):
+    groups = [f'g{index}' for index in range(20)]
+    with FakeCluster(nodes=3, node_overrides={2: {'bulk': False}}) as cluster:
+        policy = BulkPolicy(max_batch=8, max_delay=0.01)
+        async with AsyncClusterClient(cluster.hosts, bulk=policy, retry_timeout=0,
+                                      rollback_file=tmp_path / 'rollback.journal') as client:
+            assert all(await asyncio.gather(*(client.create_group(group) for group in groups)))
+            statuses = await asyncio.gather(*(client.get_group_status(group) for group in groups))
+        assert all(status == {host: True for host in cluster.hosts} for status in statuses)
+        assert policy.unsupported() == [cluster.hosts[2]]
+        for node in cluster.nodes[:2]:
+            assert node.groups == set(groups)
+            assert 'POST' not in node.requests and 'GET' not in node.requests
+            assert node.requests['BULK'] <= 8
+        # Only the first batch went to the bulk endpoint before falling back.
+        assert cluster.nodes[2].groups == set(groups)
+        assert cluster.nodes[2].requests['POST'] == 20
+        assert cluster.nodes[2].requests['GET'] == 20
+
+
+@pytest.mark.asyncio
+async def test_bulk_request_keeps_to_the_earliest_item_deadline(tmp_path):
+    loop = asyncio.get_event_loop()
+    expired, soon, later = Deadline(0), Deadline(5), Deadline(60)
+    batch = [BulkItem('POST', 'g1', expired, loop.create_future()),
+             BulkItem('POST', 'g2', later, loop.create_future()),
+             BulkItem('GET', 'g3', soon, loop.create_future()),
+             BulkItem('GET', 'g4', None, loop.create_future())]
+    async with AsyncClusterClient(['host1'], bulk=BulkPolicy(), retry_timeout=0,
+                                  rollback_file=tmp_path / 'rollback.journal') as client:
+        with patch.object(client, '_send', AsyncMock(return_value=None)) as mock_send:
+            await client._send_bulk('host1', batch)
+    assert mock_send.call_args.kwargs['deadline'] is soon
+    assert all(item.future.result() is None for item in batch)
+
+    sent = []
+
+    async def send(action, host, request, **kwargs):
+        request_client = AsyncMock()
+        await request(request_client, 1)
+        sent.extend(request_client.post.call_args.kwargs['json']['operations'])
+
+    batch = [BulkItem('POST', 'g1', Deadline(0), loop.create_future()),
+             BulkItem('POST', 'g2', None, loop.create_future())]
+    async with AsyncClusterClient(['host1'], bulk=BulkPolicy(), retry_timeout=0,
+                                  rollback_file=tmp_path / 'rollback.journal') as client:
+        with patch.object(client, '_send', side_effect=send) as mock_send:
+            await client._send_bulk('host1', batch)
+    assert mock_send.call_args.kwargs['deadline'] is None
+    assert sent == [{'method': 'POST', 'groupId': 'g2'}]
+
+
+@pytest.mark.asyncio
+async def test_batch_failure_is_raised_to_every_waiting_caller():
+    async def send_batch(host, batch):
+        batch[0].future.set_result(None)
+        raise RuntimeError('bulk request failed')
+
+    batcher = AsyncBatcher(BulkPolicy(max_batch=3), send_batch)
+    futures = [batcher.submit('host1', 'POST', f'group{number}') for number in range(3)]
+    await batcher.close()
+    assert futures[0].result() is None
+    for future in futures[1:]:
+        with pytest.raises(RuntimeError, match='bulk request failed'):
+            future.result()
+
+
+def test_failed_batch_rolls_back_each_group(tmp_path):
+    simulation = SimulatedCluster(seed=1, latency='fixed:0.001', host_models={'host3': {'failure_rate': 1.0}})
+    client = AsyncClusterClient(['host1', 'host2', 'host3'], simulation=simulation, max_retries=1,
+                                bulk=BulkPolicy(max_batch=4), rollback_file=tmp_path / 'rollback.journal')
+
+    async def run():
+        async with client:
+            created = await asyncio.gather(*(client.create_group(f'g{index}') for index in range(4)))
+            return created
+
+    assert simulation.run(run()) == [False] * 4
+    assert simulation.groups['host1'] == set() and simulation.groups['host2'] == set()
+    counts = simulation.request_counts()
+    assert counts['POST'] == 0 and counts['DELETE'] == 0
+    assert client.metrics.bulk_items.value('host3', 'batched') == 4
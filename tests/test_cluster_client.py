@@ -1,13 +1,18 @@
 import pytest
 import httpx
-from unittest.mock import patch, mock_open
+import threading
+from unittest.mock import patch
 
 from app.cluster_client import ClusterClient
+from app.health import HALF_OPEN, HostHealth
+from app.limiter import HostLimits
+from app.retry import Deadline, RetryBudget, RetryPolicy
+from app.status_cache import StatusCache
 
 
 @pytest.fixture
-def cluster_client():
-    return ClusterClient(simulate=False, hosts=['host1', 'host2', 'host3'])
+def cluster_client(tmp_path):
+    return ClusterClient(simulate=False, hosts=['host1', 'host2', 'host3'], rollback_file=tmp_path / 'rollback.journal')
 
 
 def test_create_group_success(cluster_client):
@@ -43,53 +48,66 @@ def test_get_group_status(cluster_client):
         assert status == {'host1': True, 'host2': False, 'host3': True}
 
 
+def test_iter_group_status_stops_when_caller_stops(cluster_client):
+    with patch.object(cluster_client, '_make_get_request', side_effect=[True, False, True]) as mock_get:
+        results = cluster_client.iter_group_status('test_group')
+        assert next(results) == ('host1', True)
+        results.close()
+    assert mock_get.call_count == 1
+
+
 def test_continue_rollbacks_success(cluster_client):
-    mock_file_content = "delete\ntest_group\nhost1\nhost2"
-    with patch('builtins.open', mock_open(read_data=mock_file_content)):
-        with patch('os.path.exists', return_value=True):
-            with patch('os.remove') as mock_remove:
-                with patch.object(cluster_client, '_rollback', return_value=True) as mock_rollback:
-                    assert cluster_client.continue_rollbacks() == True
-                    mock_rollback.assert_called_once_with(
-                        'test_group', 'delete', ['host1', 'host2'])
-                    mock_remove.assert_called_once()
+    cluster_client.journal.add('test_group', 'delete', ['host1', 'host2'])
+    with patch.object(cluster_client, '_make_delete_request', return_value=True) as mock_delete:
+        assert cluster_client.continue_rollbacks() == True
+        assert mock_delete.call_count == 2
+    assert not cluster_client.has_pending_rollbacks()
 
 
-def test_continue_rollbacks_file_not_found(cluster_client):
-    with patch('os.path.exists', return_value=False):
-        try:
-            cluster_client.continue_rollbacks()
-            assert True
-        except Exception as e:
-            pytest.fail(f"Unexpected exception raised: {e}")
+def test_continue_rollbacks_nothing_pending(cluster_client):
+    with patch.object(cluster_client, '_make_delete_request') as mock_delete:
+        assert cluster_client.continue_rollbacks() == True
+        mock_delete.assert_not_called()
 
 
-def test_continue_rollbacks_io_error(cluster_client):
-    with patch('os.path.exists', return_value=True):
-        with patch('builtins.open', side_effect=IOError):
-            assert cluster_client.continue_rollbacks() == False
+def test_continue_rollbacks_only_replays_outstanding_hosts(cluster_client):
+    cluster_client.journal.add('test_group', 'delete', ['host1', 'host2'])
+    with patch.object(cluster_client, '_make_delete_request', side_effect=lambda host, group_id: host == 'host1'):
+        assert cluster_client.continue_rollbacks() == False
+    with patch.object(cluster_client, '_make_delete_request', return_value=True) as mock_delete:
+        assert cluster_client.continue_rollbacks() == True
+        mock_delete.assert_called_once_with(host='host2', group_id='test_group')
 
 
 def test_rollback_success(cluster_client):
     with patch.object(cluster_client, '_make_delete_request', return_value=True):
         assert cluster_client._rollback('test_group', 'delete', [
                                         'host1', 'host2']) == True
+    assert not cluster_client.has_pending_rollbacks()
 
 
 def test_rollback_failure(cluster_client):
-    with patch.object(cluster_client, '_make_delete_request', side_effect=[True, False]):
-        with patch('builtins.open', mock_open()) as mock_file:
-            assert cluster_client._rollback('test_group', 'delete', [
-                                            'host1', 'host2']) == False
-            mock_file().write.assert_any_call('delete\n')
-            mock_file().write.assert_any_call('test_group\n')
-            mock_file().write.assert_any_call('host2\n')
+    with patch.object(cluster_client, '_make_delete_request', side_effect=lambda host, group_id: host == 'host1'):
+        assert cluster_client._rollback('test_group', 'delete', [
+                                        'host1', 'host2']) == False
+    pending = cluster_client.journal.pending()
+    assert len(pending) == 1
+    assert (pending[0].group_id, pending[0].operation,
+            pending[0].hosts) == ('test_group', 'delete', ['host2'])
+
+
+def test_rollback_failures_are_kept_across_operations(cluster_client):
+    with patch.object(cluster_client, '_make_delete_request', return_value=False):
+        cluster_client._rollback('group1', 'delete', ['host1'])
+        cluster_client._rollback('group2', 'delete', ['host2'])
+    assert [entry.group_id for entry in cluster_client.journal.pending()] == [
+        'group1', 'group2']
 
 
 @patch('time.sleep', return_value=None)
 def test_make_post_request_success(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_response = mock_client.return_value.__enter__.return_value.post.return_value
+        mock_response = mock_client.return_value.post.return_value
         mock_response.raise_for_status.return_value = None
         assert cluster_client._make_post_request('host1', 'test_group') == True
 
@@ -97,7 +115,7 @@ def test_make_post_request_success(patched_time_sleep, cluster_client):
 @patch('time.sleep', return_value=None)
 def test_make_post_request_group_exists(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_response = mock_client.return_value.__enter__.return_value.post.return_value
+        mock_response = mock_client.return_value.post.return_value
         mock_response.raise_for_status.side_effect = httpx.HTTPStatusError(
             "400 error", request=None, response=httpx.Response(400)
         )
@@ -107,7 +125,7 @@ def test_make_post_request_group_exists(patched_time_sleep, cluster_client):
 @patch('time.sleep', return_value=None)
 def test_make_post_request_failure(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_client.return_value.__enter__.return_value.post.side_effect = httpx.RequestError(
+        mock_client.return_value.post.side_effect = httpx.RequestError(
             "Connection error")
         assert cluster_client._make_post_request(
             'host1', 'test_group') == False
@@ -116,7 +134,7 @@ def test_make_post_request_failure(patched_time_sleep, cluster_client):
 @patch('time.sleep', return_value=None)
 def test_make_delete_request_success(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_response = mock_client.return_value.__enter__.return_value.delete.return_value
+        mock_response = mock_client.return_value.request.return_value
         mock_response.raise_for_status.return_value = None
         assert cluster_client._make_delete_request(
             'host1', 'test_group') == True
@@ -125,7 +143,7 @@ def test_make_delete_request_success(patched_time_sleep, cluster_client):
 @patch('time.sleep', return_value=None)
 def test_make_delete_request_failure(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_client.return_value.__enter__.return_value.delete.side_effect = Exception(
+        mock_client.return_value.request.side_effect = Exception(
             "Delete error")
         assert cluster_client._make_delete_request(
             'host1', 'test_group') == False
@@ -134,7 +152,7 @@ def test_make_delete_request_failure(patched_time_sleep, cluster_client):
 @patch('time.sleep', return_value=None)
 def test_make_get_request_success(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_response = mock_client.return_value.__enter__.return_value.get.return_value
+        mock_response = mock_client.return_value.get.return_value
         mock_response.raise_for_status.return_value = None
         assert cluster_client._make_get_request('host1', 'test_group') == True
 
@@ -142,7 +160,7 @@ def test_make_get_request_success(patched_time_sleep, cluster_client):
 @patch('time.sleep', return_value=None)
 def test_make_get_request_not_found(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_response = mock_client.return_value.__enter__.return_value.get.return_value
+        mock_response = mock_client.return_value.get.return_value
         mock_response.raise_for_status.side_effect = httpx.HTTPStatusError(
             "404 error", request=None, response=httpx.Response(404)
         )
@@ -152,7 +170,7 @@ def test_make_get_request_not_found(patched_time_sleep, cluster_client):
 @patch('time.sleep', return_value=None)
 def test_make_get_request_failure(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_client.return_value.__enter__.return_value.get.side_effect = httpx.RequestError(
+        mock_client.return_value.get.side_effect = httpx.RequestError(
             "Connection error")
         assert cluster_client._make_get_request('host1', 'test_group') == False
 
@@ -160,7 +178,7 @@ def test_make_get_request_failure(patched_time_sleep, cluster_client):
 @patch('time.sleep', return_value=None)
 def test_make_post_request_retry_mechanism(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_post = mock_client.return_value.__enter__.return_value.post
+        mock_post = mock_client.return_value.post
 
         request = httpx.Request('DELETE', 'http://testserver')
         response = httpx.Response(status_code=200, request=request)
@@ -179,20 +197,20 @@ def test_make_post_request_retry_mechanism(patched_time_sleep, cluster_client):
 @patch('time.sleep', return_value=None)
 def test_make_post_request_retry_mechanism_failure(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_post = mock_client.return_value.__enter__.return_value.post
+        mock_post = mock_client.return_value.post
         mock_post.side_effect = httpx.RequestError("Connection error")
 
         assert cluster_client._make_post_request(
             'host1', 'test_group') == False
 
-        assert patched_time_sleep.call_count == 3
+        assert patched_time_sleep.call_count == 2
         assert mock_post.call_count == 3
 
 
 @patch('time.sleep', return_value=None)
 def test_make_delete_request_retry_mechanism(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_delete = mock_client.return_value.__enter__.return_value.delete
+        mock_delete = mock_client.return_value.request
 
         request = httpx.Request('DELETE', 'http://testserver')
         response = httpx.Response(status_code=200, request=request)
@@ -212,20 +230,20 @@ def test_make_delete_request_retry_mechanism(patched_time_sleep, cluster_client)
 @patch('time.sleep', return_value=None)
 def test_make_delete_request_retry_mechanism_failure(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_delete = mock_client.return_value.__enter__.return_value.delete
+        mock_delete = mock_client.return_value.request
         mock_delete.side_effect = Exception("Delete error")
 
         assert cluster_client._make_delete_request(
             'host1', 'test_group') == False
 
-        assert patched_time_sleep.call_count == 3
+        assert patched_time_sleep.call_count == 2
         assert mock_delete.call_count == 3
 
 
 @patch('time.sleep', return_value=None)
 def test_make_get_request_retry_mechanism(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_get = mock_client.return_value.__enter__.return_value.get
+        mock_get = mock_client.return_value.get
 
         request = httpx.Request('GET', 'http://testserver')
         response = httpx.Response(status_code=200, request=request)
@@ -244,10 +262,197 @@ def test_make_get_request_retry_mechanism(patched_time_sleep, cluster_client):
 @patch('time.sleep', return_value=None)
 def test_make_get_request_retry_mechanism_failure(patched_time_sleep, cluster_client):
     with patch('httpx.Client') as mock_client:
-        mock_get = mock_client.return_value.__enter__.return_value.get
+        mock_get = mock_client.return_value.get
         mock_get.side_effect = httpx.RequestError("Connection error")
 
         assert cluster_client._make_get_request('host1', 'test_group') == False
 
-        assert patched_time_sleep.call_count == 3
+        assert patched_time_sleep.call_count == 2
         assert mock_get.call_count == 3
+
+
+def test_continue_rollbacks_runs_hosts_in_parallel(tmp_path):
+    client = ClusterClient(hosts=[], rollback_parallelism=4,
+                           rollback_file=tmp_path / 'rollback.journal')
+    client.journal.add('group1', 'delete', ['host1', 'host2'])
+    client.journal.add('group2', 'create', ['host3', 'host4'])
+    barrier = threading.Barrier(4, timeout=5)
+
+    def request(host, group_id):
+        barrier.wait()
+        return True
+
+    with patch.object(client, '_make_delete_request', side_effect=request), \
+            patch.object(client, '_make_post_request', side_effect=request):
+        assert client.continue_rollbacks() == True
+    assert not client.has_pending_rollbacks()
+    client.close()
+
+
+def test_wait_for_rollbacks_ignores_other_groups(cluster_client):
+    cluster_client.journal.add('group1', 'delete', ['host1'])
+    cluster_client.journal.add('group2', 'delete', ['host2'])
+    release = threading.Event()
+
+    def request(host, group_id):
+        if group_id == 'group2':
+            release.wait(5)
+        return True
+
+    with patch.object(cluster_client, '_make_delete_request', side_effect=request):
+        cluster_client.start_rollback_drain()
+        assert cluster_client.wait_for_rollbacks('group1') == True
+        assert [e.group_id for e in cluster_client.journal.pending()] == ['group2']
+        release.set()
+        cluster_client.close()
+    assert not cluster_client.has_pending_rollbacks()
+
+
+def test_create_group_fails_fast_when_breaker_open(cluster_client):
+    cluster_client.health = HostHealth(failure_threshold=1)
+    cluster_client.health.record_failure('host3')
+    with patch.object(cluster_client, '_make_post_request') as mock_post, \
+            patch.object(cluster_client, '_rollback') as mock_rollback:
+        assert cluster_client.create_group('test_group') == False
+        mock_post.assert_not_called()
+        mock_rollback.assert_not_called()
+
+
+def test_get_group_status_marks_open_host_unknown(cluster_client):
+    cluster_client.health = HostHealth(failure_threshold=1)
+    cluster_client.health.record_failure('host2')
+    with patch.object(cluster_client, '_make_get_request', return_value=True) as mock_get:
+        status = cluster_client.get_group_status('test_group')
+        assert status == {'host1': True, 'host2': None, 'host3': True}
+        assert mock_get.call_count == 2
+
+
+@patch('time.sleep', return_value=None)
+def test_request_stops_retrying_once_breaker_opens(patched_time_sleep, cluster_client):
+    cluster_client.health = HostHealth(failure_threshold=2)
+    with patch('httpx.Client') as mock_client:
+        mock_post = mock_client.return_value.post
+        mock_post.side_effect = httpx.RequestError("Connection error")
+        assert cluster_client._make_post_request('host1', 'test_group') == False
+        assert mock_post.call_count == 2
+
+
+@patch('time.sleep', return_value=None)
+def test_client_errors_do_not_open_breaker(patched_time_sleep, cluster_client):
+    cluster_client.health = HostHealth(failure_threshold=2)
+    with patch('httpx.Client') as mock_client:
+        mock_post = mock_client.return_value.post
+        mock_post.return_value = httpx.Response(409, request=httpx.Request('POST', 'http://host1/v1/group/'))
+        assert cluster_client._make_post_request('host1', 'test_group') == False
+        assert cluster_client._make_post_request('host1', 'test_group') == False
+    assert not cluster_client.health.is_open('host1')
+
+
+@patch('time.sleep', return_value=None)
+def test_retry_budget_is_shared_across_requests(patched_time_sleep, cluster_client):
+    cluster_client.retry_policy = RetryPolicy(
+        max_attempts=3, budget=RetryBudget(ratio=0, min_per_second=0, max_tokens=2))
+    with patch('httpx.Client') as mock_client:
+        mock_post = mock_client.return_value.post
+        mock_post.side_effect = httpx.RequestError("Connection error")
+        assert cluster_client._make_post_request('host1', 'test_group') == False
+        assert cluster_client._make_post_request('host2', 'test_group') == False
+        assert mock_post.call_count == 4
+
+
+@patch('time.sleep', return_value=None)
+def test_deadline_caps_request_timeout(patched_time_sleep, cluster_client):
+    with patch('httpx.Client') as mock_client:
+        mock_post = mock_client.return_value.post
+        cluster_client._make_post_request(
+            'host1', 'test_group', deadline=Deadline(0.25))
+        assert mock_post.call_args.kwargs['timeout'] <= 0.25
+
+
+def test_expired_deadline_skips_request(cluster_client):
+    deadline = Deadline(0)
+    with patch('httpx.Client') as mock_client:
+        assert cluster_client._make_get_request(
+            'host1', 'test_group', deadline=deadline) == False
+        mock_client.return_value.get.assert_not_called()
+
+
+def test_deadline_expiring_during_half_open_keeps_the_trial(cluster_client):
+    now = [0.0]
+    cluster_client.health = HostHealth(failure_threshold=1, recovery_timeout=10, clock=lambda: now[0])
+    cluster_client.health.record_failure('host1')
+    now[0] = 10
+    cluster_client.limits = HostLimits(rate=1, burst=1)
+    cluster_client.limits.limiter('host1').reserve()
+    with patch('httpx.Client') as mock_client:
+        assert cluster_client._make_get_request('host1', 'test_group', deadline=Deadline(0)) == False
+        assert cluster_client._make_get_request('host1', 'test_group', deadline=Deadline(0.1)) == False
+        mock_client.return_value.get.assert_not_called()
+    assert cluster_client.health.state('host1') == HALF_OPEN
+    assert cluster_client.health.allow_request('host1')
+
+
+def test_operation_timeout_is_shared_by_all_hosts(cluster_client):
+    cluster_client.operation_timeout = 10
+    with patch.object(cluster_client, '_make_post_request', return_value=True) as mock_post:
+        cluster_client.create_group('test_group')
+    deadlines = {id(call.kwargs['deadline']) for call in mock_post.call_args_list}
+    assert len(deadlines) == 1
+
+
+def test_status_cache_serves_repeated_reads(cluster_client, httpx_mock):
+    cluster_client.status_cache = StatusCache(ttl=60)
+    httpx_mock.add_response(url='http://host1/v1/group//test_group')
+    assert cluster_client._make_get_request('host1', 'test_group') == True
+    assert cluster_client._make_get_request('host1', 'test_group') == True
+    assert len(httpx_mock.get_requests()) == 1
+
+
+def test_status_cache_revalidates_with_etag(cluster_client, httpx_mock):
+    cluster_client.status_cache = StatusCache(ttl=0)
+    httpx_mock.add_response(url='http://host1/v1/group//test_group',
+                            status_code=404, headers={'ETag': '"v1"'})
+    httpx_mock.add_response(url='http://host1/v1/group//test_group',
+                            match_headers={'If-None-Match': '"v1"'}, status_code=304)
+    assert cluster_client._make_get_request('host1', 'test_group') == False
+    assert cluster_client._make_get_request('host1', 'test_group') == False
+    assert len(httpx_mock.get_requests()) == 2
+
+
+def test_not_modified_without_cached_status_reads_again(cluster_client, httpx_mock):
+    cluster_client.status_cache = StatusCache(ttl=0)
+
+    def evicted(request):
+        cluster_client.status_cache.invalidate('host1', 'test_group')
+        return httpx.Response(304)
+
+    httpx_mock.add_response(url='http://host1/v1/group//test_group', headers={'ETag': '"v1"'})
+    httpx_mock.add_callback(evicted, url='http://host1/v1/group//test_group',
+                            match_headers={'If-None-Match': '"v1"'})
+    httpx_mock.add_response(url='http://host1/v1/group//test_group', status_code=404)
+    assert cluster_client._make_get_request('host1', 'test_group') == True
+    assert cluster_client._make_get_request('host1', 'test_group') == False
+    requests = httpx_mock.get_requests()
+    assert len(requests) == 3
+    assert 'If-None-Match' not in requests[2].headers
+
+
+def test_writes_update_status_cache(cluster_client, httpx_mock):
+    cluster_client.status_cache = StatusCache(ttl=60)
+    httpx_mock.add_response(method='POST', url='http://host1/v1/group/')
+    httpx_mock.add_response(method='DELETE', url='http://host2/v1/group/')
+    cluster_client._make_post_request('host1', 'test_group')
+    cluster_client._make_delete_request('host2', 'test_group')
+    assert cluster_client.status_cache.get('host1', 'test_group')[0].exists is True
+    assert cluster_client.status_cache.get('host2', 'test_group')[0].exists is False
+
+
+@patch('time.sleep', return_value=None)
+def test_failed_write_invalidates_status_cache(patched_time_sleep, cluster_client):
+    cluster_client.status_cache = StatusCache(ttl=60)
+    cluster_client.status_cache.put('host1', 'test_group', False)
+    with patch('httpx.Client') as mock_client:
+        mock_client.return_value.post.side_effect = httpx.RequestError(
+            "Connection error")
+        cluster_client._make_post_request('host1', 'test_group')
+    assert cluster_client.status_cache.get('host1', 'test_group') == (None, False)
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.async_cluster_client import AsyncClusterClient
+from app.cluster_client import ClusterClient
+from app.coalescing import AsyncKeyedLocks, AsyncSingleFlight, KeyedLocks, SingleFlight
+from app.simulation import SimulatedCluster
+
+HOSTS = ['host1', 'host2', 'host3']
+
+
+def run_threads(count, target):
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def run(index):
+        barrier.wait()
+        results[index] = target(index)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight_shares_one_call():
+    flight = SingleFlight()
+    calls = []
+    joined = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.05)
+        return 'result'
+
+    results = run_threads(4, lambda _: flight.run('key', slow, on_join=lambda: joined.append(1)))
+    assert results == ['result'] * 4
+    assert len(calls) == 1 and len(joined) == 3
+    assert flight.in_flight() == 0
+
+
+def test_single_flight_shares_exceptions():
+    flight = SingleFlight()
+
+    def fail():
+        time.sleep(0.05)
+        raise ValueError('failed')
+
+    def call(_):
+        try:
+            flight.run('key', fail)
+        except ValueError as e:
+            return str(e)
+
+    assert run_threads(3, call) == ['failed'] * 3
+
+
+def test_keyed_locks_serialize_one_key_only():
+    locks = KeyedLocks()
+    active = {'group1': 0, 'group2': 0}
+    peak = {'group1': 0, 'group2': 0}
+
+    def work(index):
+        key = 'group1' if index % 2 else 'group2'
+        with locks.hold(key):
+            active[key] += 1
+            peak[key] = max(peak[key], active[key])
+            time.sleep(0.01)
+            active[key] -= 1
+
+    run_threads(6, work)
+    assert peak == {'group1': 1, 'group2': 1}
+    assert locks._locks == {}
+
+
+def test_concurrent_status_reads_share_one_fan_out(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0')
+    with ClusterClient(HOSTS, simulation=simulation, rollback_file=tmp_path / 'rollback.journal') as client:
+        original = client.iter_group_status
+
+        def slow_status(group_id):
+            time.sleep(0.05)
+            return original(group_id)
+
+        client.iter_group_status = slow_status
+        results = run_threads(4, lambda _: client.get_group_status('group1'))
+    assert results == [dict.fromkeys(HOSTS, False)] * 4
+    assert simulation.request_counts() == {'GET': 3}
+    assert client.metrics.coalesced.value('status') == 3
+
+
+@pytest.mark.asyncio
+async def test_async_single_flight_survives_a_cancelled_caller():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'result'
+
+    first = asyncio.ensure_future(flight.run('key', slow))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(flight.run('key', slow))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == 'result'
+    assert len(calls) == 1
+    await asyncio.sleep(0)
+    assert flight.in_flight() == 0
+
+
+@pytest.mark.asyncio
+async def test_async_keyed_locks_are_dropped_when_free():
+    locks = AsyncKeyedLocks()
+    order = []
+
+    async def work(name):
+        async with locks.hold('group1'):
+            order.append(f'{name} start')
+            await asyncio.sleep(0)
+            order.append(f'{name} end')
+
+    await asyncio.gather(work('a'), work('b'))
+    assert order == ['a start', 'a end', 'b start', 'b end']
+    assert locks._locks == {}
+
+
+@pytest.mark.asyncio
+async def test_duplicate_creates_share_one_fan_out(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0.01')
+    async with AsyncClusterClient(HOSTS, simulation=simulation, retry_timeout=0,
+                                  rollback_file=tmp_path / 'rollback.journal') as client:
+        results = await asyncio.gather(*(client.create_group('group1') for _ in range(5)))
+        statuses = await asyncio.gather(*(client.get_group_status('group1') for _ in range(5)))
+    assert results == [True] * 5
+    assert statuses == [dict.fromkeys(HOSTS, True)] * 5
+    assert simulation.request_counts() == {'POST': 3, 'GET': 3}
+    assert client.metrics.coalesced.value('create') == 4
+
+
+@pytest.mark.asyncio
+async def test_create_and_delete_of_a_group_do_not_interleave(tmp_path):
+    simulation = SimulatedCluster(latency='uniform:0.001,0.02')
+    async with AsyncClusterClient(HOSTS, simulation=simulation, retry_timeout=0,
+                                  rollback_file=tmp_path / 'rollback.journal') as client:
+        results = await asyncio.gather(client.create_group('group1'), client.delete_group('group1'),
+                                       client.create_group('group2'))
+    assert results == [True, True, True]
+    assert all(simulation.groups[host] == {'group2'} for host in HOSTS)
+
+
+@pytest.mark.asyncio
+async def test_a_mutation_does_not_join_one_queued_before_a_different_mutation(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0.01')
+    async with AsyncClusterClient(HOSTS, simulation=simulation, retry_timeout=0,
+                                  rollback_file=tmp_path / 'rollback.journal') as client:
+        await client.create_group('group1')
+        results = await asyncio.gather(client.delete_group('group1'), client.create_group('group1'),
+                                       client.delete_group('group1'), client.delete_group('group1'))
+    assert results == [True] * 4
+    assert all(simulation.groups[host] == set() for host in HOSTS)
+    assert simulation.request_counts() == {'POST': 6, 'DELETE': 6}
+    assert client.metrics.coalesced.value('delete') == 1
+    assert client._mutation_keys._latest == {}
+
+
+def test_sync_mutation_does_not_join_one_queued_before_a_different_mutation(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0.02')
+    with ClusterClient(HOSTS, simulation=simulation, rollback_file=tmp_path / 'rollback.journal') as client:
+        client.create_group('group1')
+        calls = [client.delete_group, client.create_group, client.delete_group]
+        threads = []
+        for call in calls:
+            threads.append(threading.Thread(target=call, args=('group1',)))
+            threads[-1].start()
+            time.sleep(0.005)
+        for thread in threads:
+            thread.join()
+    assert all(simulation.groups[host] == set() for host in HOSTS)
+    assert simulation.request_counts() == {'POST': 6, 'DELETE': 6}
+    assert client._mutation_keys._latest == {}
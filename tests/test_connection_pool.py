@@ -0,0 +1,59 @@
+import pytest
+import httpx
+from unittest.mock import patch, Mock
+
+from app.cluster_client import ClusterClient
+from app.connection_pool import ConnectionPool
+
+
+def test_client_is_reused_per_host():
+    pool = ConnectionPool()
+    assert pool.client('host1') is pool.client('host1')
+    assert pool.client('host1') is not pool.client('host2')
+    pool.close()
+
+
+def test_pool_limits_are_configurable():
+    pool = ConnectionPool(max_connections=5,
+                          max_keepalive_connections=2, keepalive_expiry=30)
+    assert pool.limits.max_connections == 5
+    assert pool.limits.max_keepalive_connections == 2
+    assert pool.limits.keepalive_expiry == 30
+
+
+def test_close_closes_all_clients():
+    pool = ConnectionPool()
+    client = pool.client('host1')
+    pool.close()
+    assert client.is_closed
+    assert pool.client('host1') is not client
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_aclose_closes_async_clients():
+    pool = ConnectionPool()
+    client = pool.async_client('host1')
+    await pool.aclose()
+    assert client.is_closed
+
+
+@patch('time.sleep', return_value=None)
+def test_cluster_client_reuses_connection_across_retries(patched_time_sleep):
+    with patch('httpx.Client') as mock_client:
+        mock_client.return_value.post.side_effect = [
+            httpx.RequestError("Connection error"), Mock(), Mock()]
+        with ClusterClient(hosts=['host1']) as client:
+            client._make_post_request('host1', 'test_group')
+            client._make_post_request('host1', 'test_group')
+        assert mock_client.call_count == 1
+        mock_client.return_value.close.assert_called_once()
+
+
+def test_cluster_client_does_not_close_shared_pool():
+    pool = ConnectionPool()
+    http_client = pool.client('host1')
+    with ClusterClient(hosts=['host1'], pool=pool):
+        pass
+    assert not http_client.is_closed
+    pool.close()
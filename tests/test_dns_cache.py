@@ -0,0 +1,126 @@
+import asyncio
+import socket
+import ssl
+from unittest.mock import patch
+
+import httpcore
+import httpx
+import pytest
+
+from app.connection_pool import ConnectionPool
+from app.dns_cache import AsyncCachedDnsTransport, CachedDnsTransport, DnsCache, host_name
+from app.fake_server import FakeNode
+from app.simulation import VirtualClock
+
+
+class CountingResolver:
+    def __init__(self, addresses):
+        self.addresses = addresses
+        self.lookups = []
+
+    def __call__(self, name):
+        self.lookups.append(name)
+        if name not in self.addresses:
+            raise socket.gaierror(f"unknown host {name}")
+        return self.addresses[name]
+
+
+def test_host_name():
+    assert host_name('node1.example.com') == 'node1.example.com'
+    assert host_name('node1:8080') == 'node1'
+    assert host_name('[::1]:8080') == '::1'
+
+
+def test_caches_for_ttl_and_failures_for_negative_ttl():
+    clock = VirtualClock()
+    resolver = CountingResolver({'node1': '10.0.0.1'})
+    dns = DnsCache(ttl=60, negative_ttl=5, resolver=resolver, clock=clock)
+    assert dns.resolve('node1') == '10.0.0.1'
+    assert dns.resolve('node1') == '10.0.0.1'
+    assert dns.resolve('missing') is None
+    assert dns.resolve('missing') is None
+    assert resolver.lookups == ['node1', 'missing']
+    clock.sleep(10)
+    dns.resolve('node1')
+    dns.resolve('missing')
+    assert resolver.lookups == ['node1', 'missing', 'missing']
+    clock.sleep(60)
+    dns.resolve('node1')
+    assert resolver.lookups[-1] == 'node1'
+    assert dns.resolve('127.0.0.1') == '127.0.0.1'
+    assert 'node1' in resolver.lookups and '127.0.0.1' not in resolver.lookups
+
+
+def test_pre_resolve():
+    resolver = CountingResolver({'node1': '10.0.0.1', 'node2': '10.0.0.2'})
+    dns = DnsCache(resolver=resolver)
+    assert dns.pre_resolve(['node1:8080', 'node2', 'node3']) == {
+        'node1:8080': '10.0.0.1', 'node2': '10.0.0.2', 'node3': None}
+    assert dns.cached('node1') == (True, '10.0.0.1')
+
+
+@pytest.fixture
+def node():
+    node = FakeNode().start()
+    yield node
+    node.stop()
+
+
+def test_pool_connects_to_cached_address(node):
+    port = node.server.server_address[1]
+    resolver = CountingResolver({'node-a': '127.0.0.1'})
+    pool = ConnectionPool(dns_cache=DnsCache(resolver=resolver))
+    try:
+        response = pool.client(f'node-a:{port}').post(f'http://node-a:{port}/v1/group/', json={'groupId': 'g1'})
+        assert response.status_code == 201
+    finally:
+        pool.close()
+    assert resolver.lookups == ['node-a']
+    assert node.groups == {'g1'}
+
+
+def test_async_pool_connects_to_cached_address(node):
+    port = node.server.server_address[1]
+    resolver = CountingResolver({'node-a': '127.0.0.1'})
+    pool = ConnectionPool(dns_cache=DnsCache(resolver=resolver))
+
+    async def run():
+        try:
+            response = await pool.async_client(f'node-a:{port}').get(f'http://node-a:{port}/v1/group/g1')
+            return response.status_code
+        finally:
+            await pool.aclose()
+
+    assert asyncio.run(run()) == 404
+    assert resolver.lookups == ['node-a']
+
+
+def test_failed_connection_drops_entry():
+    resolver = CountingResolver({'node-a': '127.0.0.1'})
+    dns = DnsCache(resolver=resolver)
+    pool = ConnectionPool(dns_cache=dns)
+    # Nothing listens on port 9 (discard) here.
+    try:
+        with pytest.raises(httpx.ConnectError):
+            pool.client('node-a:9').get('http://node-a:9/v1/group/g1')
+    finally:
+        pool.close()
+    assert dns.cached('node-a') == (False, None)
+
+
+def test_transports_build_one_pool_with_the_given_settings():
+    limits = httpx.Limits(max_connections=3)
+    with patch('httpcore.ConnectionPool', wraps=httpcore.ConnectionPool) as pool_class:
+        transport = CachedDnsTransport(DnsCache(), limits, verify=False, retries=2)
+    assert pool_class.call_count == 1
+    options = pool_class.call_args.kwargs
+    assert options['retries'] == 2
+    assert options['max_connections'] == 3
+    assert options['ssl_context'].verify_mode == ssl.CERT_NONE
+    transport.close()
+
+    with patch('httpcore.AsyncConnectionPool', wraps=httpcore.AsyncConnectionPool) as pool_class:
+        AsyncCachedDnsTransport(DnsCache(), limits, retries=1)
+    assert pool_class.call_count == 1
+    assert pool_class.call_args.kwargs['retries'] == 1
+    assert pool_class.call_args.kwargs['ssl_context'].verify_mode == ssl.CERT_REQUIRED
@@ -0,0 +1,64 @@
+import random
+import httpx
+import pytest
+
+from app.cluster_client import ClusterClient
+from app.fake_server import FakeCluster, FakeNode, parse_latency
+
+
+@pytest.fixture
+def node():
+    node = FakeNode().start()
+    yield node
+    node.stop()
+
+
+def test_parse_latency():
+    rng = random.Random(0)
+    assert parse_latency('fixed:0.5')(rng) == 0.5
+    assert 1 <= parse_latency('uniform:1,2')(rng) <= 2
+    assert parse_latency('exp:0.01')(rng) >= 0
+    with pytest.raises(ValueError):
+        parse_latency('normal:1')
+
+
+def test_node_implements_group_contract(node):
+    url = f"http://{node.host}/v1/group/"
+    with httpx.Client() as http:
+        assert http.get(f"{url}g1").status_code == 404
+        assert http.post(url, json={'groupId': 'g1'}).status_code == 201
+        assert http.post(url, json={'groupId': 'g1'}).status_code == 400
+        assert http.get(f"{url}/g1").status_code == 200
+        assert http.request('DELETE', url, json={'groupId': 'g1'}).status_code == 200
+        assert http.request('DELETE', url, json={'groupId': 'g1'}).status_code == 200
+        assert http.get(f"{url}g1").status_code == 404
+    assert node.requests == {'GET': 3, 'POST': 2, 'DELETE': 2}
+
+
+def test_node_error_rate():
+    node = FakeNode(error_rate=1.0).start()
+    try:
+        response = httpx.post(f"http://{node.host}/v1/group/", json={'groupId': 'g1'})
+        assert response.status_code == 500
+        assert node.groups == set()
+    finally:
+        node.stop()
+
+
+def test_node_exists_rate():
+    node = FakeNode(exists_rate=1.0).start()
+    try:
+        response = httpx.post(f"http://{node.host}/v1/group/", json={'groupId': 'g1'})
+        assert response.status_code == 400
+    finally:
+        node.stop()
+
+
+def test_cluster_client_round_trip(tmp_path):
+    with FakeCluster(nodes=3) as cluster:
+        with ClusterClient(cluster.hosts, rollback_file=tmp_path / 'rollback.journal') as client:
+            assert client.create_group('g1') == True
+            assert client.get_group_status('g1') == {host: True for host in cluster.hosts}
+            assert client.delete_group('g1') == True
+            assert client.get_group_status('g1') == {host: False for host in cluster.hosts}
+        assert all(node.groups == set() for node in cluster.nodes)
@@ -0,0 +1,102 @@
+import threading
+
+from app.health import CircuitBreaker, HostHealth, CLOSED, OPEN, HALF_OPEN
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, clock=FakeClock())
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CLOSED
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, clock=FakeClock())
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_breaker_half_opens_after_recovery_timeout():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+
+
+def test_half_open_trial_closes_or_reopens():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    clock.now = 20
+    breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_released_trial_can_be_taken_again():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow_request()
+    breaker.release_trial()
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+
+
+def test_host_health_tracks_hosts_separately():
+    health = HostHealth(failure_threshold=1, clock=FakeClock())
+    health.record_failure('host1')
+    assert health.open_hosts(['host1', 'host2']) == ['host1']
+    assert health.allow_request('host2')
+
+
+def test_background_probe_recovers_host():
+    clock = FakeClock()
+    recovered = threading.Event()
+
+    def probe(host):
+        recovered.set()
+        return True
+
+    health = HostHealth(failure_threshold=1, recovery_timeout=0,
+                        probe_interval=0.01, probe=probe, clock=clock)
+    health.record_failure('host1')
+    assert recovered.wait(5)
+    health.stop()
+    assert health.state('host1') == CLOSED
+
+
+def test_no_probe_thread_without_probe():
+    health = HostHealth(failure_threshold=1)
+    health.record_failure('host1')
+    assert health._probe_thread is None
+
+
+def test_order_by_risk():
+    health = HostHealth()
+    health.observe('host2', False, 0.01)
+    health.observe('host3', True, 0.5)
+    assert health.order_by_risk(['host1', 'host2', 'host3']) == ['host2', 'host3', 'host1']
+    assert health.risky_hosts(['host1', 'host2', 'host3'], 0.05) == ['host2']
@@ -0,0 +1,143 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.async_cluster_client import AsyncClusterClient
+from app.cluster_client import ClusterClient
+from app.health import HALF_OPEN, HostHealth
+from app.hedging import HedgePolicy
+
+
+def warmed_policy(**options):
+    policy = HedgePolicy(min_samples=20, **options)
+    for _ in range(20):
+        policy.record('host1', 0.01)
+    return policy
+
+
+def test_delay_needs_enough_samples():
+    policy = HedgePolicy(min_samples=3, percentile=0.5)
+    policy.record('host1', 0.3)
+    policy.record('host1', 0.1)
+    assert policy.delay('host1') is None
+    policy.record('host1', 0.2)
+    assert policy.delay('host1') == 0.2
+    assert policy.delay('host2') is None
+
+
+def test_outstanding_hedges_are_capped():
+    policy = HedgePolicy(max_outstanding=1)
+    assert policy.try_start()
+    assert not policy.try_start()
+    policy.finish()
+    assert policy.try_start()
+
+
+def slow_then_fast(sleep):
+    calls = []
+
+    def read():
+        calls.append(len(calls))
+        return sleep(0.5 if len(calls) == 1 else 0, f"response{len(calls)}")
+
+    return read, calls
+
+
+def test_sync_hedge_answers_first(tmp_path):
+    def sleep(delay, value):
+        time.sleep(delay)
+        return value
+
+    read, calls = slow_then_fast(sleep)
+    with ClusterClient(['host1'], hedging=warmed_policy(), rollback_file=tmp_path / 'rollback.journal') as client:
+        start = time.monotonic()
+        assert client._send_hedged('host1', read) == 'response2'
+        assert time.monotonic() - start < 0.4
+        assert client.metrics.hedges.value('host1') == 1
+    assert calls == [0, 1]
+
+
+def test_sync_hedges_do_not_queue_behind_busy_workers(tmp_path):
+    release = threading.Event()
+
+    def read():
+        return 'response'
+
+    with ClusterClient(['host1'], hedging=warmed_policy(max_outstanding=1), max_connections=1,
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        assert client._send_hedged('host1', read) == 'response'
+        assert client._hedge_executor('host1')._max_workers == 2
+        for _ in range(2):
+            client._hedge_executor('host1').submit(release.wait)
+        threading.Timer(0.2, release.set).start()
+        start = time.monotonic()
+        assert client._send_hedged('host2', read) == 'response'
+        assert time.monotonic() - start < 0.1
+        assert client._send_hedged('host1', read) == 'response'
+        assert client.metrics.hedges.value('host1') == 0
+
+
+@pytest.mark.asyncio
+async def test_async_hedge_answers_first_and_cancels_the_slow_read(tmp_path):
+    async def sleep(delay, value):
+        await asyncio.sleep(delay)
+        return value
+
+    read, calls = slow_then_fast(sleep)
+    policy = warmed_policy()
+    async with AsyncClusterClient(['host1'], hedging=policy, rollback_file=tmp_path / 'rollback.journal') as client:
+        start = time.monotonic()
+        assert await client._send_hedged('host1', read) == 'response2'
+        assert time.monotonic() - start < 0.4
+    await asyncio.sleep(0)
+    assert calls == [0, 1]
+    assert policy.outstanding == 0
+
+
+@pytest.mark.asyncio
+async def test_async_waits_for_the_first_read_when_hedges_are_exhausted(tmp_path):
+    async def sleep(delay, value):
+        await asyncio.sleep(delay / 10)
+        return value
+
+    read, calls = slow_then_fast(sleep)
+    async with AsyncClusterClient(['host1'], hedging=warmed_policy(max_outstanding=0),
+                                  rollback_file=tmp_path / 'rollback.journal') as client:
+        assert await client._send_hedged('host1', read) == 'response1'
+    assert calls == [0]
+
+
+@pytest.mark.asyncio
+async def test_answered_reads_are_recorded(tmp_path):
+    policy = HedgePolicy()
+
+    async def read():
+        return 'response'
+
+    async with AsyncClusterClient(['host1'], hedging=policy, rollback_file=tmp_path / 'rollback.journal') as client:
+        await client._send_hedged('host1', read)
+    assert len(policy._latencies['host1']) == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_trial_read_frees_the_half_open_breaker(tmp_path):
+    now = [0.0]
+    health = HostHealth(failure_threshold=1, recovery_timeout=10, clock=lambda: now[0])
+    health.record_failure('host1')
+    now[0] = 10
+    started = asyncio.Event()
+
+    async def send(client, timeout):
+        started.set()
+        await asyncio.sleep(10)
+
+    async with AsyncClusterClient(['host1'], health=health, rollback_file=tmp_path / 'rollback.journal') as client:
+        task = asyncio.ensure_future(client._send('Get', 'host1', send))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    assert health.state('host1') == HALF_OPEN
+    assert health.allow_request('host1')
@@ -0,0 +1,62 @@
+import pytest
+
+from app.async_cluster_client import AsyncClusterClient
+from app.cluster_client import ClusterClient
+from app.simulation import SimulatedCluster
+
+HOSTS = ['host1', 'host2', 'host3']
+
+
+def flaky_simulation():
+    return SimulatedCluster(latency='fixed:0', host_models={'host3': {'latency': 'fixed:0', 'failure_rate': 1.0}})
+
+
+def test_risk_ordering_tries_failing_host_first(tmp_path):
+    simulation = flaky_simulation()
+    with ClusterClient(HOSTS, simulation=simulation, max_retries=1, host_ordering='risk',
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        assert client.create_group('group1') == False
+        assert simulation.request_counts() == {'POST': 3, 'DELETE': 2}
+        assert client._ordered_hosts(HOSTS) == ['host3', 'host1', 'host2']
+        assert client.create_group('group2') == False
+    assert simulation.request_counts() == {'POST': 4, 'DELETE': 2}
+
+
+def test_static_ordering_keeps_host_list(tmp_path):
+    simulation = flaky_simulation()
+    with ClusterClient(HOSTS, simulation=simulation, max_retries=1,
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        client.create_group('group1')
+        client.create_group('group2')
+        assert client._ordered_hosts(HOSTS) == HOSTS
+    assert simulation.request_counts() == {'POST': 6, 'DELETE': 4}
+
+
+def test_readiness_check_probes_risky_hosts_before_writing(tmp_path):
+    simulation = flaky_simulation()
+    with ClusterClient(HOSTS, simulation=simulation, max_retries=1, readiness_check=True,
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        assert client.create_group('group1') == False
+        assert client.create_group('group2') == False
+    assert simulation.request_counts() == {'POST': 3, 'DELETE': 2, 'GET': 1}
+
+
+@pytest.mark.asyncio
+async def test_async_risk_ordering_stages_risky_hosts(tmp_path):
+    simulation = flaky_simulation()
+    async with AsyncClusterClient(HOSTS, simulation=simulation, max_retries=1, host_ordering='risk',
+                                  rollback_file=tmp_path / 'rollback.journal') as client:
+        assert await client.create_group('group1') == False
+        assert client._host_stages(HOSTS) == [['host3'], ['host1', 'host2']]
+        assert await client.create_group('group2') == False
+    assert simulation.request_counts() == {'POST': 4, 'DELETE': 2}
+
+
+@pytest.mark.asyncio
+async def test_async_readiness_check(tmp_path):
+    simulation = flaky_simulation()
+    async with AsyncClusterClient(HOSTS, simulation=simulation, max_retries=1, readiness_check=True,
+                                  rollback_file=tmp_path / 'rollback.journal') as client:
+        await client.create_group('group1')
+        assert await client.create_group('group2') == False
+    assert simulation.request_counts() == {'POST': 3, 'DELETE': 2, 'GET': 1}
@@ -0,0 +1,79 @@
+import os
+import threading
+
+import pytest
+
+from app.inventory import HostInventory, parse_host_line, parse_hosts, parse_selector
+
+
+def test_parse_host_line():
+    assert parse_host_line("node1 zone=a role=primary  # rack 4\n") == ('node1', {'zone': 'a', 'role': 'primary'})
+    assert parse_host_line("node2\n") == ('node2', {})
+    assert parse_host_line("   # comment\n") is None
+    with pytest.raises(ValueError):
+        parse_host_line("node3 zone")
+
+
+def test_parse_selector():
+    matches = parse_selector("zone=a|b, role!=canary")
+    assert matches({'zone': 'a', 'role': 'primary'})
+    assert matches({'zone': 'b'})
+    assert not matches({'zone': 'b', 'role': 'canary'})
+    assert not matches({'zone': 'c'})
+    assert parse_selector(None)({})
+    with pytest.raises(ValueError):
+        parse_selector("zone")
+
+
+def test_parse_hosts_filters_skips_repeats_and_bad_lines():
+    lines = ["node1 zone=a\n", "node2 zone=b\n", "node1 zone=a\n", "node3 zone\n", "node4 zone=a\n"]
+    assert [host.name for host in parse_hosts(lines, "zone=a")] == ['node1', 'node4']
+    assert [host.name for host in parse_hosts(lines)] == ['node1', 'node2', 'node4']
+
+
+def test_parse_hosts_streams():
+    def lines():
+        yield "node1\n"
+        raise AssertionError("read past the first host")
+
+    assert next(parse_hosts(lines())).name == 'node1'
+
+
+def test_inventory_reloads_on_change(tmp_path):
+    path = tmp_path / 'hosts.txt'
+    path.write_text("node1 zone=a\nnode2 zone=b\nnode3 zone=a\n")
+    inventory = HostInventory(path, selector="zone=a")
+    assert inventory.load() == ['node1', 'node3']
+    assert inventory.labels('node3') == {'zone': 'a'}
+    assert not inventory.reload_if_changed()
+    path.write_text("node1 zone=a\nnode2 zone=a\n")
+    os.utime(path, ns=(0, 1))
+    assert inventory.reload_if_changed()
+    assert inventory.hosts == ['node1', 'node2']
+    path.unlink()
+    assert not inventory.reload_if_changed()
+    assert inventory.hosts == ['node1', 'node2']
+
+
+def test_group_by_label(tmp_path):
+    path = tmp_path / 'hosts.txt'
+    path.write_text("node1 zone=a\nnode2 zone=b\nnode3 zone=a\nnode4\n")
+    inventory = HostInventory(path)
+    inventory.load()
+    assert inventory.group_by('zone') == {'a': ['node1', 'node3'], 'b': ['node2'], None: ['node4']}
+
+
+def test_watch_calls_back_with_new_hosts(tmp_path):
+    path = tmp_path / 'hosts.txt'
+    path.write_text("node1\n")
+    inventory = HostInventory(path)
+    inventory.load()
+    changed = threading.Event()
+    seen = []
+    inventory.watch(lambda hosts: (seen.append(hosts), changed.set()), interval=0.01)
+    try:
+        path.write_text("node1\nnode2\n")
+        assert changed.wait(5)
+    finally:
+        inventory.stop()
+    assert seen == [['node1', 'node2']]
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+from app.cluster_client import ClusterClient
+from app.limiter import AdaptiveLimit, HostLimits, TokenBucket
+from app.simulation import SimulatedCluster, VirtualClock
+
+
+def test_token_bucket_spends_burst_then_paces():
+    clock = VirtualClock()
+    bucket = TokenBucket(rate=10, burst=2, clock=clock)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1)
+    assert bucket.reserve() == pytest.approx(0.2)
+    clock.sleep(1)
+    assert bucket.reserve() == 0
+
+
+def test_token_bucket_refuses_waits_past_max_wait():
+    bucket = TokenBucket(rate=1, burst=1, clock=VirtualClock())
+    assert bucket.reserve() == 0
+    assert bucket.reserve(max_wait=0.5) is None
+    assert bucket.reserve(max_wait=1) == pytest.approx(1)
+
+
+def test_token_bucket_refund_returns_a_token():
+    bucket = TokenBucket(rate=1, burst=1, clock=VirtualClock())
+    assert bucket.reserve() == 0
+    bucket.refund()
+    assert bucket.reserve(max_wait=0) == 0
+    bucket.refund()
+    bucket.refund()
+    assert bucket.reserve(max_wait=0) == 0
+    assert bucket.reserve(max_wait=0) is None
+
+
+def test_limit_grows_additively_on_success():
+    limit = AdaptiveLimit(initial_limit=2, max_limit=3)
+    for _ in range(2):
+        assert limit.try_acquire()
+        limit.release(0, 0.01, True)
+    assert limit.limit == pytest.approx(2.9, abs=0.05)
+    for _ in range(10):
+        assert limit.try_acquire()
+        limit.release(0, 0.01, True)
+    assert limit.limit == 3
+
+
+def test_limit_backs_off_once_per_burst_of_failures():
+    limit = AdaptiveLimit(initial_limit=8)
+    for _ in range(4):
+        assert limit.try_acquire()
+    for _ in range(4):
+        limit.release(0, 1, False)
+    assert limit.limit == 4
+    assert limit.try_acquire()
+    limit.release(2, 3, False)
+    assert limit.limit == 2
+
+
+def test_limit_backs_off_when_latency_rises():
+    limit = AdaptiveLimit(initial_limit=8, max_limit=8, latency_tolerance=2)
+    for _ in range(20):
+        limit.try_acquire()
+        limit.release(0, 0.01, True)
+    limit.try_acquire()
+    limit.release(0, 0.05, True)
+    assert limit.limit == 8
+    for start in range(10):
+        limit.try_acquire()
+        limit.release(start, start + 0.1, True)
+    assert limit.limit < 8
+
+
+def test_limit_blocks_at_capacity():
+    limit = AdaptiveLimit(initial_limit=1, max_limit=1)
+    assert limit.acquire()
+    assert limit.acquire(timeout=0.01) is False
+    limit.release(0, 0, True)
+    assert limit.acquire(timeout=0.01)
+
+
+def test_cancel_frees_the_slot_without_moving_the_limit():
+    limit = AdaptiveLimit(initial_limit=1, max_limit=1)
+    assert limit.acquire()
+    limit.cancel()
+    assert limit.in_flight == 0
+    assert limit.limit == 1
+    assert limit.acquire(timeout=0.01)
+
+
+def test_async_waiters_are_woken_on_release():
+    limit = AdaptiveLimit(initial_limit=1, max_limit=1)
+
+    async def run():
+        assert await limit.acquire_async()
+        waiter = asyncio.ensure_future(limit.acquire_async())
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        limit.release(0, 0, True)
+        assert await asyncio.wait_for(waiter, 1)
+        assert await limit.acquire_async(timeout=0.01) is False
+
+    asyncio.run(run())
+
+
+def test_cancelled_async_waiter_does_not_take_a_wakeup():
+    limit = AdaptiveLimit(initial_limit=1, max_limit=1)
+
+    async def run():
+        assert await limit.acquire_async()
+        cancelled = asyncio.ensure_future(limit.acquire_async())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        waiter = asyncio.ensure_future(limit.acquire_async())
+        await asyncio.sleep(0)
+        limit.release(0, 0, True)
+        assert await asyncio.wait_for(waiter, 1)
+        assert not limit._async_waiters
+
+    asyncio.run(run())
+
+
+def test_woken_waiter_that_is_cancelled_passes_the_wakeup_on():
+    limit = AdaptiveLimit(initial_limit=1, max_limit=1)
+
+    async def run():
+        assert await limit.acquire_async()
+        cancelled = asyncio.ensure_future(limit.acquire_async())
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(limit.acquire_async())
+        await asyncio.sleep(0)
+        limit.release(0, 0, True)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert await asyncio.wait_for(waiter, 1)
+        assert limit.in_flight == 1
+
+    asyncio.run(run())
+
+
+def test_client_backs_off_a_failing_host(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0.001', host_models={'host2': {'failure_rate': 1.0}})
+    limits = HostLimits(initial_limit=8, max_limit=8, clock=simulation.clock)
+    with ClusterClient(['host1', 'host2'], simulation=simulation, limits=limits, retry_timeout=0.01,
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        client.get_group_status('group1')
+    assert limits.concurrency_limit('host1') == 8
+    assert limits.concurrency_limit('host2') == 1
+
+
+def test_client_paces_requests_to_the_rate_limit(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0')
+    limits = HostLimits(rate=10, burst=1, clock=simulation.clock)
+    with ClusterClient(['host1'], simulation=simulation, limits=limits,
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        for index in range(5):
+            client.get_group_status(f"group{index}")
+    assert simulation.clock() == pytest.approx(0.4)
+
+
+def test_client_keeps_the_token_when_no_slot_frees_up(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0')
+    limits = HostLimits(rate=1, burst=1, initial_limit=1, max_limit=1, clock=simulation.clock)
+    limiter = limits.limiter('host1')
+    assert limiter.limit.acquire()
+    with ClusterClient(['host1'], simulation=simulation, limits=limits, operation_timeout=0.01,
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        assert client.get_group_status('group1') == {'host1': False}
+    assert limiter.reserve(max_wait=0) == 0
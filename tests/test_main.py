@@ -2,7 +2,7 @@ import pytest
 import logging
 from unittest.mock import patch, mock_open, Mock
 
-from app.main import perform_operation, read_hosts_file, rollback
+from app.main import build_parser, run_operation, perform_operation, read_hosts_file, rollback, rollback_group, import_legacy_rollback_file
 
 logger = logging.getLogger(__name__)
 
@@ -18,6 +18,12 @@ def test_read_hosts_file_success():
         assert result == ['host1', 'host2', 'host3']
 
 
+def test_read_hosts_file_with_selector():
+    with patch('builtins.open', new_callable=mock_open, read_data="host1 zone=a\nhost2 zone=b\nhost3 zone=a"):
+        result = read_hosts_file('dummy_path', selector='zone=a')
+        assert result == ['host1', 'host3']
+
+
 def test_read_hosts_file_empty():
     with patch('builtins.open', new_callable=mock_open, read_data=""):
         result = read_hosts_file('dummy_path')
@@ -36,27 +42,65 @@ def test_read_hosts_file_io_error():
         assert result is None
 
 
-def test_rollback_file_exists_and_continue_rollbacks_succeeds():
-    with patch('os.path.exists', return_value=True):
-        client = Mock()
-        client.continue_rollbacks.return_value = True
-        result = rollback(client)
-        assert result is True
+def test_simulate_flag():
+    parser = build_parser()
+    assert parser.parse_args([]).simulate is True
+    assert parser.parse_args(['--simulate']).simulate is True
+    assert parser.parse_args(['--no-simulate']).simulate is False
+    assert parser.parse_args([]).listen == '127.0.0.1:8080'
 
 
-def test_rollback_file_exists_and_continue_rollbacks_fails():
-    with patch('os.path.exists', return_value=True):
-        client = Mock()
-        client.continue_rollbacks.return_value = False
-        result = rollback(client)
-        assert result is False
+def test_workers_need_a_worker_id():
+    parser = build_parser()
+    args = parser.parse_args(['--batch', 'records.jsonl', '--workers', '2'])
+    with pytest.raises(SystemExit):
+        run_operation(args, parser, cleanup=[])
+
+
+def test_rollback_pending_and_continue_rollbacks_succeeds():
+    client = Mock()
+    client.has_pending_rollbacks.return_value = True
+    client.continue_rollbacks.return_value = True
+    result = rollback(client)
+    assert result is True
+
+
+def test_rollback_pending_and_continue_rollbacks_fails():
+    client = Mock()
+    client.has_pending_rollbacks.return_value = True
+    client.continue_rollbacks.return_value = False
+    result = rollback(client)
+    assert result is False
 
 
-def test_rollback_file_does_not_exist():
-    with patch('os.path.exists', return_value=False):
+def test_rollback_nothing_pending():
+    client = Mock()
+    client.has_pending_rollbacks.return_value = False
+    result = rollback(client)
+    assert result is True
+    client.continue_rollbacks.assert_not_called()
+
+
+def test_rollback_group_waits_only_for_its_group():
+    client = Mock()
+    client.wait_for_rollbacks.return_value = True
+    assert rollback_group(client, 'test_group') is True
+    client.start_rollback_drain.assert_called_once()
+    client.wait_for_rollbacks.assert_called_once_with('test_group')
+    client.continue_rollbacks.assert_not_called()
+
+
+def test_perform_operation_create_refused_when_group_rollback_fails(mock_client):
+    mock_client.wait_for_rollbacks.return_value = False
+    assert perform_operation(mock_client, 'create', 'test_group') is False
+    mock_client.create_group.assert_not_called()
+
+
+def test_import_legacy_rollback_file():
+    with patch('os.path.exists', return_value=True):
         client = Mock()
-        result = rollback(client)
-        assert result is True
+        import_legacy_rollback_file(client)
+        client.journal.import_legacy_file.assert_called_once()
 
 
 @pytest.mark.parametrize("operation, group_name, client_method, client_return, expected_result", [
@@ -81,3 +125,11 @@ def test_perform_operation(mock_client, operation, group_name, client_method, cl
 def test_perform_operation_invalid_operation(mock_client):
     result = perform_operation(mock_client, 'invalid_operation', 'test_group')
     assert result is None
+
+
+def test_perform_operation_status_ndjson(mock_client, capsys):
+    mock_client.iter_group_status = Mock(return_value=iter([('host1', True), ('host2', None)]))
+    assert perform_operation(mock_client, 'status', 'test_group', ndjson=True) is True
+    assert capsys.readouterr().out.splitlines() == [
+        '{"group_name": "test_group", "host": "host1", "exists": true}',
+        '{"group_name": "test_group", "host": "host2", "exists": null}']
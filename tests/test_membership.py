@@ -0,0 +1,78 @@
+import pytest
+
+from app.async_cluster_client import AsyncClusterClient
+from app.membership import MembershipIndex, sweep
+from app.simulation import SimulatedCluster
+
+HOSTS = ['host1', 'host2', 'host3']
+
+
+def make_index():
+    index = MembershipIndex(HOSTS)
+    index.record_status('everywhere', {'host1': True, 'host2': True, 'host3': True})
+    index.record_status('nowhere', {'host1': False, 'host2': False, 'host3': False})
+    index.record_status('partial', {'host1': True, 'host2': False, 'host3': True})
+    index.record_status('unknown', {'host1': True, 'host2': None, 'host3': True})
+    return index
+
+
+def test_queries():
+    index = make_index()
+    assert index.missing_on('host2') == ['nowhere', 'partial']
+    assert index.present_on('host1') == ['everywhere', 'partial', 'unknown']
+    assert index.unknown_on('host2') == ['unknown']
+    assert index.inconsistent() == ['partial']
+    assert index.incomplete() == ['unknown']
+    assert index.status('partial') == {'host1': True, 'host2': False, 'host3': True}
+    assert index.status('missing') == dict.fromkeys(HOSTS)
+
+
+def test_later_results_replace_earlier_ones():
+    index = make_index()
+    index.record('partial', 'host2', True)
+    index.record('everywhere', 'host1', None)
+    assert index.inconsistent() == []
+    assert index.incomplete() == ['everywhere', 'unknown']
+
+
+def test_many_groups():
+    index = MembershipIndex(HOSTS)
+    for number in range(10000):
+        index.record_status(f'group{number}', {'host1': True, 'host2': number % 1000 != 0, 'host3': True})
+    assert index.missing_on('host2') == [f'group{number}' for number in range(0, 10000, 1000)]
+    assert len(index.inconsistent()) == 10
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = tmp_path / 'membership.snapshot'
+    make_index().save(path)
+    loaded = MembershipIndex.load(path)
+    assert loaded.groups == ['everywhere', 'nowhere', 'partial', 'unknown']
+    assert loaded.inconsistent() == ['partial']
+    assert loaded.missing_on('host2') == ['nowhere', 'partial']
+
+
+def test_snapshot_with_changed_hosts(tmp_path):
+    path = tmp_path / 'membership.snapshot'
+    make_index().save(path)
+    loaded = MembershipIndex.load(path, ['host1', 'host4'])
+    assert loaded.status('everywhere') == {'host1': True, 'host4': None}
+    assert loaded.incomplete() == loaded.groups
+
+
+@pytest.mark.asyncio
+async def test_incremental_sweep_only_reads_stale_groups(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0')
+    for host in HOSTS:
+        simulation.groups[host].update({'group1', 'group2'})
+    simulation.groups['host1'].add('group3')
+    groups = ['group1', 'group2', 'group3']
+    async with AsyncClusterClient(HOSTS, simulation=simulation, retry_timeout=0,
+                                  rollback_file=tmp_path / 'rollback.journal') as client:
+        index = await sweep(client, groups, max_in_flight=2)
+        assert index.inconsistent() == ['group3']
+        assert simulation.request_counts() == {'GET': 9}
+
+        index = await sweep(client, groups + ['group4'], index)
+        assert simulation.request_counts() == {'GET': 15}
+        assert index.missing_on('host1') == ['group4']
@@ -0,0 +1,77 @@
+from app.cluster_client import ClusterClient
+from app.metrics import ClientMetrics, Counter, Gauge, Histogram, Registry
+from app.simulation import SimulatedCluster
+
+
+def test_counter_renders_labelled_samples():
+    counter = Counter('requests_total', "Requests.", ('host',))
+    counter.inc('host1')
+    counter.inc('host1', amount=2)
+    counter.inc('host"2')
+    assert counter.value('host1') == 3
+    assert counter.render() == [
+        '# HELP requests_total Requests.',
+        '# TYPE requests_total counter',
+        'requests_total{host="host\\"2"} 1',
+        'requests_total{host="host1"} 3',
+    ]
+
+
+def test_gauge_function_is_evaluated_on_render():
+    values = [5]
+    gauge = Gauge('pending', "Pending.", function=lambda: values[0])
+    assert gauge.render()[-1] == 'pending 5'
+    values[0] = 2
+    assert gauge.render()[-1] == 'pending 2'
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('duration_seconds', "Duration.", ('host',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value, 'host1')
+    assert histogram.count('host1') == 4
+    assert histogram.render()[2:] == [
+        'duration_seconds_bucket{host="host1",le="0.1"} 1',
+        'duration_seconds_bucket{host="host1",le="1"} 3',
+        'duration_seconds_bucket{host="host1",le="+Inf"} 4',
+        'duration_seconds_sum{host="host1"} 4.05',
+        'duration_seconds_count{host="host1"} 4',
+    ]
+
+
+def test_write_textfile(tmp_path):
+    registry = Registry()
+    registry.register(Counter('runs_total', "Runs.")).inc()
+    path = tmp_path / 'client.prom'
+    registry.write_textfile(str(path))
+    assert path.read_text() == '# HELP runs_total Runs.\n# TYPE runs_total counter\nruns_total 1\n'
+    assert [file.name for file in tmp_path.iterdir()] == ['client.prom']
+
+
+def test_client_records_requests(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0.003', host_models={
+        'host2': {'latency': 'fixed:0', 'failure_rate': 1.0}})
+    metrics = ClientMetrics()
+    with ClusterClient(['host1', 'host2'], simulation=simulation, retry_timeout=0, max_retries=2,
+                       metrics=metrics, rollback_file=tmp_path / 'rollback.journal') as client:
+        assert client.create_group('group1') == False
+        assert metrics.attempts.value('host1', 'create') == 1
+        assert metrics.attempts.value('host2', 'create') == 2
+        assert metrics.retries.value('host2', 'create') == 1
+        assert metrics.http_errors.value('host2', 'create', '5xx') == 2
+        assert metrics.rollbacks.value('delete') == 1
+        assert metrics.rollback_failures.value('delete') == 0
+        assert metrics.request_duration.count('host1', 'create') == 1
+        assert metrics.in_flight.value() == 0
+        assert metrics.pending_rollbacks.value() == 0
+        text = metrics.render()
+    assert 'cluster_client_request_duration_seconds_bucket{host="host1",operation="create",le="0.005"} 1' in text
+
+
+def test_client_counts_timeouts_and_pending_rollbacks(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0', host_models={'host2': {'timeout_rate': 1.0}})
+    with ClusterClient(['host1', 'host2'], simulation=simulation, retry_timeout=0, max_retries=1,
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        assert client.get_group_status('group1') == {'host1': False, 'host2': False}
+        assert client.metrics.timeouts.value('host2', 'get') == 1
+        assert client.metrics.http_errors.value('host1', 'get', '4xx') == 1
@@ -0,0 +1,82 @@
+import json
+import threading
+from unittest.mock import Mock
+
+import pytest
+
+from app.cluster_client import ClusterClient
+from app.multi_cluster import MultiClusterClient, read_clusters_file
+from app.rollback_journal import PendingRollback
+from app.simulation import SimulatedCluster
+
+
+def write_clusters(tmp_path, clusters):
+    path = tmp_path / 'clusters.json'
+    path.write_text(json.dumps(clusters))
+    return path
+
+
+def test_read_clusters_file(tmp_path):
+    clusters = {'east': {'hosts_file': 'east.txt', 'max_retries': 3}, 'west': {'hosts': ['w1', 'w2']}}
+    assert read_clusters_file(write_clusters(tmp_path, clusters)) == clusters
+
+
+@pytest.mark.parametrize('clusters', [
+    {},
+    {'east': ['e1']},
+    {'east': {'hosts': ['e1'], 'max_retrys': 3}},
+    {'east': {'hosts': ['e1'], 'hosts_file': 'east.txt'}},
+    {'east': {'hosts': []}},
+])
+def test_read_clusters_file_rejects_invalid(tmp_path, clusters):
+    with pytest.raises(ValueError):
+        read_clusters_file(write_clusters(tmp_path, clusters))
+
+
+def test_runs_every_cluster_with_its_own_hosts(tmp_path):
+    simulation = SimulatedCluster(seed=3, latency='fixed:0.001', host_models={'w2': {'failure_rate': 1.0}})
+    clusters = {
+        'east': ClusterClient(['e1', 'e2'], simulation=simulation, rollback_file=tmp_path / 'east.journal'),
+        'west': ClusterClient(['w1', 'w2'], simulation=simulation, max_retries=1,
+                              rollback_file=tmp_path / 'west.journal'),
+    }
+    with MultiClusterClient(clusters) as multi:
+        results = multi.run_operation('create', 'g1')
+        assert results == {'east': {'success': True, 'pending_rollbacks': []},
+                           'west': {'success': False, 'pending_rollbacks': []}}
+        assert multi.get_group_status('g1') == {'east': {'e1': True, 'e2': True},
+                                                'west': {'w1': False, 'w2': False}}
+    assert simulation.groups['w1'] == set()
+
+
+def mock_client(pending=()):
+    client = Mock()
+    client.wait_for_rollbacks.return_value = True
+    client.journal.pending.return_value = list(pending)
+    return client
+
+
+def test_clusters_run_concurrently():
+    # Each create waits until the other cluster's has started.
+    barrier = threading.Barrier(2, timeout=5)
+    clusters = {'east': mock_client(), 'west': mock_client()}
+    for client in clusters.values():
+        client.create_group.side_effect = lambda group_id: barrier.wait() is not None
+    with MultiClusterClient(clusters) as multi:
+        assert multi.create_group('g1') == {'east': True, 'west': True}
+
+
+def test_reports_failures_and_pending_rollbacks_per_cluster():
+    entry = PendingRollback(1, 'g1', 'delete', ['e1'])
+    clusters = {'east': mock_client(pending=[entry]), 'west': mock_client()}
+    clusters['east'].create_group.return_value = False
+    clusters['west'].create_group.side_effect = RuntimeError("journal is read-only")
+    with MultiClusterClient(clusters) as multi:
+        results = multi.run_operation('create', 'g1')
+    assert results == {
+        'east': {'success': False,
+                 'pending_rollbacks': [{'group_id': 'g1', 'operation': 'delete', 'hosts': ['e1']}]},
+        'west': {'success': False, 'error': "journal is read-only", 'pending_rollbacks': []},
+    }
+    for client in clusters.values():
+        client.close.assert_called_once()
@@ -0,0 +1,153 @@
+import asyncio
+import io
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from app.async_cluster_client import AsyncClusterClient
+from app.partition import HashRing, LeaseStore, PartitionedWorker, run_partitioned_batch
+from app.simulation import SimulatedCluster
+
+HOSTS = ['host1', 'host2', 'host3']
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hash_ring_moves_few_groups_when_a_worker_joins():
+    groups = [f'group{number}' for number in range(2000)]
+    before = HashRing(['worker-0', 'worker-1', 'worker-2'])
+    after = HashRing(['worker-0', 'worker-1', 'worker-2', 'worker-3'])
+    owners = [before.owner(group_id) for group_id in groups]
+    assert {owner: owners.count(owner) for owner in set(owners)}.keys() == {'worker-0', 'worker-1', 'worker-2'}
+    assert min(owners.count(owner) for owner in set(owners)) > 400
+    moved = [group_id for group_id in groups if before.owner(group_id) != after.owner(group_id)]
+    assert all(after.owner(group_id) == 'worker-3' for group_id in moved)
+    assert len(moved) < 800
+
+
+def test_hash_ring_without_workers():
+    assert HashRing([]).owner('group1') is None
+
+
+def test_leases_are_exclusive_until_they_expire(tmp_path):
+    clock = FakeClock()
+    store = LeaseStore(tmp_path / 'leases.db', ttl=10, clock=clock)
+    other = LeaseStore(tmp_path / 'leases.db', ttl=10, clock=clock)
+    assert store.acquire('group1', 'worker-0')
+    assert not other.acquire('group1', 'worker-1')
+    assert store.acquire('group1', 'worker-0')
+    clock.now += 11
+    assert other.acquire('group1', 'worker-1')
+    assert store.holder('group1') == 'worker-1'
+    other.release('group1', 'worker-1')
+    assert store.holder('group1') is None
+    store.close()
+    other.close()
+
+
+def test_heartbeat_keeps_workers_and_leases_alive(tmp_path):
+    clock = FakeClock()
+    store = LeaseStore(tmp_path / 'leases.db', ttl=10, clock=clock)
+    store.heartbeat('worker-0')
+    store.heartbeat('worker-1')
+    store.acquire('group1', 'worker-0')
+    clock.now += 6
+    store.heartbeat('worker-0')
+    clock.now += 6
+    assert store.live_workers() == ['worker-0']
+    assert store.holder('group1') == 'worker-0'
+    store.leave('worker-0')
+    assert store.holder('group1') is None
+    clock.now += 11
+    assert store.live_workers() == []
+    store.close()
+
+
+def test_pending_rollbacks_keep_other_workers_off_a_group(tmp_path):
+    store = LeaseStore(tmp_path / 'leases.db', ttl=10, clock=FakeClock())
+    store.set_rollback_pending('group1', 'worker-0', True)
+    assert not store.acquire('group1', 'worker-1')
+    assert store.acquire('group1', 'worker-0')
+    store.release('group1', 'worker-0')
+    store.replace_rollbacks('worker-0', ['group2'])
+    assert store.pending_rollbacks('group1') == []
+    assert store.pending_rollbacks('group2') == ['worker-0']
+    assert store.acquire('group1', 'worker-1')
+    store.close()
+
+
+def test_store_is_consistent_when_shared_between_threads(tmp_path):
+    store = LeaseStore(tmp_path / 'leases.db', ttl=10, clock=FakeClock())
+    store.heartbeat('worker-0')
+
+    def use_store(number):
+        group_id = f'group{number}'
+        won = store.acquire(group_id, 'worker-0')
+        return won, store.holder(group_id), store.live_workers()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(use_store, range(200)))
+    assert results == [(True, 'worker-0', ['worker-0'])] * 200
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_workers_split_the_batch(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0')
+    records = [{'line': number, 'operation': 'create', 'group_name': f'group{number}'} for number in range(1, 41)]
+    outputs = []
+
+    async def run_worker(worker_id):
+        store = LeaseStore(tmp_path / 'leases.db')
+        worker = PartitionedWorker(store, worker_id, expected_workers=2, join_timeout=5)
+        client = AsyncClusterClient(HOSTS, simulation=simulation, retry_timeout=0,
+                                    rollback_file=tmp_path / f'rollback.{worker_id}.journal')
+        output = io.StringIO()
+        outputs.append(output)
+        async with client:
+            summary = await run_partitioned_batch(client, iter(records), worker, output=output)
+        store.close()
+        return summary
+
+    summaries = await asyncio.gather(run_worker('worker-0'), run_worker('worker-1'))
+    assert sum(summary['total'] for summary in summaries) == 40
+    assert all(summary['total'] > 0 and summary['failed'] == 0 for summary in summaries)
+    results = [json.loads(line) for output in outputs for line in output.getvalue().splitlines()]
+    assert sorted(result['line'] for result in results) == list(range(1, 41))
+    assert simulation.request_counts() == {'POST': 120}
+
+
+@pytest.mark.asyncio
+async def test_record_fails_while_another_worker_holds_the_lease(tmp_path):
+    clock = FakeClock()
+    store = LeaseStore(tmp_path / 'leases.db', ttl=0.05, clock=clock)
+    store.acquire('group1', 'worker-1')
+    worker = PartitionedWorker(store, 'worker-0')
+    clock.now -= 1000
+    result = await worker.run_record(None, {'line': 1, 'operation': 'create', 'group_name': 'group1'})
+    assert result == {'line': 1, 'operation': 'create', 'group_name': 'group1', 'success': False,
+                      'error': "Group is leased by another worker"}
+    store.close()
+
+
+@pytest.mark.asyncio
+async def test_failed_rollback_is_published_before_the_lease_is_released(tmp_path):
+    store = LeaseStore(tmp_path / 'leases.db')
+    worker = PartitionedWorker(store, 'worker-0')
+    client = Mock()
+    client.wait_for_rollbacks = AsyncMock(side_effect=[True, False])
+    client.create_group = AsyncMock(return_value=False)
+    result = await worker.run_record(client, {'line': 1, 'operation': 'create', 'group_name': 'group1'})
+    assert result['success'] is False
+    assert store.holder('group1') is None
+    assert store.pending_rollbacks('group1') == ['worker-0']
+    assert not store.acquire('group1', 'worker-1')
+    store.close()
@@ -0,0 +1,100 @@
+import json
+
+import pytest
+
+from app.async_cluster_client import AsyncClusterClient
+from app.reconcile import plan, read_desired_state, reconcile, reconcile_file
+from app.simulation import SimulatedCluster
+
+HOSTS = ['host1', 'host2', 'host3']
+
+
+@pytest.fixture
+def simulation():
+    simulation = SimulatedCluster(latency='fixed:0')
+    simulation.groups['host1'].add('group1')
+    for host in HOSTS:
+        simulation.groups[host].add('old_group')
+    return simulation
+
+
+def make_client(simulation, tmp_path, **options):
+    return AsyncClusterClient(HOSTS, simulation=simulation, retry_timeout=0,
+                              rollback_file=tmp_path / 'rollback.journal', **options)
+
+
+def test_read_desired_state(tmp_path):
+    path = tmp_path / 'desired.txt'
+    path.write_text("# groups\ngroup1\n\ngroup2\ngroup1\n")
+    assert read_desired_state(path) == ['group1', 'group2']
+
+
+def test_plan_only_touches_hosts_that_differ():
+    statuses = {'group1': {'host1': True, 'host2': False},
+                'group2': {'host1': True, 'host2': True},
+                'old_group': {'host1': False, 'host2': True},
+                'unknown_group': {'host1': None, 'host2': False}}
+    result = plan(['group1', 'group2', 'unknown_group'], statuses)
+    assert result.creates == {'group1': ['host2']}
+    assert result.deletes == {'old_group': ['host2']}
+    assert result.unknown == {'unknown_group': ['host1']}
+
+
+@pytest.mark.asyncio
+async def test_reconcile_applies_minimal_writes(simulation, tmp_path):
+    async with make_client(simulation, tmp_path) as client:
+        summary = await reconcile(client, ['group1', 'group2'], managed=['old_group'])
+    assert summary == {'groups': 3, 'creates': 5, 'deletes': 3, 'unknown': [], 'failed': []}
+    assert all(simulation.groups[host] == {'group1', 'group2'} for host in HOSTS)
+    assert simulation.request_counts() == {'GET': 9, 'POST': 5, 'DELETE': 3}
+
+
+@pytest.mark.asyncio
+async def test_steady_state_makes_no_writes(simulation, tmp_path):
+    async with make_client(simulation, tmp_path) as client:
+        await reconcile(client, ['group1'], managed=['old_group'])
+        before = simulation.request_counts()
+        summary = await reconcile(client, ['group1'], managed=['old_group'])
+    assert summary['creates'] == summary['deletes'] == 0
+    assert simulation.request_counts() - before == {'GET': 6}
+
+
+@pytest.mark.asyncio
+async def test_dry_run_returns_plan_without_writing(simulation, tmp_path):
+    async with make_client(simulation, tmp_path) as client:
+        summary = await reconcile(client, ['group1'], dry_run=True)
+    assert summary['plan']['creates'] == {'group1': ['host2', 'host3']}
+    assert simulation.request_counts() == {'GET': 3}
+
+
+@pytest.mark.asyncio
+async def test_failed_group_is_rolled_back(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0', host_models={'host3': {'latency': 'fixed:0', 'failure_rate': 1.0}})
+    async with make_client(simulation, tmp_path, max_retries=1) as client:
+        summary = await reconcile(client, ['group1'])
+    assert summary['failed'] == ['group1']
+    assert simulation.groups['host1'] == simulation.groups['host2'] == set()
+
+
+@pytest.mark.asyncio
+async def test_pending_rollback_is_retried_before_reconciling(simulation, tmp_path):
+    async with make_client(simulation, tmp_path) as client:
+        client.journal.add('group1', 'delete', ['host2'])
+        summary = await reconcile(client, ['group1'])
+    assert summary['failed'] == []
+    assert not client.has_pending_rollbacks()
+    assert all('group1' in simulation.groups[host] for host in HOSTS)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_file_tracks_managed_groups(simulation, tmp_path):
+    desired = tmp_path / 'desired.txt'
+    managed = tmp_path / 'managed.json'
+    desired.write_text("group1\nold_group\n")
+    await reconcile_file(make_client(simulation, tmp_path), desired, managed)
+    assert json.loads(managed.read_text()) == ['group1', 'old_group']
+    desired.write_text("group1\n")
+    summary = await reconcile_file(make_client(simulation, tmp_path), desired, managed)
+    assert summary['deletes'] == 3
+    assert json.loads(managed.read_text()) == ['group1']
+    assert simulation.groups['host2'] == {'group1'}
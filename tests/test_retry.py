@@ -0,0 +1,77 @@
+import random
+
+from app.retry import Deadline, RetryBudget, RetryPolicy
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_backoff_without_jitter_doubles_up_to_max():
+    policy = RetryPolicy(base_delay=1, max_delay=5, jitter=False)
+    assert [policy.backoff(attempt) for attempt in range(1, 5)] == [1, 2, 4, 5]
+
+
+def test_full_jitter_stays_within_backoff():
+    policy = RetryPolicy(base_delay=1, jitter=True, rng=random.Random(1))
+    delays = [policy.backoff(3) for _ in range(100)]
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_next_delay_stops_after_max_attempts():
+    policy = RetryPolicy(max_attempts=3, jitter=False)
+    assert policy.next_delay(1) == 1
+    assert policy.next_delay(2) == 2
+    assert policy.next_delay(3) is None
+
+
+def test_next_delay_respects_deadline():
+    clock = FakeClock()
+    policy = RetryPolicy(max_attempts=10, base_delay=1, jitter=False)
+    deadline = Deadline(3, clock=clock)
+    assert policy.next_delay(1, deadline) == 1
+    clock.now = 2
+    assert policy.next_delay(1, deadline) is None
+
+
+def test_deadline_caps_request_timeout():
+    clock = FakeClock()
+    deadline = Deadline(5, clock=clock)
+    assert deadline.cap(10) == 5
+    clock.now = 4.5
+    assert deadline.cap(1) == 0.5
+    clock.now = 6
+    assert deadline.expired()
+    assert Deadline(None).cap(1) == 1
+    assert not Deadline(None).expired()
+
+
+def test_retry_budget_caps_retries_to_ratio_of_requests():
+    clock = FakeClock()
+    budget = RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1, clock=clock)
+    assert budget.try_retry()
+    assert not budget.try_retry()
+    budget.record_request()
+    assert not budget.try_retry()
+    budget.record_request()
+    assert budget.try_retry()
+
+
+def test_retry_budget_refills_over_time():
+    clock = FakeClock()
+    budget = RetryBudget(ratio=0, min_per_second=1, max_tokens=1, clock=clock)
+    assert budget.try_retry()
+    assert not budget.try_retry()
+    clock.now = 1
+    assert budget.try_retry()
+
+
+def test_exhausted_budget_stops_retries():
+    budget = RetryBudget(ratio=0, min_per_second=0, max_tokens=0)
+    policy = RetryPolicy(max_attempts=3, budget=budget)
+    assert policy.next_delay(1) is None
@@ -0,0 +1,128 @@
+import os
+import threading
+from unittest.mock import patch
+
+from app.rollback_journal import RollbackJournal
+
+
+def test_add_and_mark_done(tmp_path):
+    journal = RollbackJournal(tmp_path / 'rollback.journal')
+    entry_id = journal.add('group1', 'delete', ['host1', 'host2'])
+    journal.mark_done(entry_id, 'host1')
+    pending = journal.pending()
+    assert [(e.group_id, e.operation, e.hosts) for e in pending] == [
+        ('group1', 'delete', ['host2'])]
+    journal.mark_done(entry_id, 'host2')
+    assert not journal.has_pending()
+
+
+def test_journal_survives_reopen(tmp_path):
+    path = tmp_path / 'rollback.journal'
+    journal = RollbackJournal(path)
+    first = journal.add('group1', 'delete', ['host1', 'host2'])
+    journal.add('group2', 'create', ['host3'])
+    journal.mark_done(first, 'host1')
+    journal.close()
+
+    reopened = RollbackJournal(path)
+    assert [(e.group_id, e.hosts) for e in reopened.pending()] == [
+        ('group1', ['host2']), ('group2', ['host3'])]
+    assert reopened.add('group3', 'delete', ['host1']) > first
+
+
+def test_corrupt_and_torn_records_are_skipped(tmp_path):
+    path = tmp_path / 'rollback.journal'
+    journal = RollbackJournal(path)
+    journal.add('group1', 'delete', ['host1'])
+    journal.add('group2', 'delete', ['host2'])
+    journal.close()
+
+    lines = path.read_text().splitlines(keepends=True)
+    lines[0] = lines[0].replace('group1', 'groupX')
+    path.write_text(''.join(lines) + '0000 {"type": "pend')
+
+    reopened = RollbackJournal(path)
+    assert [e.group_id for e in reopened.pending()] == ['group2']
+    assert path.read_text().endswith('\n')
+
+
+def test_compaction_keeps_only_outstanding_entries(tmp_path):
+    path = tmp_path / 'rollback.journal'
+    journal = RollbackJournal(path, compact_threshold=1000)
+    for i in range(20):
+        entry_id = journal.add(f'group{i}', 'delete', ['host1'])
+        if i % 2:
+            journal.mark_done(entry_id, 'host1')
+    journal.compact()
+    journal.add('group20', 'delete', ['host1'])
+    journal.close()
+
+    assert len(path.read_text().splitlines()) == 2
+    reopened = RollbackJournal(path)
+    assert [e.group_id for e in reopened.pending()] == [
+        f'group{i}' for i in range(0, 20, 2)] + ['group20']
+
+
+def test_writes_continue_while_compaction_syncs_its_checkpoint(tmp_path):
+    path = tmp_path / 'rollback.journal'
+    journal = RollbackJournal(path)
+    first = journal.add('group1', 'delete', ['host1', 'host2'])
+    journal.add('group2', 'delete', ['host1'])
+    real_fsync = os.fsync
+    calls = []
+
+    def fsync(fd):
+        # The checkpoint's fsync: other writers must not be blocked by it.
+        if not calls:
+            calls.append(fd)
+            writer = threading.Thread(target=lambda: (journal.mark_done(first, 'host1'),
+                                                      journal.add('group3', 'create', ['host2'])))
+            writer.start()
+            writer.join(timeout=5)
+            assert not writer.is_alive()
+        real_fsync(fd)
+
+    with patch('app.rollback_journal.os.fsync', fsync):
+        journal.compact()
+    journal.close()
+
+    reopened = RollbackJournal(path)
+    assert [(e.group_id, e.hosts) for e in reopened.pending()] == [
+        ('group1', ['host2']), ('group2', ['host1']), ('group3', ['host2'])]
+    assert len(path.read_text().splitlines()) == 3
+
+
+def test_compaction_runs_in_background_after_threshold(tmp_path):
+    journal = RollbackJournal(tmp_path / 'rollback.journal', compact_threshold=2)
+    with patch.object(journal, 'compact') as mock_compact:
+        entry_id = journal.add('group1', 'delete', ['host1', 'host2'])
+        journal.mark_done(entry_id, 'host1')
+        journal.mark_done(entry_id, 'host2')
+        for thread in threading.enumerate():
+            if thread is not threading.current_thread() and thread.daemon:
+                thread.join(timeout=1)
+        mock_compact.assert_called_once()
+
+
+def test_concurrent_adds_share_fsyncs(tmp_path):
+    journal = RollbackJournal(tmp_path / 'rollback.journal')
+    real_fsync = os.fsync
+    with patch('os.fsync', side_effect=real_fsync) as mock_fsync:
+        threads = [threading.Thread(target=journal.add, args=(f'group{i}', 'delete', ['host1']))
+                   for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert len(journal.pending()) == 20
+    assert 1 <= mock_fsync.call_count <= 20
+
+
+def test_import_legacy_file(tmp_path):
+    legacy = tmp_path / 'rollback.txt'
+    legacy.write_text('delete\ngroup1\nhost1\nhost2\n')
+    journal = RollbackJournal(tmp_path / 'rollback.journal')
+    assert journal.import_legacy_file(legacy) == True
+    assert not legacy.exists()
+    assert [(e.group_id, e.operation, e.hosts) for e in journal.pending()] == [
+        ('group1', 'delete', ['host1', 'host2'])]
@@ -0,0 +1,137 @@
+import threading
+import httpx
+import pytest
+from unittest.mock import Mock, patch
+
+from app.cluster_client import ClusterClient
+from app.service import ClusterService, ServiceBusy, create_server, parse_listen_address
+
+
+@pytest.fixture
+def client():
+    client = Mock()
+    client.wait_for_rollbacks.return_value = True
+    return client
+
+
+@pytest.fixture
+def service_url(client):
+    service = ClusterService(client, max_concurrency=2, max_queue=2)
+    server = create_server(service, listen='127.0.0.1:0')
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def test_parse_listen_address():
+    assert parse_listen_address('127.0.0.1:9000') == ('127.0.0.1', 9000)
+    assert parse_listen_address(':9000') == ('0.0.0.0', 9000)
+
+
+def test_healthz(service_url):
+    response = httpx.get(f"{service_url}/healthz")
+    assert response.status_code == 200
+
+
+def test_create_group(service_url, client):
+    client.create_group.return_value = True
+    response = httpx.post(f"{service_url}/v1/groups/test_group")
+    assert response.status_code == 200
+    assert response.json() == {'group_name': 'test_group',
+                               'operation': 'create', 'success': True}
+    client.start_rollback_drain.assert_called_once_with()
+    client.wait_for_rollbacks.assert_called_once_with('test_group')
+    client.create_group.assert_called_once_with('test_group')
+
+
+def test_delete_group_failure(service_url, client):
+    client.delete_group.return_value = False
+    response = httpx.delete(f"{service_url}/v1/groups/test_group")
+    assert response.status_code == 502
+    assert response.json()['success'] is False
+
+
+def test_create_group_refused_when_rollbacks_fail(service_url, client):
+    client.wait_for_rollbacks.return_value = False
+    response = httpx.post(f"{service_url}/v1/groups/test_group")
+    assert response.status_code == 502
+    client.create_group.assert_not_called()
+
+
+def test_create_group_retries_a_failed_rollback_first(tmp_path):
+    client = ClusterClient(['host1'], rollback_file=tmp_path / 'rollback.journal')
+    client.journal.add('test_group', 'delete', ['host1'])
+    service = ClusterService(client)
+    with patch.object(client, '_make_delete_request', return_value=True) as mock_delete, \
+            patch.object(client, '_make_post_request', return_value=True):
+        assert service.create_group('test_group')['success'] is True
+    mock_delete.assert_called_once()
+    assert not client.has_pending_rollbacks()
+    service.close()
+
+
+def test_get_group_status(service_url, client):
+    client.get_group_status.return_value = {'host1': True, 'host2': False}
+    response = httpx.get(f"{service_url}/v1/groups/test_group")
+    assert response.status_code == 200
+    assert response.json()['status'] == {'host1': True, 'host2': False}
+
+
+def test_continue_rollbacks(service_url, client):
+    client.continue_rollbacks.return_value = True
+    response = httpx.post(f"{service_url}/v1/rollbacks")
+    assert response.status_code == 200
+
+
+def test_unknown_path(service_url):
+    assert httpx.get(f"{service_url}/v1/other/test_group").status_code == 404
+    assert httpx.get(f"{service_url}/v1/groups/").status_code == 404
+
+
+def test_submit_rejects_when_queue_is_full(client):
+    service = ClusterService(client, max_concurrency=1, max_queue=0)
+    release = threading.Event()
+    started = threading.Event()
+
+    def slow_operation():
+        started.set()
+        release.wait(5)
+        return True
+
+    worker = threading.Thread(target=service.submit, args=(slow_operation,))
+    worker.start()
+    started.wait(5)
+    with pytest.raises(ServiceBusy):
+        service.submit(lambda: True)
+    release.set()
+    worker.join()
+    assert service.submit(lambda: True) is True
+    service.close()
+
+
+def test_unix_socket(client, tmp_path):
+    socket_path = str(tmp_path / 'service.sock')
+    client.get_group_status.return_value = {'host1': True}
+    service = ClusterService(client)
+    server = create_server(service, unix_socket=socket_path)
+    thread = threading.Thread(target=server.serve_forever, args=(0.01,), daemon=True)
+    thread.start()
+    try:
+        with httpx.Client(transport=httpx.HTTPTransport(uds=socket_path)) as http:
+            response = http.get('http://service/v1/groups/test_group')
+        assert response.json()['status'] == {'host1': True}
+    finally:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+
+def test_metrics_endpoint(service_url, client):
+    client.metrics.render.return_value = "cluster_client_in_flight_requests 0\n"
+    response = httpx.get(f"{service_url}/metrics")
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    assert response.text == "cluster_client_in_flight_requests 0\n"
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+from app.async_cluster_client import AsyncClusterClient
+from app.cluster_client import ClusterClient
+from app.simulation import SimulatedCluster, VirtualClock
+
+HOSTS = ['host1', 'host2', 'host3']
+
+
+def run_operations(tmp_path, **options):
+    simulation = SimulatedCluster(**options)
+    with ClusterClient(HOSTS, simulation=simulation, retry_timeout=0.5,
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        results = [client.create_group(f"group{index}") for index in range(20)]
+        statuses = [client.get_group_status(f"group{index}") for index in range(20)]
+    return results, statuses, simulation.clock(), simulation.request_counts()
+
+
+def test_simulate_flag_uses_simulated_cluster(tmp_path):
+    client = ClusterClient(HOSTS, simulate=True, rollback_file=tmp_path / 'rollback.journal')
+    assert isinstance(client.simulation, SimulatedCluster)
+    assert client.pool is client.simulation
+    client.close()
+
+
+def test_same_seed_gives_same_run(tmp_path):
+    first = run_operations(tmp_path, seed=7, failure_rate=0.2, timeout_rate=0.05)
+    second = run_operations(tmp_path, seed=7, failure_rate=0.2, timeout_rate=0.05)
+    assert first == second
+    other = run_operations(tmp_path, seed=8, failure_rate=0.2, timeout_rate=0.05)
+    assert other[2] != first[2]
+
+
+def test_node_state_is_kept_per_host(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0')
+    with ClusterClient(HOSTS, simulation=simulation, rollback_file=tmp_path / 'rollback.journal') as client:
+        assert client.create_group('group1') == True
+        assert client.get_group_status('group1') == {host: True for host in HOSTS}
+        assert client.delete_group('group1') == True
+        assert client.get_group_status('group1') == {host: False for host in HOSTS}
+    assert simulation.request_counts() == {'POST': 3, 'GET': 6, 'DELETE': 3}
+
+
+def test_latency_advances_virtual_clock_without_sleeping(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0.5')
+    start = time.monotonic()
+    with ClusterClient(HOSTS, simulation=simulation, rollback_file=tmp_path / 'rollback.journal') as client:
+        assert client.create_group('group1') == True
+    assert simulation.clock() == pytest.approx(1.5)
+    assert time.monotonic() - start < 1
+
+
+def test_timeouts_cost_the_request_timeout(tmp_path):
+    simulation = SimulatedCluster(timeout_rate=1.0)
+    with ClusterClient(['host1'], simulation=simulation, max_retries=1,
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        assert client.create_group('group1') == False
+    assert simulation.clock() == pytest.approx(client.request_timeout)
+
+
+def test_host_models_override_the_default(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0', host_models={'host2': {'failure_rate': 1.0}})
+    with ClusterClient(HOSTS, simulation=simulation, retry_timeout=0,
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        assert client.create_group('group1') == False
+    assert simulation.groups['host1'] == set()
+    assert simulation.groups['host2'] == set()
+
+
+def test_async_fan_out_overlaps_on_virtual_loop(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0.5')
+
+    async def create():
+        async with AsyncClusterClient(HOSTS, simulation=simulation,
+                                      rollback_file=tmp_path / 'rollback.journal') as client:
+            return await client.create_group('group1')
+
+    assert simulation.run(create()) == True
+    assert simulation.clock() == pytest.approx(0.5)
+
+
+def test_virtual_clock_sleeps_add_up_outside_virtual_loop():
+    clock = VirtualClock()
+
+    async def sleep_twice():
+        await asyncio.gather(clock.async_sleep(1), clock.async_sleep(1))
+
+    asyncio.run(sleep_twice())
+    assert clock() == 2
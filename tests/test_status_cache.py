@@ -0,0 +1,54 @@
+from app.status_cache import StatusCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_get_returns_fresh_entry():
+    cache = StatusCache(ttl=5, clock=FakeClock())
+    cache.put('host1', 'group1', True)
+    entry, fresh = cache.get('host1', 'group1')
+    assert entry.exists is True and fresh
+
+
+def test_stale_entry_without_etag_is_dropped():
+    clock = FakeClock()
+    cache = StatusCache(ttl=5, clock=clock)
+    cache.put('host1', 'group1', True)
+    clock.now = 5
+    assert cache.get('host1', 'group1') == (None, False)
+    assert len(cache) == 0
+
+
+def test_stale_entry_with_etag_is_kept_for_revalidation():
+    clock = FakeClock()
+    cache = StatusCache(ttl=5, clock=clock)
+    cache.put('host1', 'group1', False, etag='"v1"')
+    clock.now = 10
+    entry, fresh = cache.get('host1', 'group1')
+    assert entry.etag == '"v1"' and not fresh
+    assert cache.refresh('host1', 'group1') is False
+    assert cache.get('host1', 'group1')[1] is True
+
+
+def test_lru_eviction():
+    cache = StatusCache(max_entries=2, clock=FakeClock())
+    cache.put('host1', 'group1', True)
+    cache.put('host1', 'group2', True)
+    cache.get('host1', 'group1')
+    cache.put('host1', 'group3', True)
+    assert cache.get('host1', 'group2') == (None, False)
+    assert cache.get('host1', 'group1')[0] is not None
+    assert len(cache) == 2
+
+
+def test_invalidate():
+    cache = StatusCache(clock=FakeClock())
+    cache.put('host1', 'group1', True)
+    cache.invalidate('host1', 'group1')
+    assert cache.get('host1', 'group1') == (None, False)
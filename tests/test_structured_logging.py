@@ -0,0 +1,81 @@
+import io
+import json
+import logging
+import queue
+
+import pytest
+
+from app.structured_logging import (DeferredQueueHandler, JsonFormatter, RateLimitFilter,
+                                    configure_logging)
+
+
+@pytest.fixture
+def root_logger():
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield root
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def make_record(msg, *args, level=logging.INFO, **extra):
+    record = logging.LogRecord('app.cluster_client', level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_json_formatter_includes_extra_fields():
+    record = make_record("%s attempt %d failed for host %s. Retrying...", 'Create', 1, 'host1',
+                         host='host1', attempt=1)
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry['message'] == "Create attempt 1 failed for host host1. Retrying..."
+    assert entry['level'] == 'INFO' and entry['logger'] == 'app.cluster_client'
+    assert entry['host'] == 'host1' and entry['attempt'] == 1
+
+
+def test_rate_limit_counts_suppressed_records(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('app.structured_logging.time.monotonic', lambda: now[0])
+    limit = RateLimitFilter(burst=2, interval=1.0)
+    template = "%s attempt %d failed for host %s. Retrying..."
+    allowed = [limit.filter(make_record(template, 'Get', 1, f'host{number}')) for number in range(5)]
+    assert allowed == [True, True, False, False, False]
+    assert limit.filter(make_record("Other message"))
+    assert limit.filter(make_record(template, 'Get', 1, 'host1', level=logging.ERROR))
+    now[0] += 1.0
+    record = make_record(template, 'Get', 1, 'host1')
+    assert limit.filter(record) and record.suppressed == 3
+
+
+def test_queue_handler_defers_formatting_and_never_blocks():
+    handler = DeferredQueueHandler(queue.Queue(1))
+    formatted = []
+
+    class Lazy:
+        def __str__(self):
+            formatted.append(1)
+            return 'lazy'
+
+    handler.handle(make_record("value %s", Lazy()))
+    handler.handle(make_record("value %s", Lazy()))
+    assert formatted == []
+    assert handler.dropped == 1
+    assert handler.queue.get_nowait().getMessage() == 'value lazy'
+
+
+def test_configure_logging_writes_json_from_a_background_thread(root_logger):
+    stream = io.StringIO()
+    pipeline = configure_logging(log_format='json', stream=stream, rate_limit_burst=2)
+    logger = logging.getLogger('app.cluster_client')
+    for attempt in range(5):
+        logger.info("%s attempt %d failed for host %s. Retrying...", 'Create', attempt, 'host1',
+                    extra={'host': 'host1', 'attempt': attempt})
+    logger.debug("not written")
+    pipeline.stop()
+    entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [entry['attempt'] for entry in entries] == [0, 1]
+    assert all(entry['host'] == 'host1' for entry in entries)
+    assert pipeline.handler not in root_logger.handlers
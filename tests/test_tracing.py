@@ -0,0 +1,128 @@
+import json
+import time
+
+import pytest
+
+from app.async_cluster_client import AsyncClusterClient
+from app.cluster_client import ClusterClient
+from app.profiling import SamplingProfiler, profiled
+from app.simulation import SimulatedCluster
+from app.tracing import ChromeTraceExporter, NullTracer, Tracer, span_exporter
+
+HOSTS = ['host1', 'host2', 'host3']
+
+
+class ListExporter:
+    def __init__(self):
+        self.spans = []
+
+    def export(self, span):
+        self.spans.append(span)
+
+    def close(self):
+        pass
+
+
+def names(spans):
+    return [span.name for span in spans]
+
+
+def test_spans_nest_and_record_outcomes():
+    tracer = Tracer(ListExporter())
+    with tracer.span('create', group='group1') as operation:
+        with tracer.span('request', host='host1'):
+            with tracer.span('attempt') as attempt:
+                attempt.fail('HTTP 500')
+        operation.set(success=False)
+    with pytest.raises(ValueError):
+        with tracer.span('status'):
+            raise ValueError()
+    attempt, request, create, status = tracer.exporter.spans
+    assert attempt.parent_id == request.span_id and request.parent_id == create.span_id
+    assert attempt.trace_id == create.trace_id != status.trace_id
+    assert attempt.host == 'host1' and create.host is None
+    assert attempt.to_record()['attributes'] == {'error': 'HTTP 500'}
+    assert create.attributes == {'group': 'group1', 'success': False}
+    assert status.status == 'error' and status.attributes == {'error': 'ValueError'}
+
+
+def test_null_tracer_spans_do_nothing():
+    with NullTracer().span('create', group='group1') as span:
+        span.set(success=True)
+
+
+def test_create_trace_covers_retries_and_rollback(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0.01', host_models={'host3': {'failure_rate': 1.0}})
+    tracer = Tracer(ListExporter(), clock=simulation.clock)
+    with ClusterClient(HOSTS, simulation=simulation, max_retries=2, retry_timeout=0.1, tracer=tracer,
+                       rollback_file=tmp_path / 'rollback.journal') as client:
+        assert client.create_group('group1') is False
+    spans = tracer.exporter.spans
+    create = spans[-1]
+    assert create.name == 'create' and create.attributes['success'] is False
+    assert all(span.trace_id == create.trace_id for span in spans)
+    failed_request = next(span for span in spans if span.name == 'request' and span.host == 'host3')
+    children = [span for span in spans if span.parent_id == failed_request.span_id]
+    assert names(children) == ['limit_wait', 'attempt', 'backoff', 'limit_wait', 'attempt']
+    assert failed_request.status == 'error'
+    rollback = next(span for span in spans if span.name == 'rollback')
+    assert rollback.duration > 0
+    rollback_steps = [span for span in spans if span.parent_id == rollback.span_id]
+    assert names(rollback_steps) == ['journal_add', 'rollback_host', 'rollback_host']
+
+
+@pytest.mark.asyncio
+async def test_async_status_trace(tmp_path):
+    simulation = SimulatedCluster(latency='fixed:0')
+    tracer = Tracer(ListExporter())
+    async with AsyncClusterClient(HOSTS, simulation=simulation, tracer=tracer,
+                                  rollback_file=tmp_path / 'rollback.journal') as client:
+        await client.get_group_status('group1')
+    spans = tracer.exporter.spans
+    status = spans[-1]
+    assert status.name == 'status'
+    requests = [span for span in spans if span.name == 'request']
+    assert sorted(span.host for span in requests) == HOSTS
+    assert all(span.parent_id == status.span_id for span in requests)
+
+
+def test_exporters_write_readable_files(tmp_path):
+    assert isinstance(span_exporter(tmp_path / 'trace.json'), ChromeTraceExporter)
+    for path in (tmp_path / 'trace.json', tmp_path / 'trace.jsonl'):
+        tracer = Tracer(span_exporter(path))
+        with tracer.span('create', group='group1'):
+            with tracer.span('request', host='host1'):
+                pass
+        tracer.close()
+    events = json.loads((tmp_path / 'trace.json').read_text())
+    assert [event['name'] for event in events] == ['thread_name', 'request', 'thread_name', 'create']
+    assert events[1]['ph'] == 'X' and events[1]['tid'] != events[3]['tid']
+    records = [json.loads(line) for line in (tmp_path / 'trace.jsonl').read_text().splitlines()]
+    assert [record['name'] for record in records] == ['request', 'create']
+    assert records[0]['parent_id'] == records[1]['span_id']
+
+
+def test_empty_chrome_trace_is_valid(tmp_path):
+    ChromeTraceExporter(tmp_path / 'trace.json').close()
+    assert json.loads((tmp_path / 'trace.json').read_text()) == []
+
+
+def busy_loop(seconds):
+    finish = time.monotonic() + seconds
+    while time.monotonic() < finish:
+        pass
+
+
+def test_sampling_profiler_finds_the_hot_function(tmp_path):
+    path = tmp_path / 'profile.folded'
+    with profiled(str(path), interval=0.001) as profiler:
+        busy_loop(0.2)
+    assert isinstance(profiler, SamplingProfiler)
+    assert any('busy_loop' in function for function, _ in profiler.top(3))
+    lines = path.read_text().splitlines()
+    assert lines and all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+
+
+def test_profiling_is_off_without_a_file():
+    with profiled(None) as profiler:
+        assert profiler is None